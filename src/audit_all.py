@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pprint
+import sys
+
+from audit_cache import AuditCache
+from audit_engine import run_auditors
+from instrument import Instrumentation
+from sketch import summarize
+import audit_keys_basic as keys_basic
+import audit_keys_namespaces as keys_namespaces
+import audit_values_basic as values_basic
+
+filename = '../data/file.osm'
+
+# Every auditor of the audit_* scripts (with their default parameters)
+#    sketch: the auditors that keep sets of distinct values keep sketches instead (see sketch.py)
+def all_auditors(sketch=False):
+	return [
+		keys_basic.CountElements(),
+		keys_basic.CountTags(),
+		keys_basic.UniqueUsers(sketch),
+		keys_basic.TypeOfKeys(),
+		keys_basic.TypeOfKeysAndTags(),
+		keys_basic.TypeOfKeysAndTagsByElement(),
+		keys_basic.CheckWeirdKeys(),
+		keys_namespaces.GetTagsWithNamespace(),
+		keys_namespaces.GetTagsWithNamespaceAndWithout(),
+		values_basic.GetKeysAddress(),
+		values_basic.GetSetsDependingOnAddressKeys(sketch=sketch),
+		values_basic.AnalyzeNumericFieldsOfAddress(sketch=sketch),
+		values_basic.AnalyzeNumericFieldsOfAddress2(sketch=sketch),
+		values_basic.CheckTextValues(sketch=sketch),
+		values_basic.TypeOfStreetDict(),
+		values_basic.PrintFails()
+	]
+
+# Run the whole audit with one single parse of the osm file
+#    instrument: instrument.Instrumentation to time every auditor and show the progress
+#    sketch: run the auditors in sketch mode (bounded memory, approximate distinct values)
+#    cache: audit_cache.AuditCache with the reports of previous runs (see run_auditors)
+def audit_all(filename, auditors=None, instrument=None, sketch=False, cache=None):
+	if auditors is None:
+		auditors = all_auditors(sketch)
+	return run_auditors(filename, auditors, instrument=instrument, cache=cache)
+
+def main():
+	sketch = '--sketch' in sys.argv[1:]
+	cache = False if '--no-cache' in sys.argv[1:] else AuditCache()
+	instrument = Instrumentation(report_path='../data/audit_report.json')
+	pprint.pprint(summarize(audit_all(filename, instrument=instrument, sketch=sketch, cache=cache)))
+	print >> sys.stderr, instrument.summary()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Persistent cache of the auditor reports, so a repeated audit returns without parsing the file
+#    A report is stored under the content hash of the osm file and a key of the auditor: the cache format,
+#    its class, name, constructor arguments (Auditor.arguments) and the hash of the files it depends on, the
+#    modules defining it and the project modules they import (recursively) with their data files (a json
+#    file of the same name, like street_types.json), so editing any of them recomputes its reports
+#    The content hash (sha1 of the file) is only computed again when the size or mtime of the file change
+#    The auditors not found are run together, with one parse of the file, and their reports stored
+#    The least recently used reports are evicted once the cache is bigger than max_bytes
+
+import cPickle as pickle
+import hashlib
+import inspect
+import os
+import re
+import sys
+import tempfile
+
+import audit_engine
+from audit_engine import check_names, run_auditors
+
+cache_directory = '../data/audit_cache'
+
+# Version of the entries and their keys, part of every key (changing it leaves the stored reports unused)
+CACHE_FORMAT = 2
+
+# Directory of the project modules (the ones an auditor depends on, besides the directories of its own modules)
+project_directory = os.path.dirname(os.path.abspath(__file__))
+
+# Name of the table {absolute path: (size, mtime, content hash)} of the files already hashed
+sources_filename = 'sources.pickle'
+
+entry_name = re.compile(r'^([0-9a-f]{40})-([0-9a-f]{40})\.pickle$')
+
+# Canonical string of an argument (the same for equal dicts and sets whatever their order)
+def canonical(value):
+	if isinstance(value, dict):
+		return '{' + ', '.join(sorted(canonical(k) + ': ' + canonical(v) for k, v in value.iteritems())) + '}'
+	if isinstance(value, (set, frozenset)):
+		return 'set([' + ', '.join(sorted(canonical(v) for v in value)) + '])'
+	if isinstance(value, list):
+		return '[' + ', '.join(canonical(v) for v in value) + ']'
+	if isinstance(value, tuple):
+		return '(' + ', '.join(canonical(v) for v in value) + ')'
+	return repr(value)
+
+# sha1 of the file
+def file_hash(path, chunk_size=1024 * 1024):
+	digest = hashlib.sha1()
+	with open(path, 'rb') as hashed_file:
+		for chunk in iter(lambda: hashed_file.read(chunk_size), ''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+# sha1 of the files, computed again only when their size or mtime change {path: (size, mtime, sha1)}
+source_hashes = {}
+
+def source_hash(path):
+	stat = os.stat(path)
+	source = source_hashes.get(path)
+	if source is None or source[:2] != (stat.st_size, stat.st_mtime):
+		source = source_hashes[path] = (stat.st_size, stat.st_mtime, file_hash(path))
+	return source[2]
+
+# Source file of a module (None for the built-in ones and the ones without source)
+def module_source(module):
+	path = getattr(module, '__file__', None)
+	if path is None:
+		return None
+	path = os.path.splitext(os.path.abspath(path))[0] + '.py'
+	return path if os.path.exists(path) else None
+
+# Modules within the directories a module uses: the ones it imports and the ones defining the names
+# (classes, functions and other objects, like key_cache.key_info) it imports
+def imported_modules(module, directories):
+	found = []
+	for value in vars(module).values():
+		if inspect.ismodule(value):
+			used = value
+		elif inspect.isclass(value) or inspect.isroutine(value):
+			used = sys.modules.get(getattr(value, '__module__', None))
+		else:
+			used = sys.modules.get(type(value).__module__)
+		path = module_source(used)
+		if path is not None and os.path.dirname(path) in directories:
+			found.append(used)
+	return found
+
+# Files the reports of the class depend on: the sources of the modules defining it and its bases, of the project
+# modules they import (recursively) and the data files of those modules (a json file of the same name)
+def dependency_files(cls):
+	modules = [sys.modules.get(base.__module__) for base in inspect.getmro(cls) if base is not object]
+	modules = [module for module in modules if module_source(module) is not None]
+	directories = set([project_directory]) | set(os.path.dirname(module_source(module)) for module in modules)
+	seen = set()
+	paths = []
+	while modules:
+		module = modules.pop()
+		if module.__name__ in seen:
+			continue
+		seen.add(module.__name__)
+		path = module_source(module)
+		paths.append(path)
+		data_path = os.path.splitext(path)[0] + '.json'
+		if os.path.exists(data_path):
+			paths.append(data_path)
+		modules.extend(imported_modules(module, directories))
+	return sorted(paths)
+
+# sha1 of the files the reports of the class depend on
+def class_source_hash(cls):
+	digest = hashlib.sha1()
+	for path in dependency_files(cls):
+		digest.update(os.path.basename(path) + ' ' + source_hash(path) + '\n')
+	return digest.hexdigest()
+
+# Key of an auditor (of its report for a given file)
+def auditor_key(auditor):
+	cls = type(auditor)
+	args, kwargs = getattr(auditor, 'arguments', ((), {}))
+	key = '\n'.join((str(CACHE_FORMAT), cls.__module__, cls.__name__, auditor.name, canonical(args), canonical(kwargs), class_source_hash(cls)))
+	return hashlib.sha1(key).hexdigest()
+
+# Write data to path atomically (through a temporary file in the same directory)
+def write_atomic(path, data):
+	handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
+	try:
+		with os.fdopen(handle, 'wb') as temp_file:
+			temp_file.write(data)
+		os.rename(temp_path, path)
+	except BaseException:
+		os.remove(temp_path)
+		raise
+
+# Cache of the reports in a directory (one pickle file per report)
+#    max_bytes: size the reports can take (the least recently used ones are removed beyond that)
+class AuditCache(object):
+
+	def __init__(self, directory=cache_directory, max_bytes=512 * 1024 * 1024):
+		self.directory = directory
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+	def sources_path(self):
+		return os.path.join(self.directory, sources_filename)
+
+	def read_sources(self):
+		try:
+			with open(self.sources_path(), 'rb') as sources_file:
+				return pickle.load(sources_file)
+		except (IOError, EOFError, pickle.UnpicklingError):
+			return {}
+
+	def write_sources(self, sources):
+		write_atomic(self.sources_path(), pickle.dumps(sources, pickle.HIGHEST_PROTOCOL))
+
+	# Content hash of the osm file (hashing it only if it is new or its size or mtime changed)
+	def content_hash(self, osm_path):
+		path = os.path.abspath(osm_path)
+		stat = os.stat(path)
+		sources = self.read_sources()
+		source = sources.get(path)
+		if source is not None and source[:2] == (stat.st_size, stat.st_mtime):
+			return source[2]
+		content = file_hash(path)
+		sources[path] = (stat.st_size, stat.st_mtime, content)
+		# Forget the files that do not exist anymore
+		for other in [p for p in sources if not os.path.exists(p)]:
+			del sources[other]
+		self.write_sources(sources)
+		return content
+
+	def entry_path(self, content, key):
+		return os.path.join(self.directory, '{}-{}.pickle'.format(content, key))
+
+	# Report stored for the entry (None if it is not stored or can not be read)
+	#    A hit updates the mtime of the entry, the order of the eviction
+	def load(self, path):
+		try:
+			with open(path, 'rb') as entry_file:
+				report = pickle.load(entry_file)
+		except (IOError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+			return None
+		os.utime(path, None)
+		return report
+
+	def store(self, path, report):
+		write_atomic(path, pickle.dumps({'report': report}, pickle.HIGHEST_PROTOCOL))
+
+	# Same as audit_engine.run_auditors, reading the reports from the cache and running only the missing auditors
+	def run(self, filename, auditors, backend=None, instrument=None):
+		check_names(auditors)
+		content = self.content_hash(filename)
+		paths = dict((auditor.name, self.entry_path(content, auditor_key(auditor))) for auditor in auditors)
+
+		results = {}
+		missing = []
+		for auditor in auditors:
+			entry = self.load(paths[auditor.name])
+			if entry is None:
+				missing.append(auditor)
+			else:
+				results[auditor.name] = entry['report']
+		self.hits += len(auditors) - len(missing)
+		self.misses += len(missing)
+		if instrument is not None:
+			instrument.count('cache_hits', len(auditors) - len(missing))
+			instrument.count('cache_misses', len(missing))
+
+		if missing:
+			computed = run_auditors(filename, missing, backend, instrument, cache=False)
+			for name, report in computed.iteritems():
+				self.store(paths[name], report)
+			results.update(computed)
+			self.evict()
+		return results
+
+	# (mtime, size, path) of the stored reports
+	def entries(self):
+		found = []
+		for name in os.listdir(self.directory):
+			if entry_name.match(name):
+				path = os.path.join(self.directory, name)
+				try:
+					stat = os.stat(path)
+				except OSError:
+					continue
+				found.append((stat.st_mtime, stat.st_size, path))
+		return found
+
+	# Remove the least recently used reports until the cache fits within max_bytes
+	def evict(self):
+		entries = sorted(self.entries())
+		total = sum(size for _, size, _ in entries)
+		for _, size, path in entries:
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+			total -= size
+
+	# Remove the stored reports: every one, the ones of an osm file (as it is now and as it was
+	# hashed) or, given auditors as well, only the ones of those auditors
+	def invalidate(self, osm_path=None, auditors=None):
+		contents = None
+		if osm_path is not None:
+			path = os.path.abspath(osm_path)
+			sources = self.read_sources()
+			contents = set()
+			if path in sources:
+				contents.add(sources.pop(path)[2])
+				self.write_sources(sources)
+			if os.path.exists(path):
+				contents.add(file_hash(path))
+		keys = None if auditors is None else set(auditor_key(auditor) for auditor in auditors)
+		for _, _, path in self.entries():
+			content, key = entry_name.match(os.path.basename(path)).groups()
+			if (contents is None or content in contents) and (keys is None or key in keys):
+				os.remove(path)
+		if osm_path is None and auditors is None and os.path.exists(self.sources_path()):
+			os.remove(self.sources_path())
+
+# Make run_auditors use a cache when it is not given one (every audit function then goes through it)
+def enable(directory=cache_directory, max_bytes=512 * 1024 * 1024):
+	audit_engine.default_cache = AuditCache(directory, max_bytes)
+	return audit_engine.default_cache
+
+def disable():
+	audit_engine.default_cache = None
+
+if __name__ == '__main__':
+	cache = AuditCache()
+	if sys.argv[1:2] == ['invalidate']:
+		cache.invalidate(sys.argv[2] if len(sys.argv) > 2 else None)
+	entries = cache.entries()
+	print '{} reports, {:.1f} MB in {}'.format(len(entries), sum(size for _, size, _ in entries) / 1024.0 / 1024.0, cache.directory)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from osm_input import open_osm
+from osm_reader import read_elements
+
+# Base class of the auditor plugins run by the audit engine
+#    name: key of the auditor report within the results of run_auditors
+#    tags: types of the top-level XML elements (node, way, relation...) the auditor wants to receive
+#          (None for all of them, followed by a record of the root element once the file has been parsed)
+#    arguments: (args, kwargs) the auditor was created with (part of its key in audit_cache)
+class Auditor(object):
+	name = None
+	tags = ('node', 'way')
+
+	def __new__(cls, *args, **kwargs):
+		auditor = super(Auditor, cls).__new__(cls)
+		auditor.arguments = (args, kwargs)
+		return auditor
+
+	# Called once for every finished top-level element of the osm file whose type is in self.tags,
+	# given as a record (osm_reader.OSMElement)
+	def process(self, elem):
+		pass
+
+	# Called once the whole file has been parsed, returns the results of the auditor
+	def report(self):
+		return None
+
+# Cache of the reports used by run_auditors when it is not given one (see audit_cache.enable)
+default_cache = None
+
+def check_names(auditors):
+	names = set()
+	for auditor in auditors:
+		if auditor.name in names:
+			raise ValueError('Duplicated auditor name: {}'.format(auditor.name))
+		names.add(auditor.name)
+
+# Parse the osm file only once (with bounded memory), sending each element to the auditors registered for its type
+#    backend: parser backend of osm_reader.read_elements (its default one if None)
+#    instrument: instrument.Instrumentation to time the parsing and every auditor and show the progress
+#    cache: audit_cache.AuditCache the reports are read from (and stored to); default_cache if None, no cache if False
+#           (the auditors found in the cache are not run, so only their reports are meaningful)
+#    returns a dict {auditor.name: auditor.report()}
+def run_auditors(filename, auditors, backend=None, instrument=None, cache=None):
+	if cache is None:
+		cache = default_cache
+	if cache:
+		return cache.run(filename, auditors, backend, instrument)
+
+	dispatch = {}
+	catch_all = []
+	check_names(auditors)
+
+	for auditor in auditors:
+		if auditor.tags is None:
+			catch_all.append(auditor)
+		else:
+			for tag in auditor.tags:
+				dispatch.setdefault(tag, []).append(auditor)
+
+	wanted = None if catch_all else tuple(dispatch)
+	with open_osm(filename) as osm_file:
+		elements = read_elements(osm_file, types=wanted, backend=backend)
+		if instrument is not None:
+			elements = instrument.track(elements, osm_file)
+			for auditor in auditors:
+				instrument.patch(auditor, 'process', auditor.name)
+		try:
+			for elem in elements:
+				for auditor in dispatch.get(elem.type, ()):
+					auditor.process(elem)
+				for auditor in catch_all:
+					auditor.process(elem)
+		finally:
+			if instrument is not None:
+				instrument.finish()
+
+	return {auditor.name: auditor.report() for auditor in auditors}
@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import xml.etree.cElementTree as ET
+import itertools
 import pprint
 import sys
-import re
-import json
+from audit_engine import Auditor, run_auditors
+from jsonl_writer import JSONLinesWriter
+from key_cache import key_info
+from osm_input import open_osm
+from sketch import summarize, value_set
+from tag_index import open_tag_index
 
 filename = '../data/file.osm'
 
@@ -14,159 +18,193 @@ def printhead(filename, num_of_lines):
 
 	print '\n *** Head of the OSM document (first {} lines) ***\n'.format(num_of_lines)
 
-	i = 0
-	head = ''
-	with open(filename) as r:
-		for line in r:
-			if i < num_of_lines:
-				head += line
-				i += 1
-			else:
-				break
+	with open_osm(filename) as r:
+		head = ''.join(itertools.islice(r, num_of_lines))
 	print(head)
 
 # Count the number of different elements existing in the XML file
-def count_elements(filename):
-	tag_dict = {}
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in tag_dict:
-			tag_dict[elem.tag] += 1
-		else:
-			tag_dict[elem.tag] = 1
+class CountElements(Auditor):
+	name = 'count_elements'
+	tags = None
+
+	def __init__(self):
+		self.tag_dict = {}
+
+	def process(self, elem):
+		sum_to_dict(self.tag_dict, elem.type)
+		for tag, children in (('tag', elem.tags), ('nd', elem.refs), ('member', elem.members)):
+			if children:
+				self.tag_dict[tag] = self.tag_dict.get(tag, 0) + len(children)
+
+	def report(self):
+		return self.tag_dict
 
+def count_elements(filename):
+	tag_dict = run_auditors(filename, [CountElements()])['count_elements']
 	pprint.pprint(tag_dict)
 
-# Count the number of different tags within the nodes or ways elements
-def count_tags(filename):
-	tag_dict = {}
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				if tag.attrib['k'] in tag_dict:
-					tag_dict[tag.attrib['k']] += 1
-				else:
-					tag_dict[tag.attrib['k']] = 1
+# Count the number of different tags within the nodes, ways and relations elements
+class CountTags(Auditor):
+	name = 'count_tags'
+	tags = ('node', 'way', 'relation')
+
+	def __init__(self):
+		self.tag_dict = {}
+
+	def process(self, elem):
+		for k, v in elem.tags:
+			sum_to_dict(self.tag_dict, k)
 
+	def report(self):
+		return self.tag_dict
+
+def count_tags(filename):
+	tag_dict = run_auditors(filename, [CountTags()])['count_tags']
 	pprint.pprint(tag_dict)
 
 # Print out the users that have eddited the file
-def unique_users(filename):
-	users = set()
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way', 'relation']:
-			users.add(elem.attrib['user'])
-	pprint.pprint(users)
+#    sketch: keep a sketch.ValueSketch of the users (bounded memory, approximate) instead of their set
+class UniqueUsers(Auditor):
+	name = 'unique_users'
+	tags = ('node', 'way', 'relation')
+
+	def __init__(self, sketch=False):
+		self.users = value_set(sketch)
+
+	# The elements without a user (the extracts without user data) are not counted
+	def process(self, elem):
+		user = elem.attrs.get('user')
+		if user is not None:
+			self.users.add(user)
+
+	def report(self):
+		return self.users
+
+def unique_users(filename, sketch=False):
+	users = run_auditors(filename, [UniqueUsers(sketch)])['unique_users']
+	pprint.pprint(summarize(users))
 
 # Count the type of keys inside tag elements regarding its "structure" (regx pattern)
+class TypeOfKeys(Auditor):
+	name = 'type_of_keys'
+	tags = None
+
+	def __init__(self):
+		self.keys = {'lower': 0, 'lower_colon': 0, 'problemchars': 0, 'other': 0}
+		self.other = {}
+
+	def process(self, elem):
+		for k, v in elem.tags:
+			key_type = key_info(k).kind
+			if key_type == 'lower_colon2':
+				key_type = 'other'
+			self.keys[key_type] += 1
+			if key_type == 'other':
+				sum_to_dict(self.other, k)
+
+	def report(self):
+		return self.keys
+
 def type_of_keys(filename):
-	lower = re.compile(r'^([a-z]|_)*$')
-	lower_colon = re.compile(r'^([a-z]|_)*:([a-z]|_)*$')
-	problemchars = re.compile(r'[=\+/&<>;\'"\?%#$@\,\. \t\r\n]')
-
-	keys = {'lower': 0, 'lower_colon': 0, 'problemchars': 0, 'other': 0}
-	other = {}
-
-	for event, elem in ET.iterparse(filename):
-		if elem.tag == 'tag':
-			k = elem.attrib['k']
-			if lower.search(k):
-				keys['lower'] += 1
-			elif lower_colon.search(k):
-				keys['lower_colon'] += 1
-			elif problemchars.search(k):
-				keys['problemchars'] += 1
-			else:
-				if k in other:
-					other[k] += 1
-				else:
-					other[k] = 1
-				keys['other'] += 1
+	keys = run_auditors(filename, [TypeOfKeys()])['type_of_keys']
 	pprint.pprint(keys)
 
 # Count the type of keys inside tag elements regarding its "structure" (regx pattern)
 # Also count the type of keys inside those patterns
-def type_of_keys_and_tags(filename):
+class TypeOfKeysAndTags(Auditor):
+	name = 'type_of_keys_and_tags'
+	tags = None
 
-	lower = re.compile(r'^([a-z]|_)*$')
-	lower_colon = re.compile(r'^([a-z]|_)*:([a-z]|_)*$')
-	problemchars = re.compile(r'[=\+/&<>;\'"\?%#$@\,\. \t\r\n]')
-
-	keys_num = {'lower': 0, 'lower_colon': 0, 'problemchars': 0, 'other': 0}
-	keys = {'lower': {}, 'lower_colon': {}, 'problemchars': {}, 'other': {}}
-	for event, elem in ET.iterparse(filename):
-		if elem.tag == 'tag':
-			k = elem.attrib['k']
-			if lower.search(k):
-				keys_num['lower'] += 1
-				sum_to_dict(keys['lower'], k)
-			elif lower_colon.search(k):
-				keys_num['lower_colon'] += 1
-				sum_to_dict(keys['lower_colon'], k)
-			elif problemchars.search(k):
-				keys_num['problemchars'] += 1
-				sum_to_dict(keys['problemchars'], k)
-			else:
-				keys_num['other'] += 1
-				sum_to_dict(keys['other'], k)
+	def __init__(self):
+		self.keys_num = {'lower': 0, 'lower_colon': 0, 'problemchars': 0, 'other': 0}
+		self.keys = {'lower': {}, 'lower_colon': {}, 'problemchars': {}, 'other': {}}
+
+	def process(self, elem):
+		for k, v in elem.tags:
+			key_type = key_info(k).kind
+			if key_type == 'lower_colon2':
+				key_type = 'other'
+			self.keys_num[key_type] += 1
+			sum_to_dict(self.keys[key_type], k)
+
+	def report(self):
+		return {'keys_num': self.keys_num, 'keys': self.keys}
+
+def type_of_keys_and_tags(filename):
+	result = run_auditors(filename, [TypeOfKeysAndTags()])['type_of_keys_and_tags']
 	print 'Patterns on tags:\n'
-	pprint.pprint(keys_num)
+	pprint.pprint(result['keys_num'])
 	print '\n\nKinds of tags'
-	pprint.pprint(keys)
+	pprint.pprint(result['keys'])
 
 # Count the type of keys inside tag elements regarding its "structure" (regx pattern)
 # Also count the type of keys inside those patterns
 # Also classify (nest) depending on the type of "root" element (node or way)
-def type_of_keys_and_tags_by_element(filename, elements=['node', 'way']):
+class TypeOfKeysAndTagsByElement(Auditor):
+	name = 'type_of_keys_and_tags_by_element'
+
+	def __init__(self, elements=['node', 'way']):
+		self.tags = tuple(elements)
+
+		self.elements_dict = {k: {'lower': {}, 'lower_colon': {}, 'lower_colon2': {}, 'problemchars': {}, 'other': {}} for k in elements}
+		self.elements_dict_num = {k: {'lower': 0, 'lower_colon': 0, 'lower_colon2': 0, 'problemchars': 0, 'other': 0} for k in elements}
 
-	lower = re.compile(r'^([a-z]|_)*$')
-	lower_colon = re.compile(r'^([a-z]|_)*:([a-z]|_)*$')
-	lower_colon2 = re.compile(r'^([a-z]|_)*:([a-z]|_)*:([a-z]|_)*$')
-	problemchars = re.compile(r'[=\+/&<>;\'"\?%#$@\,\. \t\r\n]')
-
-	elements_dict = {k: {'lower': {}, 'lower_colon': {}, 'lower_colon2': {}, 'problemchars': {}, 'other': {}} for k in elements}
-	elements_dict_num = {k: {'lower': 0, 'lower_colon': 0, 'lower_colon2': 0, 'problemchars': 0, 'other': 0} for k in elements}
-
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in elements:
-			for tag_elem in elem.findall('tag'):
-				k = tag_elem.attrib['k']
-				if lower.search(k):
-					elements_dict_num[elem.tag]['lower'] += 1
-					sum_to_dict(elements_dict[elem.tag]['lower'], k)
-				elif lower_colon.search(k):
-					elements_dict_num[elem.tag]['lower_colon'] += 1
-					sum_to_dict(elements_dict[elem.tag]['lower_colon'], k)
-				elif lower_colon2.search(k):
-					elements_dict_num[elem.tag]['lower_colon2'] += 1
-					sum_to_dict(elements_dict[elem.tag]['lower_colon2'], k)
-				elif problemchars.search(k):
-					elements_dict_num[elem.tag]['problemchars'] += 1
-					sum_to_dict(elements_dict[elem.tag]['problemchars'], k)
-				else:
-					elements_dict_num[elem.tag]['other'] += 1
-					sum_to_dict(elements_dict[elem.tag]['other'], k)
+	def process(self, elem):
+		for k, v in elem.tags:
+			key_type = key_info(k).kind
+			self.elements_dict_num[elem.type][key_type] += 1
+			sum_to_dict(self.elements_dict[elem.type][key_type], k)
+
+	def report(self):
+		return {'keys_num': self.elements_dict_num, 'keys': self.elements_dict}
+
+def type_of_keys_and_tags_by_element(filename, elements=['node', 'way']):
+	result = run_auditors(filename, [TypeOfKeysAndTagsByElement(elements)])['type_of_keys_and_tags_by_element']
 
 	print 'Patterns on tags:\n'
-	pprint.pprint(elements_dict_num)
+	pprint.pprint(result['keys_num'])
 
 	print '\n\nKinds of tags'
-	pprint.pprint(elements_dict)
+	pprint.pprint(result['keys'])
+
+	#save_json(result['keys_num'], 'keys_num')
+	#save_json(result['keys'], 'keys')
 
-	#save_json(elements_dict_num, 'keys_num')
-	#save_json(elements_dict, 'keys')
+# Keys we want to ckeck for each Element (node or ways)
+weirdkeys = {'node': ['CODIGO', 'FIXME', 'naptan:CommonName', 'naptan:Indicator', 'naptan:Street', 'ref:RRG'],
+			 'way': ['FIXME', 'N', u'Torre\xf3n del castillo de los Salazar', 'fuel:']}
 
 # Once we have the keys we want to ckeck for each Element (node or ways) we print it out to see if there's any problem
+#    report: list of (element as XML string, key, value) for every weird key found
+class CheckWeirdKeys(Auditor):
+	name = 'check_weird_keys'
+	tags = tuple(weirdkeys.keys())
+
+	def __init__(self):
+		self.found = []
+
+	def process(self, elem):
+		for k, v in elem.tags:
+			if k in weirdkeys[elem.type]:
+				self.found.append((elem.to_xml(), k, v))
+
+	def report(self):
+		return self.found
+
+# Elements are looked up in the tag index of the file and read with a seek (no full rescan)
 def check_weird_keys(filename):
-	weirdkeys = {'node': ['CODIGO', 'FIXME', 'naptan:CommonName', 'naptan:Indicator', 'naptan:Street', 'ref:RRG'],
-				 'way': ['FIXME', 'N', u'Torre\xf3n del castillo de los Salazar', 'fuel:']}
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in weirdkeys.keys():
-			for elem_tag in elem.findall('tag'):
-				k = elem_tag.attrib['k']
-				if k in weirdkeys[elem.tag]:
-					print ET.tostring(elem)
-					print k, elem_tag.attrib['v']
-					print ''
+	index = open_tag_index(filename)
+	found = []
+	for element_type, keys in weirdkeys.iteritems():
+		for k in keys:
+			for element, v in index.items(k, types=(element_type,)):
+				found.append((element, k, v))
+
+	with open_osm(filename) as osm_file:
+		for element, k, v in sorted(found):
+			print index.fetch(element, osm_file).to_xml()
+			print k, v
+			print ''
 
 # If the my_key exists in my_dict, add 1 to the value; create it with value 1 otherwise
 def sum_to_dict(my_dict, my_key):
@@ -177,14 +215,14 @@ def sum_to_dict(my_dict, my_key):
 
 # Save dictionary as JSON on '../data/'
 def save_json(my_dict, json_name):
-	with open('../data/' + json_name + '.json', 'w') as json_file:
-		json.dump(my_dict, json_file)
+	with JSONLinesWriter('../data/' + json_name + '.json') as writer:
+		writer.write(my_dict)
 
 # Save a list of dicionaries on a JSON Lines on '../data/'
 def save_json_list(my_dict_list, json_name):
-	with open('../data/' + json_name + '.jsonl', 'w') as json_file:
+	with JSONLinesWriter('../data/' + json_name + '.jsonl') as writer:
 		for json_doc in my_dict_list:
-			json_file.write(json.dumps(json_doc) + '\n')
+			writer.write(json_doc)
 
 # Call one or more methods above. Note that some of the functions could be used in other scripts
 def main():
@@ -199,4 +237,5 @@ def main():
 	print ''
 
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+	main()
@@ -1,9 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import re
-import xml.etree.cElementTree as ET
 from audit_keys_basic import sum_to_dict
+from audit_engine import Auditor, run_auditors
+from key_cache import key_info
 import pprint
 import sys
 
@@ -11,67 +11,83 @@ import sys
 filename = '../data/file.osm'
 
 # Count tags that have namespaces within its keys
-def get_tags_with_namespace(filename):
+class GetTagsWithNamespace(Auditor):
+	name = 'get_tags_with_namespace'
+	tags = ('node', 'way', 'relation')
+
+	def __init__(self):
+		self.tags_with_namespace = {}
+
+	def process(self, elem):
+		for k, v in elem.tags:
+			if key_has_namespace(k):
+				sum_to_dict(self.tags_with_namespace, k)
+				#sum_to_dict(self.tags_with_namespace, k.split(':')[0])
 
-	tags_with_namespace = {}
+	def report(self):
+		return self.tags_with_namespace
 
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				if key_has_namespace(k):
-					sum_to_dict(tags_with_namespace, k)
-					#sum_to_dict(tags_with_namespace, k.split(':')[0])
+def get_tags_with_namespace(filename):
+	tags_with_namespace = run_auditors(filename, [GetTagsWithNamespace()])['get_tags_with_namespace']
 	pprint.pprint(tags_with_namespace)
 	return tags_with_namespace.keys()
 
 # Get tags that have both namespace and not namespace (within the same element)
+# showelements: keep the elements to print them on screen or not
+# elementtoshow: keep only this element (or None to keep all)
+#    report: {'tags': {tag: count}, 'elements': [(list of tags, element as XML string)]}
+class GetTagsWithNamespaceAndWithout(Auditor):
+	name = 'get_tags_with_namespace_and_without'
+	tags = ('node', 'way', 'relation')
+
+	def __init__(self, showelements=False, elementtoshow=None):
+		self.showelements = showelements
+		self.elementtoshow = elementtoshow
+		self.tags_with_namespace_and_without = {}
+		self.elements = []
+
+	def process(self, elem):
+		with_namespace = set()
+		without_namespace = set()
+		for k, v in elem.tags:
+			info = key_info(k)
+			if info.has_namespace:
+				with_namespace.add(info.path[0])
+			else:
+				without_namespace.add(k)
+		my_list = list(with_namespace.intersection(without_namespace))
+		if len(my_list) != 0 and self.showelements:
+			if self.elementtoshow is None or self.elementtoshow in my_list:
+				self.elements.append((my_list, elem.to_xml()))
+		for i in my_list:
+			sum_to_dict(self.tags_with_namespace_and_without, i)
+
+	def report(self):
+		return {'tags': self.tags_with_namespace_and_without, 'elements': self.elements}
+
 # filename: osm (XML) file to analyze
 # showelements: print elements on screen or not
 # elementtoshow: print only this element on screen (or None to print all)
 def get_tags_with_namespace_and_without(filename, showelements=False, elementtoshow=None):
-	tags_with_namespace_and_without = {}
-
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			with_namespace = set()
-			without_namespace = set()
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				if key_has_namespace(k):
-					with_namespace.add(k.split(':')[0])
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				if key_has_namespace(k):
-					pass
-				else:
-					without_namespace.add(k)
-			my_list = list(with_namespace.intersection(without_namespace))
-			if len(my_list) != 0 and showelements:
-				if elementtoshow is None:
-					print my_list
-					print ET.tostring(elem)
-					print ''
-				elif elementtoshow in my_list:
-					print my_list
-					print ET.tostring(elem)
-					print ''
-			for i in list(with_namespace.intersection(without_namespace)):
-				sum_to_dict(tags_with_namespace_and_without, i)
-
-	#pprint.pprint(tags_with_namespace_and_without)
-	return tags_with_namespace_and_without.keys()
+	auditor = GetTagsWithNamespaceAndWithout(showelements, elementtoshow)
+	result = run_auditors(filename, [auditor])['get_tags_with_namespace_and_without']
+
+	for my_list, elem_string in result['elements']:
+		print my_list
+		print elem_string
+		print ''
+
+	#pprint.pprint(result['tags'])
+	return result['tags'].keys()
 
 # Check if a key of a tag has a namespace (one or two prefixes)
 def key_has_namespace(key):
-	lower_colon = re.compile(r'^([a-z]|_)*:([a-z]|_)*$')
-	lower_colon2 = re.compile(r'^([a-z]|_)*:([a-z]|_)*:([a-z]|_)*$')
-
-	return lower_colon.search(key) or lower_colon2.search(key)
+	return key_info(key).has_namespace
 
 def main():
 	#print get_tags_with_namespace(filename)
 	#print get_tags_with_namespace_and_without(filename, showelements=True, elementtoshow=sys.argv[1])
 	print get_tags_with_namespace_and_without(filename)
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+	main()
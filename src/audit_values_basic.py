@@ -1,189 +1,264 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import xml.etree.cElementTree as ET
 from audit_keys_basic import sum_to_dict
+from audit_engine import Auditor, run_auditors
+from osm_input import open_osm
+from sketch import summarize, value_set
+from tag_index import open_tag_index
+import street_types
 import pprint
 import re
 
 filename = '../data/file.osm'
 
 # Number of tags with keys prefix = addr (distribution of them)
-def get_keys_address(filename):
+class GetKeysAddress(Auditor):
+	name = 'get_keys_address'
+
+	def __init__(self):
+		self.address_dict = {}
 
-	address_dict = {}
+	def process(self, elem):
+		for k, v in elem.tags:
+			if 'addr' in k:
+				sum_to_dict(self.address_dict, k)
 
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				if 'addr' in k:
-					sum_to_dict(address_dict, k)
+	def report(self):
+		return self.address_dict
 
+def get_keys_address(filename):
+	address_dict = run_auditors(filename, [GetKeysAddress()])['get_keys_address']
 	pprint.pprint(address_dict)
 	return address_dict.keys()
 
-# Look for different values for the tag's key within addr_keys
-def get_sets_depending_on_address_keys(filename, addr_keys):
-	dict_addr_keys = {k: set() for k in addr_keys}
-
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				if 'addr' in k:
-					dict_addr_keys[k].add(tag.attrib['v'])
-	pprint.pprint(dict_addr_keys)
+# Look for different values for the tag's key within addr_keys (every addr key if None)
+#    sketch: keep a sketch.ValueSketch of the values of each key (bounded memory, approximate) instead of their set
+class GetSetsDependingOnAddressKeys(Auditor):
+	name = 'get_sets_depending_on_address_keys'
+
+	def __init__(self, addr_keys=None, sketch=False):
+		self.addr_keys = addr_keys
+		self.sketch = sketch
+		self.dict_addr_keys = {k: value_set(sketch) for k in addr_keys or []}
+
+	def process(self, elem):
+		for k, v in elem.tags:
+			if 'addr' in k:
+				if self.addr_keys is None and k not in self.dict_addr_keys:
+					self.dict_addr_keys[k] = value_set(self.sketch)
+				if k in self.dict_addr_keys:
+					self.dict_addr_keys[k].add(v)
+
+	def report(self):
+		return self.dict_addr_keys
+
+#    (the values are read from the tag index of the file, no full rescan; in sketch mode the file is
+#    scanned with sketches instead, since the index holds every distinct value)
+def get_sets_depending_on_address_keys(filename, addr_keys, sketch=False):
+	if sketch:
+		dict_addr_keys = run_auditors(filename, [GetSetsDependingOnAddressKeys(addr_keys, sketch)])['get_sets_depending_on_address_keys']
+	else:
+		index = open_tag_index(filename)
+		dict_addr_keys = {k: index.values(k, types=('node', 'way')) for k in addr_keys}
+	pprint.pprint(summarize(dict_addr_keys))
 	return dict_addr_keys
 
 # Numeric fields for address distribution
-def analyze_numeric_fields_of_address(filename, fields=['addr:housenumber', 'addr:postcode']):
-	whole_number = re.compile(r'^[0-9]+$')
-	have_number = re.compile(r'[0-9]+')
-
-	numeric_fields = {k: {'whole_number': 0, 'have_number': 0, 'no_number': 0} for k in fields}
-
-	weird_fields = {k: {'have_number': set(), 'no_number': set()} for k in fields}
-
-	for _, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				v = tag.attrib['v']
-				if k in fields:
-					if whole_number.search(v):
-						numeric_fields[k]['whole_number'] += 1
-					elif have_number.search(v):
-						numeric_fields[k]['have_number'] += 1
-						weird_fields[k]['have_number'].add(v)
-					else:
-						numeric_fields[k]['no_number'] += 1
-						weird_fields[k]['no_number'].add(v)
-	pprint.pprint(numeric_fields)
-	pprint.pprint(weird_fields)
+#    sketch: keep a sketch.ValueSketch of the weird values (bounded memory, approximate) instead of their set
+class AnalyzeNumericFieldsOfAddress(Auditor):
+	name = 'analyze_numeric_fields_of_address'
+
+	def __init__(self, fields=['addr:housenumber', 'addr:postcode'], sketch=False):
+		self.fields = fields
+		self.whole_number = re.compile(r'^[0-9]+$')
+		self.have_number = re.compile(r'[0-9]+')
+
+		self.numeric_fields = {k: {'whole_number': 0, 'have_number': 0, 'no_number': 0} for k in fields}
+		self.weird_fields = {k: {'have_number': value_set(sketch), 'no_number': value_set(sketch)} for k in fields}
+
+	def process(self, elem):
+		for k, v in elem.tags:
+			if k in self.fields:
+				if self.whole_number.search(v):
+					self.numeric_fields[k]['whole_number'] += 1
+				elif self.have_number.search(v):
+					self.numeric_fields[k]['have_number'] += 1
+					self.weird_fields[k]['have_number'].add(v)
+				else:
+					self.numeric_fields[k]['no_number'] += 1
+					self.weird_fields[k]['no_number'].add(v)
+
+	def report(self):
+		return {'numeric_fields': self.numeric_fields, 'weird_fields': self.weird_fields}
+
+def analyze_numeric_fields_of_address(filename, fields=['addr:housenumber', 'addr:postcode'], sketch=False):
+	result = run_auditors(filename, [AnalyzeNumericFieldsOfAddress(fields, sketch)])['analyze_numeric_fields_of_address']
+	pprint.pprint(result['numeric_fields'])
+	pprint.pprint(summarize(result['weird_fields']))
 
 # Numeric fields for address distribution, grouping valid housenumber values
+class AnalyzeNumericFieldsOfAddress2(AnalyzeNumericFieldsOfAddress):
+	name = 'analyze_numeric_fields_of_address2'
+
+	def __init__(self, fields=['addr:housenumber', 'addr:postcode'], sketch=False):
+		super(AnalyzeNumericFieldsOfAddress2, self).__init__(fields, sketch)
+		self.have_number = re.compile(r'^[0-9]+( |[A-Za-z])*$')
+
 #  return weird values
-def analyze_numeric_fields_of_address2(filename, fields=['addr:housenumber', 'addr:postcode']):
-	whole_number = re.compile(r'^[0-9]+$')
-	have_number = re.compile(r'^[0-9]+( |[A-Za-z])*$')
-
-	numeric_fields = {k: {'whole_number': 0, 'have_number': 0, 'no_number': 0} for k in fields}
-
-	weird_fields = {k: {'have_number': set(), 'no_number': set()} for k in fields}
-
-	for _, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				v = tag.attrib['v']
-				if k in fields:
-					if whole_number.search(v):
-						numeric_fields[k]['whole_number'] += 1
-					elif have_number.search(v):
-						numeric_fields[k]['have_number'] += 1
-						weird_fields[k]['have_number'].add(v)
-					else:
-						numeric_fields[k]['no_number'] += 1
-						weird_fields[k]['no_number'].add(v)
-	pprint.pprint(numeric_fields)
-	pprint.pprint(weird_fields)
+def analyze_numeric_fields_of_address2(filename, fields=['addr:housenumber', 'addr:postcode'], sketch=False):
+	result = run_auditors(filename, [AnalyzeNumericFieldsOfAddress2(fields, sketch)])['analyze_numeric_fields_of_address2']
+	weird_fields = result['weird_fields']
+	pprint.pprint(result['numeric_fields'])
+	pprint.pprint(summarize(weird_fields))
 	print weird_fields
 	return list(weird_fields)
 
+# addr:housename value whose element is shown by check_text_values
+text_value_to_show = u'Calle Santa Mar\xeda n\xba8, 48005 Bilbao'
+
+# Check the value for different tag's keys in cases_to_check
+#    report: {'categories': categories_set, 'elements': [elements to print as XML string]}
+#    sketch: keep a sketch.ValueSketch of the values of each category (bounded memory, approximate) instead of their set
+class CheckTextValues(Auditor):
+	name = 'check_text_values'
+
+	def __init__(self, cases_to_check=['addr:city', 'addr:housename', 'addr:street'], sketch=False):
+		self.cases_to_check = cases_to_check
+		self.categories = {
+			'all_capital': re.compile(r'^([A-Z]| )+$'),
+			'all_small': re.compile(r'^([a-z]| )+$'),
+			'unicode_text': re.compile(r'[0-9]+'),
+			'other': re.compile(r'\S')
+			}
+		keys = self.categories.keys()
+
+		self.categories_set = {j: {k: value_set(sketch) for k in keys} for j in cases_to_check}
+		self.elements = []
+
+	def process(self, elem):
+		for k, v in elem.tags:
+
+			if k == 'addr:housename' and v == text_value_to_show:
+				self.elements.append(elem.to_xml())
+
+			if k in self.cases_to_check:
+				self.add_value(k, v)
+
+	def add_value(self, k, v):
+		categories = self.categories
+		if categories['all_capital'].search(v):
+			self.categories_set[k]['all_capital'].add(v)
+		elif categories['all_small'].search(v):
+			self.categories_set[k]['all_small'].add(v)
+		elif categories['unicode_text'].search(v) is None:
+			self.categories_set[k]['unicode_text'].add(v)
+		else:
+			self.categories_set[k]['other'].add(v)
+
+	def report(self):
+		return {'categories': self.categories_set, 'elements': self.elements}
+
 # Check the value for different tag's keys in cases_to_check and print them
-def check_text_values(filename, cases_to_check=['addr:city', 'addr:housename', 'addr:street']):
-	categories = {
-		'all_capital': re.compile(r'^([A-Z]| )+$'),
-		'all_small': re.compile(r'^([a-z]| )+$'),
-		'unicode_text': re.compile(r'[0-9]+'),
-		'other': re.compile(r'\S')
-		}
-	keys = categories.keys()
-
-	categories_set = {j: {k: set() for k in keys} for j in cases_to_check}
-
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				v = tag.attrib['v']
-
-				if k == 'addr:housename' and v == u'Calle Santa Mar\xeda n\xba8, 48005 Bilbao':
-					print ET.tostring(elem)
-
-				if k in cases_to_check:
-					if categories['all_capital'].search(v):
-						categories_set[k]['all_capital'].add(v)
-					elif categories['all_small'].search(v):
-						categories_set[k]['all_small'].add(v)
-					elif categories['unicode_text'].search(v) is None:
-						categories_set[k]['unicode_text'].add(v)
-					else:
-						categories_set[k]['other'].add(v)
-
-	pprint.pprint(categories_set)
+#    (the values are read from the tag index of the file, and the elements to show with a seek; in
+#    sketch mode the file is scanned with sketches instead, since the index holds every distinct value)
+def check_text_values(filename, cases_to_check=['addr:city', 'addr:housename', 'addr:street'], sketch=False):
+	if sketch:
+		result = run_auditors(filename, [CheckTextValues(cases_to_check, sketch)])['check_text_values']
+		for xml in result['elements']:
+			print xml
+		pprint.pprint(summarize(result['categories']))
+		return
+
+	index = open_tag_index(filename)
+	auditor = CheckTextValues(cases_to_check)
+	for k in cases_to_check:
+		for v in index.values(k, types=('node', 'way')):
+			auditor.add_value(k, v)
+
+	with open_osm(filename) as osm_file:
+		for element in index.elements('addr:housename', text_value_to_show, types=('node', 'way')):
+			print index.fetch(element, osm_file).to_xml()
+	pprint.pprint(auditor.categories_set)
+
+# Distribution of (possible) different types of street (k=addr:street)
+#    normalized: count the types once corrected by the cleaning normalizer (street_types.json)
+class TypeOfStreetDict(Auditor):
+	name = 'type_of_street_dict'
+
+	def __init__(self, normalized=False):
+		self.normalized = normalized
+		self.types = {}
+
+	def process(self, elem):
+		for k, v in elem.tags:
+			if k == 'addr:street':
+				if self.normalized:
+					sum_to_dict(self.types, street_types.normalizer.normalized_type(v))
+				else:
+					sum_to_dict(self.types, street_types.street_type(v))
+
+	def report(self):
+		return self.types
 
 # Prints and returns a list of (possible) different types of street (k=addr:street)
-def type_of_street(filename):
-	types = set()
-
-	kalea = re.compile(r'(k|K)alea$')
-
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				v = tag.attrib['v']
-				if k == 'addr:street':
-					if kalea.search(v):
-						types.add(v.split()[-1])
-					else:
-						types.add(v.split()[0])
+def type_of_street(filename, normalized=False):
+	types = set(run_auditors(filename, [TypeOfStreetDict(normalized)])['type_of_street_dict'])
 	print types
 	pprint.pprint(types)
 	return list(types)
 
 # Prints the distribution and returns a list of (possible) different types of street (k=addr:street)
-def type_of_street_dict(filename):
-	types = {}
-
-	kalea = re.compile(r'(k|K)alea$')
-
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				v = tag.attrib['v']
-				if k == 'addr:street':
-					if kalea.search(v):
-						sum_to_dict(types, v.split()[-1])
-					else:
-						sum_to_dict(types, v.split()[0])
+def type_of_street_dict(filename, normalized=False):
+	types = run_auditors(filename, [TypeOfStreetDict(normalized)])['type_of_street_dict']
 	print types
 	pprint.pprint(types)
 	return list(types.keys())
 
+# Wrong values detected in previous stages: (key, value) or (key, None) for any value of the key
+fails = [
+	(u'Torreón del castillo de los Salazar', None),
+	('N', None),
+	('addr:housenumber', '46, BIS'),
+	('addr:housenumber', u'8, 1\xba D'),
+	('addr:postcode', 'Larrabetzu'),
+	('addr:postcode', '48001;48002;48003;48004;48005;48006;48007;48008;48009;48010;48011;48012;48013;48014;48015'),
+	('addr:housename', '1'),
+	('addr:housename', 'Calle Galicia'),
+	('addr:housename', u'Calle Santa Mar\xeda n\xba8, 48005 Bilbao'),
+	('addr:housename', 'Calle de Ercilla, 37-39, 48011 Bilbao, Vizcaya'),
+	('addr:city', 'villasana de Mena')
+]
+
+# Wrong values complete-element detected in previous stages for the given file
+class PrintFails(Auditor):
+	name = 'print_fails'
+
+	def __init__(self):
+		self.fail_keys = set(k for k, v in fails if v is None)
+		self.fail_values = set((k, v) for k, v in fails if v is not None)
+		self.elements = []
+
+	def process(self, elem):
+		for k, v in elem.tags:
+
+			if k in self.fail_keys or (k, v) in self.fail_values:
+				self.elements.append(elem.to_xml())
+
+	def report(self):
+		return self.elements
+
 # Print wrong values complete-element detected in previous stages for the given file
+#    (the elements are looked up in the tag index of the file and read with a seek)
 def print_fails(filename):
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			for tag in elem.findall('tag'):
-				k = tag.attrib['k']
-				v = tag.attrib['v']
-
-				if (k == u'Torreón del castillo de los Salazar') or \
-				   (k == 'N') or \
-				   (k == 'addr:housenumber' and v == '46, BIS') or \
-				   (k == 'addr:housenumber' and v == u'8, 1\xba D') or \
-				   (k == 'addr:postcode' and v == 'Larrabetzu') or \
-				   (k == 'addr:postcode' and v == '48001;48002;48003;48004;48005;48006;48007;48008;48009;48010;48011;48012;48013;48014;48015') or \
-				   (k == 'addr:housename' and v == '1') or \
-				   (k == 'addr:housename' and v == 'Calle Galicia') or \
-				   (k == 'addr:housename' and v == u'Calle Santa Mar\xeda n\xba8, 48005 Bilbao') or \
-				   (k == 'addr:housename' and v == 'Calle de Ercilla, 37-39, 48011 Bilbao, Vizcaya') or \
-				   (k == 'addr:city' and v == 'villasana de Mena'):
-				   print ET.tostring(elem)
+	index = open_tag_index(filename)
+	found = []
+	for k, v in fails:
+		found.extend(index.elements(k, v, types=('node', 'way')))
+
+	with open_osm(filename) as osm_file:
+		for element in sorted(found):
+			print index.fetch(element, osm_file).to_xml()
 
 
 #addr_keys = get_keys_address(filename)
@@ -198,5 +273,6 @@ def print_fails(filename):
 
 #types_of_street = type_of_street(filename)
 #type_of_street_dict(filename)
+#type_of_street_dict(filename, normalized=True)
 
 #print_fails(filename)
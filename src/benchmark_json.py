@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Check and benchmark of clean.element_json (JSON written straight from the records) against the
+# documents of clean.clean_element serialized with json.dumps
+#    python benchmark_json.py [osm file]: the lines that differ (there should be none) and the
+#    elements/s of both serializations
+
+import cPickle as pickle
+import json
+import sys
+import time
+
+import clean
+from osm_reader import read_elements
+
+filename = '../data/file.osm'
+
+def dict_json(element):
+	return json.dumps(clean.clean_element(element), sort_keys=True) + '\n'
+
+# Fresh copies of the records (the cleaning fixes their tags in place)
+def copies(data):
+	return pickle.loads(data)
+
+# Elements whose JSON lines differ: [(element, element_json line, json.dumps line)]
+#    Also returns the number of elements element_json had to serialize through the documents
+def compare(data):
+	differences = []
+	fallbacks = [0]
+	element_dict = clean.element_dict
+
+	def counted(element):
+		fallbacks[0] += 1
+		return element_dict(element)
+
+	clean.element_dict = counted
+	try:
+		direct = [clean.element_json(element) for element in copies(data)]
+	finally:
+		clean.element_dict = element_dict
+	for element, line, expected in zip(copies(data), direct, map(dict_json, copies(data))):
+		if line != expected:
+			differences.append((element, line, expected))
+	return differences, fallbacks[0]
+
+# Best time of repeat runs serializing every element with function
+def best_time(function, data, repeat):
+	best = None
+	for _ in xrange(repeat):
+		elements = copies(data)
+		start = time.time()
+		for element in elements:
+			function(element)
+		elapsed = time.time() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def benchmark(filename, repeat=3):
+	data = pickle.dumps(list(read_elements(filename, types=('node', 'way', 'relation'))), pickle.HIGHEST_PROTOCOL)
+	count = len(copies(data))
+
+	differences, fallbacks = compare(data)
+	print '{} elements, {} serialized through their documents (colliding keys)'.format(count, fallbacks)
+	print 'differences: {}'.format(len(differences))
+	for element, line, expected in differences[:10]:
+		print '  {!r}\n    {}    {}'.format(element, line, expected)
+
+	for name, function in (('json.dumps', dict_json), ('element_json', clean.element_json)):
+		elapsed = best_time(function, data, repeat)
+		print '{:13} {:.3f} s  {:>10,.0f} elements/s'.format(name, elapsed, count / elapsed if elapsed else 0)
+	return differences
+
+if __name__ == '__main__':
+	sys.exit(1 if benchmark(sys.argv[1] if len(sys.argv) > 1 else filename) else 0)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Benchmark of the parser backends of osm_reader: elements per second reading the records
+# alone and reading them through clean_element
+
+import os
+import sys
+import time
+
+import osm_pbf
+import osm_reader
+from clean import clean_element
+
+filename = '../data/file.osm'
+
+# Backends that can read the file here (lxml is optional, pbf only reads PBF files and the others XML ones)
+def available_backends(filename):
+	pbf = osm_pbf.is_pbf(filename)
+	return [backend for backend in sorted(osm_reader.backends) if (backend == 'pbf') == pbf and
+			(backend != 'lxml' or osm_reader.lxml_etree is not None)]
+
+# Best time of repeat runs of function(), with the number of elements it returned
+def best_time(function, repeat):
+	best = None
+	for _ in xrange(repeat):
+		start = time.time()
+		count = function()
+		elapsed = time.time() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best, count
+
+def read_all(filename, backend, types):
+	count = 0
+	for element in osm_reader.read_elements(filename, types=types, backend=backend):
+		count += 1
+	return count
+
+def clean_all(filename, backend):
+	count = 0
+	for element in osm_reader.read_elements(filename, types=('node', 'way'), backend=backend):
+		clean_element(element)
+		count += 1
+	return count
+
+# Time every backend reading all the elements, only the ways (type filtering) and cleaning nodes and ways
+def benchmark(filename, repeat=3):
+	size = os.path.getsize(filename) / 1024.0 / 1024.0
+	runs = [
+		('read all', lambda backend: read_all(filename, backend, ('node', 'way', 'relation'))),
+		('read ways', lambda backend: read_all(filename, backend, ('way',))),
+		('clean', lambda backend: clean_all(filename, backend))
+	]
+
+	print '{} ({:.1f} MB)'.format(filename, size)
+	for name, run in runs:
+		print '\n{}:'.format(name)
+		for backend in available_backends(filename):
+			elapsed, count = best_time(lambda: run(backend), repeat)
+			print '  {:6} {:.3f} s  {:>10,.0f} elements/s  {:6.1f} MB/s'.format(
+				backend, elapsed, count / elapsed if elapsed else 0, size / elapsed if elapsed else 0)
+	if osm_reader.lxml_etree is None and not osm_pbf.is_pbf(filename):
+		print '\n(lxml is not installed, its backend was skipped)'
+
+if __name__ == '__main__':
+	benchmark(sys.argv[1] if len(sys.argv) > 1 else filename)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Benchmark of every stage of the pipeline (the audit functions, clean_file and the sampler) over a
+# synthetic osm file (or a given one): MB/s, elements/s and peak RSS of each stage, compared with
+# the results saved in a JSON baseline to flag regressions
+#    python benchmark_pipeline.py [osm file] [--save]
+#    --save: save the results as the new baseline (they are saved anyway if there is no baseline yet)
+
+import codecs
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+import audit_all
+import audit_keys_basic as keys_basic
+import audit_keys_namespaces as keys_namespaces
+import audit_values_basic as values_basic
+import clean
+import clean_pipeline
+import sample
+import synthetic
+import tag_index
+from osm_reader import read_elements
+
+BASELINE_FILE = '../data/benchmark_baseline.json'
+
+# Parameters of the synthetic file used when no file is given
+synthetic_params = {'nodes': 100000, 'ways': 10000, 'relations': 500, 'seed': 0}
+
+# Relative change over the baseline considered a regression (elements/s lower, peak RSS higher)
+default_threshold = 0.15
+
+address_keys = ['addr:street', 'addr:housenumber', 'addr:postcode', 'addr:city']
+
+def build_tag_index(filename):
+	if os.path.exists(tag_index.index_path(filename)):
+		os.remove(tag_index.index_path(filename))
+	tag_index.open_tag_index(filename)
+
+# (name, function(filename)) of the stages, in the order they are run
+#    The tag index is built by its own stage, so the audit functions that use it only measure the lookups
+def pipeline_stages():
+	return [
+		('count_elements', keys_basic.count_elements),
+		('count_tags', keys_basic.count_tags),
+		('unique_users', keys_basic.unique_users),
+		('type_of_keys', keys_basic.type_of_keys),
+		('type_of_keys_and_tags', keys_basic.type_of_keys_and_tags),
+		('type_of_keys_and_tags_by_element', keys_basic.type_of_keys_and_tags_by_element),
+		('get_tags_with_namespace', keys_namespaces.get_tags_with_namespace),
+		('get_tags_with_namespace_and_without', keys_namespaces.get_tags_with_namespace_and_without),
+		('get_keys_address', values_basic.get_keys_address),
+		('analyze_numeric_fields_of_address', values_basic.analyze_numeric_fields_of_address),
+		('analyze_numeric_fields_of_address2', values_basic.analyze_numeric_fields_of_address2),
+		('type_of_street', values_basic.type_of_street),
+		('type_of_street_dict', values_basic.type_of_street_dict),
+		('tag_index', build_tag_index),
+		('check_weird_keys', keys_basic.check_weird_keys),
+		('get_sets_depending_on_address_keys', lambda f: values_basic.get_sets_depending_on_address_keys(f, address_keys)),
+		('check_text_values', values_basic.check_text_values),
+		('print_fails', values_basic.print_fails),
+		('audit_all', audit_all.audit_all),
+		('clean_file', clean.clean_file),
+		('clean_file_pipelined', clean_pipeline.clean_file_pipelined),
+		('sample_ratio', lambda f: sample.sample_file(f, '../data/sample.osm', ratio=0.1)),
+		('sample_closed', lambda f: sample.sample_file(f, '../data/sample.osm', ratio=0.1, closed=True)),
+		('sample_reservoir', lambda f: sample.sample_file(f, '../data/sample.osm', size=1000, seed=0))
+	]
+
+# Body of the child process of a stage: run it from workdir/src (so '../data/' is workdir/data) with
+# the (UTF-8) output discarded, and send back (seconds, peak RSS in MB) or the traceback if it fails
+def run_stage(function, filename, workdir, connection):
+	try:
+		os.chdir(os.path.join(workdir, 'src'))
+		sys.stdout = codecs.getwriter('utf-8')(open(os.devnull, 'w'))
+		start = time.time()
+		function(filename)
+		elapsed = time.time() - start
+		connection.send(('ok', elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+	except Exception:
+		connection.send(('error', traceback.format_exc(), None))
+	finally:
+		connection.close()
+
+# Run a stage in a fresh process (so the peak RSS is the one of the stage alone), best time of repeat runs
+#    returns (seconds, peak RSS in MB)
+def measure(function, filename, workdir, repeat=1):
+	best = None
+	for _ in xrange(repeat):
+		receiver, sender = multiprocessing.Pipe(duplex=False)
+		process = multiprocessing.Process(target=run_stage, args=(function, filename, workdir, sender))
+		process.start()
+		sender.close()
+		try:
+			status, elapsed, peak_rss = receiver.recv()
+		except EOFError:
+			status, elapsed, peak_rss = 'error', 'the process exited with code {}'.format(process.exitcode), None
+		process.join()
+		if status != 'ok':
+			raise RuntimeError('Stage failed:\n{}'.format(elapsed))
+		if best is None or elapsed < best[0]:
+			best = (elapsed, peak_rss)
+	return best
+
+# Number of top-level elements (nodes, ways and relations) of the file
+def count_elements(filename):
+	return sum(1 for _ in read_elements(filename))
+
+# Run every stage over the file (a synthetic one with synthetic_params if None)
+#    returns {'input': description of the file, 'stages': {name: {seconds, mb_s, elements_s, peak_rss_mb}}}
+def run_benchmark(filename=None, repeat=1, stages=None):
+	workdir = tempfile.mkdtemp(prefix='osm_benchmark_')
+	try:
+		os.mkdir(os.path.join(workdir, 'src'))
+		os.mkdir(os.path.join(workdir, 'data'))
+		if filename is None:
+			path = os.path.join(workdir, 'data', 'synthetic.osm')
+			synthetic.generate(path, **synthetic_params)
+			source = {'synthetic': synthetic_params}
+		else:
+			# Linked within the work directory, so the tag index is not written next to the original
+			path = os.path.join(workdir, 'data', os.path.basename(filename))
+			os.symlink(os.path.abspath(filename), path)
+			source = {'file': os.path.abspath(filename)}
+
+		size = os.path.getsize(path)
+		elements = count_elements(path)
+		results = {
+			'input': dict(source, size=size, elements=elements),
+			'python': platform.python_version(),
+			'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+			'stages': {}
+		}
+		megabytes = size / 1024.0 / 1024.0
+		for name, function in stages or pipeline_stages():
+			elapsed, peak_rss = measure(function, path, workdir, repeat)
+			results['stages'][name] = {
+				'seconds': elapsed,
+				'mb_s': megabytes / elapsed if elapsed else None,
+				'elements_s': elements / elapsed if elapsed else None,
+				'peak_rss_mb': peak_rss
+			}
+			print '  {:36} {:8.3f} s'.format(name, elapsed)
+		return results
+	finally:
+		shutil.rmtree(workdir)
+
+# Regressions of the results over a baseline: {stage: [descriptions]}
+#    Only comparable when both were run over the same input
+def find_regressions(results, baseline, threshold=default_threshold):
+	regressions = {}
+	if results['input'] != baseline['input']:
+		return None
+	for name, stage in results['stages'].iteritems():
+		base = baseline['stages'].get(name)
+		if base is None:
+			continue
+		found = []
+		if stage['elements_s'] and base['elements_s'] and stage['elements_s'] < base['elements_s'] * (1 - threshold):
+			found.append('{:.0%} slower'.format(1 - stage['elements_s'] / base['elements_s']))
+		if stage['peak_rss_mb'] and base['peak_rss_mb'] and stage['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold):
+			found.append('{:.0%} more memory'.format(stage['peak_rss_mb'] / base['peak_rss_mb'] - 1))
+		if found:
+			regressions[name] = found
+	return regressions
+
+def print_results(results, regressions):
+	print '\n{:36} {:>9} {:>8} {:>12} {:>10}'.format('stage', 'seconds', 'MB/s', 'elements/s', 'peak MB')
+	for name, _ in pipeline_stages():
+		stage = results['stages'].get(name)
+		if stage is None:
+			continue
+		flag = ', '.join(regressions.get(name, [])) if regressions else ''
+		print '{:36} {:9.3f} {:8.2f} {:12,.0f} {:10.1f}  {}'.format(
+			name, stage['seconds'], stage['mb_s'] or 0, stage['elements_s'] or 0, stage['peak_rss_mb'], flag)
+
+def load_baseline(path=BASELINE_FILE):
+	try:
+		with open(path) as baseline_file:
+			return json.load(baseline_file)
+	except (IOError, ValueError):
+		return None
+
+def save_baseline(results, path=BASELINE_FILE):
+	with open(path, 'w') as baseline_file:
+		json.dump(results, baseline_file, indent=1, sort_keys=True)
+
+# Run the benchmark, compare it with the baseline and save it if asked (or there is no baseline)
+#    returns the exit status: 1 if there are regressions
+def main(argv):
+	args = [arg for arg in argv if not arg.startswith('--')]
+	filename = args[0] if args else None
+
+	print 'Running the pipeline stages...'
+	results = run_benchmark(filename)
+	baseline = load_baseline()
+	regressions = find_regressions(results, baseline) if baseline else None
+	print_results(results, regressions)
+
+	if baseline is None:
+		print '\nNo baseline yet, saved to {}'.format(BASELINE_FILE)
+	elif regressions is None:
+		print '\nThe baseline was run over a different input, not compared'
+	elif regressions:
+		print '\n{} stages regressed over the baseline of {}'.format(len(regressions), baseline['date'])
+	else:
+		print '\nNo regressions over the baseline of {}'.format(baseline['date'])
+
+	if baseline is None or '--save' in argv:
+		save_baseline(results)
+	return 1 if regressions else 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
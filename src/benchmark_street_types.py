@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Micro-benchmark of the street type normalizer against the previous regex loop of clean.map_street_type
+
+import re
+import sys
+import timeit
+
+from osm_reader import read_elements
+import street_types
+
+filename = '../data/file.osm'
+
+# Previous implementation: mapping rebuilt on every call and one re.search (and re.sub) per key
+def legacy_map_street_type(v):
+
+	mapping_street_types = {
+		'ACCESO': 'Acceso',
+		'AU': u'Autovía',
+		'AUTOVIA': u'Autovía',
+		'AVENIDA': 'Avenida',
+		'BARRIO': 'Barrio',
+		'B\xba': 'Barrio',
+		'C/': 'Calle',
+		'CALLE': 'Calle',
+		'CARRETERA': 'Carretera',
+		'CL': 'Calle',
+		'CR': 'Carretera',
+		'CRTA.': 'Carretera',
+		'CTRA.N-623,BURGOS-SANTANDER': 'Carretera N-623, Burgos-Santander',
+		'Carretera/Carrera': 'Carretera',
+		'Kalea': 'kalea',
+		'PLAZA': 'Plaza',
+		'POLIGONO': u'Polígono',
+		'Urbanizaci\xc3\xb3n': u'Urbanización',
+		'Urbanizaci\xf3n': u'Urbanización'
+	}
+
+	for key, value in mapping_street_types.iteritems():
+		if re.search(key, v):
+			return re.sub(key, value, v)
+	return v
+
+# addr:street values of the osm file
+def get_streets(filename):
+	streets = []
+	for element in read_elements(filename, types=('node', 'way')):
+		for k, v in element.tags:
+			if k == 'addr:street':
+				streets.append(v)
+	return streets
+
+# Time both implementations over the streets (best of repeat runs) and count the values where they differ
+def benchmark(streets, repeat=5):
+	normalize = street_types.normalizer.normalize
+
+	legacy = min(timeit.repeat(lambda: [legacy_map_street_type(v) for v in streets], number=1, repeat=repeat))
+	compiled = min(timeit.repeat(lambda: [normalize(v) for v in streets], number=1, repeat=repeat))
+	differences = [(v, legacy_map_street_type(v), normalize(v)) for v in streets if legacy_map_street_type(v) != normalize(v)]
+
+	print '{} addr:street values'.format(len(streets))
+	print 'regex loop:  {:.4f} s ({:.2f} us/value)'.format(legacy, 1e6 * legacy / max(len(streets), 1))
+	print 'normalizer:  {:.4f} s ({:.2f} us/value)'.format(compiled, 1e6 * compiled / max(len(streets), 1))
+	print 'speedup:     {:.1f}x'.format(legacy / compiled if compiled else float('inf'))
+	print 'differences: {}'.format(len(differences))
+	for v, old, new in differences[:20]:
+		print u'  {!r}: {!r} -> {!r}'.format(v, old, new)
+	return differences
+
+if __name__ == '__main__':
+	benchmark(get_streets(sys.argv[1] if len(sys.argv) > 1 else filename))
@@ -1,135 +1,248 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import xml.etree.cElementTree as ET
 import json
 import os
-import re
+import sys
+from json.encoder import encode_basestring_ascii as encode_string
+from operator import itemgetter
+
+from osm_input import open_osm
+from osm_reader import read_elements
+from jsonl_writer import JSONLinesWriter
+from element_fixes import load_fixes, apply_fixes
+import street_types
+from key_cache import key_info
+from node_store import NodeStoreWriter
+from instrument import Instrumentation
+
+# Fixes of the elements we've seen that are wrong in some way, loaded only once
+element_fixes = load_fixes()
+
+# Functions of this module timed when clean_file runs with instrumentation
+instrumented_stages = ('element_json', 'fix_elements', 'fix_namespaces', 'fix_relation_type', 'map_street_type',
+					   'clean_tag_with_namespace')
+
+# Types of the elements cleaned
+element_types = ('node', 'way', 'relation')
 
 # Clean the entire osm file (for 'Las Merindades' zone)
-def clean_file(filename):
+#    compress: write the JSON Lines document gzipped (cleaned.jsonl.gz)
+#    node_store: path of a node store (node_store.py) to fill with the node positions during the same parse
+#    backend: parser backend of osm_reader.read_elements (its default one if None)
+#    instrument: instrument.Instrumentation to time the parsing, the cleaning stages and the writing
+#                and show the progress (its report is in instrument.report once the file is cleaned)
+#    checkpoint_every: elements cleaned between checkpoints (None for no checkpoints); a checkpoint records
+#                      the length of the output written so far and the last element cleaned (its id and byte
+#                      offset), and an interrupted run keeps its partial output to resume it. A run filling
+#                      a node store is not checkpointed (the store can not be resumed)
+#    resume: continue an interrupted run of the same file from its last checkpoint (the whole file is
+#            cleaned if there is no usable checkpoint)
+def clean_file(filename, compress=False, node_store=None, backend=None, instrument=None, checkpoint_every=100000,
+			   resume=False):
 	json_list_name = 'cleaned'
-	remove_json_list(json_list_name)
-	for event, elem in ET.iterparse(filename):
-		if elem.tag in ['node', 'way']:
-			json_elem = clean_element(elem)
-			add_to_json_list(json_elem, json_list_name)
-
-# Remove previous version of the JSON file if they exists
-def remove_json_list(json_list_name):
+	path = json_list_path(json_list_name, compress)
+	if node_store:
+		checkpoint_every = None
+	checkpoint = read_checkpoint(path, filename, compress) if resume and checkpoint_every else None
+	if checkpoint is None:
+		remove_checkpoint(path)
+
+	with JSONLinesWriter(path, compress=compress, resume_length=checkpoint['output_length'] if checkpoint else None,
+						 keep_partial=checkpoint_every is not None) as writer:
+		store = NodeStoreWriter(node_store) if node_store else None
+		try:
+			with open_osm(filename) as osm_file:
+				if checkpoint is None:
+					elements = read_elements(osm_file, types=element_types, backend=backend)
+				else:
+					elements = resume_elements(osm_file, checkpoint, backend)
+				if instrument is not None:
+					elements = instrument.track(elements, osm_file)
+					instrument.patch(writer, 'write_raw', 'write_json')
+					for name in instrumented_stages:
+						instrument.patch(sys.modules[__name__], name)
+
+				count = checkpoint['elements'] if checkpoint else 0
+				for element in elements:
+					if store is not None and element.type == 'node':
+						store.add(element.id, float(element.attrs['lon']), float(element.attrs['lat']))
+					writer.write_raw(element_json(element))
+					count += 1
+					if checkpoint_every and count % checkpoint_every == 0:
+						write_checkpoint(path, filename, compress, writer.checkpoint(), element, count)
+		except:
+			if store is not None:
+				store.abort()
+			raise
+		finally:
+			if instrument is not None:
+				instrument.finish()
+		if store is not None:
+			store.close()
+	remove_checkpoint(path)
+
+# Checkpoints of clean_file: JSON file next to the output
+#    input: path, size and mtime of the osm file (a checkpoint is only used for the same file)
+#    output_length: length of the partial output (path + '.tmp') with the elements cleaned up to the checkpoint
+#    last: [type, id] of the last element cleaned, offset: its byte offset within the (decompressed) osm file
+#          (None with the backends that do not know it, which resume skipping the elements already cleaned)
+#    elements: number of elements cleaned
+def checkpoint_path(path):
+	return path + '.checkpoint'
+
+def input_identity(filename):
+	stat = os.stat(filename)
+	return [os.path.abspath(filename), stat.st_size, stat.st_mtime]
+
+def write_checkpoint(path, filename, compress, output_length, element, count):
+	tmp_path = checkpoint_path(path) + '.tmp'
+	with open(tmp_path, 'w') as checkpoint_file:
+		json.dump({'input': input_identity(filename), 'compress': compress, 'output_length': output_length,
+				   'last': [element.type, element.id], 'offset': element.offset, 'elements': count}, checkpoint_file)
+	os.rename(tmp_path, checkpoint_path(path))
+
+# Checkpoint of an interrupted run of filename (None if there is not any or it does not match the file or the output)
+def read_checkpoint(path, filename, compress):
 	try:
-		os.remove('../data/' + json_list_name + '.jsonl')
-	except OSError:
-		pass
+		with open(checkpoint_path(path)) as checkpoint_file:
+			checkpoint = json.load(checkpoint_file)
+		output_size = os.path.getsize(path + '.tmp')
+	except (IOError, OSError, ValueError):
+		return None
+	if checkpoint.get('input') != input_identity(filename) or checkpoint.get('compress') != compress:
+		return None
+	if output_size < checkpoint['output_length']:
+		return None
+	return checkpoint
+
+def remove_checkpoint(path):
+	if os.path.exists(checkpoint_path(path)):
+		os.remove(checkpoint_path(path))
+
+# Records of the elements after the last one of a checkpoint
+#    With the offset of the element the file is parsed from it (with the expat backend, the one that gives
+#    the offsets); without it the elements up to the checkpoint are parsed and skipped
+def resume_elements(osm_file, checkpoint, backend=None):
+	last = tuple(checkpoint['last'])
+	if checkpoint['offset'] is not None:
+		osm_file.seek(checkpoint['offset'])
+		prefix = '<osm>'
+		elements = read_elements(PrefixedFile(prefix, osm_file), types=element_types, backend='expat')
+		skip = 1
+	else:
+		elements = read_elements(osm_file, types=element_types, backend=backend)
+		skip = checkpoint['elements']
+
+	for i, element in enumerate(elements):
+		if i < skip - 1:
+			continue
+		if i == skip - 1:
+			if (element.type, element.id) != last:
+				raise ValueError('The checkpoint does not match the osm file (element {} {} instead of {} {})'.format(
+					element.type, element.id, last[0], last[1]))
+			continue
+		if checkpoint['offset'] is not None:
+			element.offset += checkpoint['offset'] - len(prefix)
+		yield element
+
+# File that reads prefix and then the rest of source (the root element of a file parsed from the middle)
+class PrefixedFile(object):
+
+	def __init__(self, prefix, source):
+		self.prefix = prefix
+		self.source = source
+
+	def read(self, size=-1):
+		if not self.prefix:
+			return self.source.read(size)
+		if size < 0:
+			data, self.prefix = self.prefix + self.source.read(), ''
+		else:
+			data, self.prefix = self.prefix[:size], self.prefix[size:]
+		return data
+
+# Path of a JSON Lines document on '../data/'
+def json_list_path(json_list_name, compress=False):
+	return '../data/' + json_list_name + '.jsonl' + ('.gz' if compress else '')
 
-# Clean and correct an Element (Way or Node) within the osm document
+# Clean and correct an Element (Node, Way or Relation) within the osm document, given as a record (osm_reader.OSMElement)
 def clean_element(element):
+	dict_element = element_dict(element)
+
+	# Tags
+	clean_tags(element, dict_element)
+
+	return dict_element
+
+# Document of an element without its tags
+def element_dict(element):
 	dict_element = {
-		'id': element.attrib['id'],
+		'id': element.attrs['id'],
 		'visible': get_attribute(element, 'visible'),
 		'created': {
-			'user': element.attrib['user'],
-		    'uid': element.attrib['uid'],
-		    'timestamp': element.attrib['timestamp'],
-		    'version': element.attrib['version'],
-		    'changeset': element.attrib['changeset']
+			'user': get_attribute(element, 'user'),
+		    'uid': get_attribute(element, 'uid'),
+		    'timestamp': get_attribute(element, 'timestamp'),
+		    'version': get_attribute(element, 'version'),
+		    'changeset': get_attribute(element, 'changeset')
 		    }
 	}
 
-	if element.tag == 'node':
+	if element.type == 'node':
 		dict_element['type'] = 'node'
 		add_pos(element, dict_element)
-	elif element.tag == 'way':
+	elif element.type == 'way':
 		dict_element['type'] = 'way'
 		add_node_references(element, dict_element)
-
-	# Tags
-	clean_tags(element, dict_element)
+	elif element.type == 'relation':
+		dict_element['type'] = 'relation'
+		add_members(element, dict_element)
 
 	return dict_element
 
 # For some reason there are attribute that coulb not be present inside an Element
 def get_attribute(element, attribute):
-	if attribute in element.attrib.keys():
-		return element.attrib[attribute]
-	else:
-		return None
+	return element.attrs.get(attribute)
 
 # Add the longitude-latitude position as an array for future geospational queries
 def add_pos(element, dict_element):
-	dict_element['pos'] = [float(element.attrib['lon']), float(element.attrib['lat'])]
+	dict_element['pos'] = [float(element.attrs['lon']), float(element.attrs['lat'])]
 
 # Add node references within an array (for Ways Element only)
 def add_node_references(element, dict_element):
-	dict_element['node_refs'] = []
-	for node_ref in element.findall('nd'):
-		ref = int(node_ref.attrib['ref'])
-		dict_element['node_refs'].append(ref)
+	dict_element['node_refs'] = element.refs.tolist()
+
+# Add the typed members within an array (for Relation Element only)
+def add_members(element, dict_element):
+	dict_element['members'] = [{'type': member_type, 'ref': ref, 'role': role} for member_type, ref, role in element.members]
 
 # Clean and correct tags within an element
 def clean_tags(element, dict_element):
 
 	fix_elements(element)
 	fix_namespaces(element)
+	fix_relation_type(element)
+	add_tags(element, dict_element)
 
-	for tag in element.findall('tag'):
+# Add the (already fixed) tags of an element to its document
+def add_tags(element, dict_element):
 
-		k = tag.attrib['k']
-		v = tag.attrib['v']
+	for k, v in element.tags:
 
 		if k == 'addr:street':
-			map_street_type(tag)
+			v = map_street_type(v)
 
-		if len(k.split(':')) == 1: 
+		if key_info(k).depth == 0:
 			# no namespace
 			dict_element[k] = v
 		else:
 			# with namespace
-			clean_tag_with_namespace(tag, dict_element)
+			clean_tag_with_namespace(k, v, dict_element)
 
-# Fix those elements we've seen that are wrong in some way
+# Fix those elements we've seen that are wrong in some way (registered on element_fixes.json)
 def fix_elements(element):
-	element_id = element.attrib['id']
-	if element_id == '1247189817':
-		tag = element.find("tag[@k='addr:housename']")
-		tag.attrib['addr:housename'] = 'Bar Irrintzi'
-		element.append(ET.Element('tag', {'k': 'addr:street', 'v': 'Calle Santa María'}))
-		element.append(ET.Element('tag', {'k': 'addr:housenumber', 'v': '8'}))
-		element.append(ET.Element('tag', {'k': 'addr:postcode', 'v': '48005'}))
-		element.append(ET.Element('tag', {'k': 'addr:city', 'v': 'Bilbao'}))
-	elif element_id == '2251334795':
-		tag = element.find("tag[@k='addr:housename']")
-		tag.attrib['k'] = 'addr:housenumber'
-	elif element_id == '2497160669':
-		tag = element.find("tag[@k='addr:housenumber']")
-		tag.attrib['v'] = '8'
-		element.append(ET.Element('tag', {'k': 'addr:housenumber', 'v': '8'}))
-		element.append(ET.Element('tag', {'k': 'addr:floor', 'v': '1'}))
-		element.append(ET.Element('tag', {'k': 'addr:door', 'v': 'D'}))
-		element.append(ET.Element('tag', {'k': 'addr:full', 'v': 'Avenida Bilbao 8, 1º D'}))
-	elif element_id == '2666662355':
-		tag = element.find("tag[@k='addr:housenumber']")
-		tag.attrib['v'] = '46 BIS'
-	elif element_id == '2685469617':
-		tag = element.find("tag[@k='addr:housename']")
-		tag.attrib['k'] = 'addr:full'
-		element.append(ET.Element('tag', {'k': 'club', 'v': 'charity'}))
-	elif element_id == '233784177':
-		tag = element.find("tag[@v='water']")
-		element.remove(tag)
-		element.append(ET.Element('tag', {'k': 'name', 'v': 'Torreón del castillo de los Salazar'}))
-	elif element_id == '244038482':
-		tag = element.find("tag[@k='addr:housename']")
-		tag.attrib['k'] = 'addr:street'
-	elif element_id == '297172400':
-		tag = element.find("tag[@k='N']")
-		tag.attrib['k'] = 'addr:street'
-	elif element_id == '299032372':
-		tag = element.find("tag[@k='addr:city']")
-		tag.attrib['v'] = 'Villasana de Mena'
-	elif element_id == '334490093':
-		tag = element.find("tag[@k='addr:street']")
-		tag.attrib['k'] = 'addr:full'
+	apply_fixes(element, element_fixes)
 
 # Add a sublevel default for those tags that have both namespace and not namespace 
 #    For example: if we have 'addr' and 'addr:street' then we create 'addr:default' 
@@ -140,94 +253,144 @@ def fix_namespaces(element):
 	namespaces_set_l1 = set()
 	namespaces_set_l2 = set()
 
-	for tag in element.findall('tag'):
-		k = tag.attrib['k']
-		kl = k.split(':')
+	for k, v in element.tags:
+		kl = key_info(k).path
 		if len(kl) == 2:
 			namespaces_set_l1.add(kl[0])
 		elif len(kl) == 3:
+			# level1 is a namespace as well (name:es:old nests under 'name' even without any name:xx)
+			namespaces_set_l1.add(kl[0])
 			namespaces_set_l2.add(kl[1])
 
-	for tag in element.findall('tag'):
-		k = tag.attrib['k']
-		kl = k.split(':')
+	if not namespaces_set_l1 and not namespaces_set_l2:
+		return
+
+	for i, (k, v) in enumerate(element.tags):
+		kl = key_info(k).path
 		if len(kl) == 1:
 			if k in namespaces_set_l1:
-				tag.attrib['k'] = k + ':default'
+				element.tags[i] = (k + ':default', v)
 		elif len(kl) == 2:
 			if kl[1] in namespaces_set_l2:
-				tag.attrib['k'] = k + ':default'
-
-# Maps street types to the corrected ones
-def map_street_type(tag):
-
-	mapping_street_types = {
-		'ACCESO': 'Acceso',
-		'AU': u'Autovía',
-		'AUTOVIA': u'Autovía',
-		'AVENIDA': 'Avenida',
-		'BARRIO': 'Barrio',
-		'B\xba': 'Barrio',
-		'C/': 'Calle',
-		'CALLE': 'Calle',
-		'CARRETERA': 'Carretera',
-		'CL': 'Calle',
-		'CR': 'Carretera',
-		'CRTA.': 'Carretera',
-		'CTRA.N-623,BURGOS-SANTANDER': 'Carretera N-623, Burgos-Santander',
-		'Carretera/Carrera': 'Carretera',
-		'Kalea': 'kalea',
-		'PLAZA': 'Plaza',
-		'POLIGONO': u'Polígono',
-		'Urbanizaci\xc3\xb3n': u'Urbanización',
-		'Urbanizaci\xf3n': u'Urbanización'
-	}
+				element.tags[i] = (k + ':default', v)
 
-	v = tag.attrib['v']
+# The type tag of the relations (multipolygon, route, boundary...) is kept as 'relation_type',
+# since 'type' is the type of the element
+def fix_relation_type(element):
+	if element.type != 'relation':
+		return
+	for i, (k, v) in enumerate(element.tags):
+		if k == 'type':
+			element.tags[i] = ('relation_type', v)
 
-	for key, value in mapping_street_types.iteritems():
-		if re.search(key, v):
-			tag.attrib['v'] = re.sub(key, value, v)
-			break
+# Maps street types to the corrected ones (street_types.json)
+def map_street_type(v):
+	return street_types.normalizer.normalize(v)
 
 # Nest attributes and fix errors
-def clean_tag_with_namespace(tag, dict_element):
-	
-	k = tag.attrib['k']
-	v = tag.attrib['v']
-	kl = k.split(':')
+def clean_tag_with_namespace(k, v, dict_element):
+
+	kl = key_info(k).path
 
 	# keys with one namespace (one prefix)
 	if len(kl) == 2:
-		if kl[0] not in dict_element.keys():
+		if kl[0] not in dict_element:
 			dict_element[kl[0]] = {}
 		dict_element[kl[0]][kl[1]] = v
 	# keys with two namespaces (two prefix)
 	elif len(kl) == 3:
-		if kl[0] not in dict_element.keys():
+		if kl[0] not in dict_element:
 			dict_element[kl[0]] = {}
-		if kl[1] not in dict_element[kl[0]].keys():
+		if kl[1] not in dict_element[kl[0]]:
 			dict_element[kl[0]][kl[1]] = {}
 		dict_element[kl[0]][kl[1]][kl[2]] = v
 
+# JSON line of the cleaned element, written straight from its attributes and tags (without building
+# its document): the same bytes as json.dumps(clean_element(element), sort_keys=True) + '\n'
+#    The members are sorted by their key paths (so the nested objects come out contiguous) and the JSON is
+#    emitted opening and closing the objects where consecutive paths diverge. If two paths collide (a
+#    repeated key, a tag named like an attribute, a namespace that is also a key) the document depends
+#    on the order the tags are added, so it is built by clean_element instead
+def element_json(element):
+	fix_elements(element)
+	fix_namespaces(element)
+	fix_relation_type(element)
+
+	attrs = element.attrs
+
+	# The attributes that can be missing are null (see get_attribute)
+	def attribute(name):
+		return encode_string(attrs[name]) if name in attrs else 'null'
+
+	members = [
+		(('id',), encode_string(attrs['id'])),
+		(('visible',), attribute('visible')),
+		(('created', 'changeset'), attribute('changeset')),
+		(('created', 'timestamp'), attribute('timestamp')),
+		(('created', 'uid'), attribute('uid')),
+		(('created', 'user'), attribute('user')),
+		(('created', 'version'), attribute('version'))
+	]
+	if element.type == 'node':
+		members.append((('type',), '"node"'))
+		members.append((('pos',), '[{!r}, {!r}]'.format(float(attrs['lon']), float(attrs['lat']))))
+	elif element.type == 'way':
+		members.append((('type',), '"way"'))
+		members.append((('node_refs',), '[' + ', '.join(map(str, element.refs)) + ']'))
+	elif element.type == 'relation':
+		members.append((('type',), '"relation"'))
+		members.append((('members',), '[' + ', '.join('{{"ref": {}, "role": {}, "type": {}}}'.format(
+			ref, encode_string(role), encode_string(member_type)) for member_type, ref, role in element.members) + ']'))
+
+	for k, v in element.tags:
+		if k == 'addr:street':
+			v = map_street_type(v)
+		kl = key_info(k).path
+		# keys with more than two namespaces are not kept (see clean_tag_with_namespace)
+		if len(kl) <= 3:
+			members.append((kl, encode_string(v)))
+
+	members.sort(key=itemgetter(0))
+	previous = None
+	for path, value in members:
+		if previous is not None and path[:len(previous)] == previous:
+			dict_element = element_dict(element)
+			add_tags(element, dict_element)
+			return json.dumps(dict_element, sort_keys=True) + '\n'
+		previous = path
+
+	out = ['{']
+	# Path of the objects open (the namespaces of the last member written)
+	open_path = ()
+	for i, (path, value) in enumerate(members):
+		common = 0
+		while common < len(open_path) and common < len(path) - 1 and open_path[common] == path[common]:
+			common += 1
+		if i:
+			out.append('}' * (len(open_path) - common) + ', ')
+		for part in path[common:-1]:
+			out.append(encode_string(part) + ': {')
+		out.append(encode_string(path[-1]) + ': ' + value)
+		open_path = path[:-1]
+	out.append('}' * len(open_path) + '}\n')
+	return ''.join(out)
+
 # Save dictionary as JSON on '../data/'
 def save_json(my_dict, json_name):
-	with open('../data/' + json_name + '.json', 'w') as json_file:
-		json.dump(my_dict, json_file)
+	with JSONLinesWriter('../data/' + json_name + '.json') as writer:
+		writer.write(my_dict)
 
 # Save a list of dicionaries on a JSON Lines on '../data/'
 def save_json_list(my_dict_list, json_name):
-	with open('../data/' + json_name + '.jsonl', 'w') as json_file:
+	with JSONLinesWriter(json_list_path(json_name)) as writer:
 		for json_doc in my_dict_list:
-			json_file.write(json.dumps(json_doc) + '\n')
-
-# Add JSON to a JSON Lines document on '.../data/'
-def add_to_json_list(my_dict, json_name):
-	with open('../data/' + json_name + '.jsonl', 'a') as json_file:
-		json.dump(my_dict, json_file)
-		json_file.write('\n')
+			writer.write(json_doc)
 
 
 # Cleaning script
-filename = '../data/file.osm'
-clean_file(filename)
\ No newline at end of file
+if __name__ == '__main__':
+	filename = '../data/file.osm'
+	# --resume: continue an interrupted run from its last checkpoint
+	instrument = Instrumentation(report_path='../data/clean_report.json')
+	clean_file(filename, instrument=instrument, resume='--resume' in sys.argv[1:])
+	print instrument.summary()
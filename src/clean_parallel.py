@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import re
+from cStringIO import StringIO
+
+from clean import clean_file, element_json, json_list_path
+from jsonl_writer import JSONLinesWriter
+from osm_input import compression
+from osm_reader import read_elements
+
+# Start of a top-level element (the '<' character is always escaped within attribute values)
+element_start = re.compile(r'<(node|way|relation)[\s/>]')
+
+# Clean the entire osm file using a pool of processes
+#    The file is split in chunks of about chunk_size bytes at the boundaries of the top-level
+#    elements; each chunk is cleaned by one worker and the results are written in input order,
+#    so the output is the same as the one of clean.clean_file
+#    A compressed file can not be split by byte ranges: it is cleaned by clean.clean_file
+def clean_file_parallel(filename, processes=None, chunk_size=8 * 1024 * 1024, compress=False):
+	if compression(filename) is not None:
+		clean_file(filename, compress=compress)
+		return
+
+	json_list_name = 'cleaned'
+	chunks = split_file(filename, chunk_size)
+
+	pool = multiprocessing.Pool(processes)
+	try:
+		with JSONLinesWriter(json_list_path(json_list_name, compress), buffer_size=1, compress=compress) as writer:
+			for json_lines in pool.imap(clean_chunk, [(filename, start, end) for start, end in chunks]):
+				writer.write_raw(json_lines)
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+
+# Split the osm file in (start, end) byte ranges that begin at the start of a top-level element
+#    The last range ends where the closing tag of the root element begins
+def split_file(filename, chunk_size):
+	with open(filename, 'rb') as osm_file:
+		osm_file.seek(0, 2)
+		file_size = osm_file.tell()
+
+		osm_file.seek(max(0, file_size - 1024))
+		tail = osm_file.read()
+		end_of_elements = file_size - len(tail) + tail.rfind('</')
+
+		boundaries = []
+		offset = 0
+		while offset < end_of_elements:
+			boundary = find_element_start(osm_file, offset, end_of_elements)
+			if boundary is None:
+				break
+			if not boundaries or boundary > boundaries[-1]:
+				boundaries.append(boundary)
+			offset = boundary + chunk_size
+
+	boundaries.append(end_of_elements)
+	return zip(boundaries[:-1], boundaries[1:])
+
+# Byte offset of the first top-level element starting at or after offset (None if there are no more)
+def find_element_start(osm_file, offset, limit, window=64 * 1024):
+	osm_file.seek(offset)
+	while offset < limit:
+		data = osm_file.read(window + 16)
+		if not data:
+			return None
+		match = element_start.search(data)
+		if match and match.start() < window:
+			return offset + match.start()
+		offset += window
+		osm_file.seek(offset)
+	return None
+
+# Clean the nodes, ways and relations within the byte range [start, end) of the file, returns them as JSON Lines
+def clean_chunk(args):
+	filename, start, end = args
+	with open(filename, 'rb') as osm_file:
+		osm_file.seek(start)
+		data = osm_file.read(end - start)
+
+	json_lines = []
+	for element in read_elements(StringIO('<osm>' + data + '</osm>'), types=('node', 'way', 'relation')):
+		json_lines.append(element_json(element))
+	return ''.join(json_lines)
+
+
+if __name__ == '__main__':
+	filename = '../data/file.osm'
+	clean_file_parallel(filename)
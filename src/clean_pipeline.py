@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Clean the entire osm file with a pipeline of threads: read -> parse -> clean -> write
+#    Every stage runs in its own thread and passes batches to the next one through a bounded queue, so
+#    the reads and writes (and the decompression of a compressed file, done by the background thread of
+#    osm_input.DecompressedStream) overlap with the parsing and cleaning; a full queue blocks the stage
+#    that feeds it (backpressure), so memory stays bounded by the queue sizes
+#    Every stage reports the time it waited for input (starved by the previous stage) and for room in
+#    its output queue (held back by the next one), and every queue its depth: the stage that is busy
+#    while the others wait limits the throughput on the machine
+#    The parsing and cleaning hold the GIL, so they do not run in parallel with each other (see
+#    clean_parallel for that): the gain is the overlap of the I/O and the decompression
+
+import sys
+import threading
+import time
+from Queue import Queue, Empty, Full
+
+from clean import clean_file, element_json, element_types, json_list_path
+from jsonl_writer import JSONLinesWriter
+from osm_input import open_osm
+from osm_pbf import is_pbf
+from osm_reader import iter_expat
+
+# End of the items of a stage
+done = object()
+
+class PipelineStopped(Exception):
+	pass
+
+# Bounded queue between two stages that measures how long they wait on it
+#    put_wait: seconds the producer waited for room (the queue was full)
+#    get_wait: seconds the consumer waited for an item (the queue was empty)
+#    depth: items in the queue after every put (mean and max)
+class StageQueue(object):
+
+	def __init__(self, name, size, stopped):
+		self.name = name
+		self.size = size
+		self.queue = Queue(size)
+		self.stopped = stopped
+		self.put_wait = 0.0
+		self.get_wait = 0.0
+		self.puts = 0
+		self.depth_total = 0
+		self.max_depth = 0
+
+	def put(self, item):
+		start = time.time()
+		while True:
+			if self.stopped.is_set():
+				raise PipelineStopped()
+			try:
+				self.queue.put(item, timeout=0.1)
+				break
+			except Full:
+				pass
+		self.put_wait += time.time() - start
+		depth = self.queue.qsize()
+		self.puts += 1
+		self.depth_total += depth
+		self.max_depth = max(self.max_depth, depth)
+
+	def get(self):
+		start = time.time()
+		while True:
+			if self.stopped.is_set():
+				raise PipelineStopped()
+			try:
+				item = self.queue.get(timeout=0.1)
+				break
+			except Empty:
+				pass
+		self.get_wait += time.time() - start
+		return item
+
+	# The items until the end of the previous stage
+	def __iter__(self):
+		while True:
+			item = self.get()
+			if item is done:
+				return
+			yield item
+
+	def stats(self):
+		return {'size': self.size, 'mean_depth': float(self.depth_total) / self.puts if self.puts else 0.0,
+				'max_depth': self.max_depth}
+
+# Stages run in threads (the last one in the calling thread), each one a function of the items of the
+# previous stage (None for the first one) that yields its own items
+class Pipeline(object):
+
+	def __init__(self, queue_size=8):
+		self.queue_size = queue_size
+		self.stages = []
+		self.stopped = threading.Event()
+		self.error = None
+		self.elapsed = None
+
+	def add(self, name, function):
+		self.stages.append({'name': name, 'function': function, 'items': 0, 'input': None, 'output': None, 'elapsed': 0.0})
+
+	def run_stage(self, stage):
+		start = time.time()
+		try:
+			items = stage['function'](stage['input'])
+			for item in items:
+				stage['items'] += 1
+				if stage['output'] is not None:
+					stage['output'].put(item)
+			if stage['output'] is not None:
+				stage['output'].put(done)
+		except PipelineStopped:
+			pass
+		except BaseException:
+			if self.error is None:
+				self.error = sys.exc_info()
+			self.stopped.set()
+		finally:
+			stage['elapsed'] = time.time() - start
+
+	def run(self):
+		for previous, stage in zip(self.stages, self.stages[1:]):
+			queue = StageQueue('{} -> {}'.format(previous['name'], stage['name']), self.queue_size, self.stopped)
+			previous['output'] = queue
+			stage['input'] = queue
+		threads = [threading.Thread(target=self.run_stage, args=(stage,), name=stage['name']) for stage in self.stages[:-1]]
+		start = time.time()
+		for thread in threads:
+			thread.daemon = True
+			thread.start()
+		try:
+			self.run_stage(self.stages[-1])
+		finally:
+			self.stopped.set()
+			for thread in threads:
+				thread.join()
+			self.elapsed = time.time() - start
+		if self.error is not None:
+			raise self.error[0], self.error[1], self.error[2]
+
+	# {'elapsed': seconds, 'stages': {name: {items, busy, waiting_input, waiting_output}}, 'queues': {name: stats},
+	#  'bottleneck': the stage busy the longest}
+	#    busy: seconds the stage ran without waiting on its queues (with the threads, it includes waiting for the GIL)
+	def stats(self):
+		stages = {}
+		for stage in self.stages:
+			waiting_input = stage['input'].get_wait if stage['input'] is not None else 0.0
+			waiting_output = stage['output'].put_wait if stage['output'] is not None else 0.0
+			stages[stage['name']] = {'items': stage['items'], 'waiting_input': waiting_input, 'waiting_output': waiting_output,
+									 'busy': max(0.0, stage['elapsed'] - waiting_input - waiting_output)}
+		queues = dict((stage['output'].name, stage['output'].stats()) for stage in self.stages if stage['output'] is not None)
+		return {'elapsed': self.elapsed, 'stages': stages, 'queues': queues,
+				'bottleneck': max(stages, key=lambda name: stages[name]['busy'])}
+
+# Human-readable summary of the stats of a pipeline (stages in order)
+def summary(stats, order):
+	lines = ['{:.2f} s, bottleneck: {}'.format(stats['elapsed'], stats['bottleneck']),
+			 '  {:12} {:>9} {:>9} {:>15} {:>16}'.format('stage', 'items', 'busy s', 'waiting input s', 'waiting output s')]
+	for name in order:
+		stage = stats['stages'][name]
+		lines.append('  {:12} {:9,} {:9.2f} {:15.2f} {:16.2f}'.format(
+			name, stage['items'], stage['busy'], stage['waiting_input'], stage['waiting_output']))
+	for name in order:
+		for queue_name, queue in sorted(stats['queues'].iteritems()):
+			if queue_name.startswith(name + ' ->'):
+				lines.append('  queue {:22} size {:3}  mean depth {:5.1f}  max {}'.format(
+					queue_name, queue['size'], queue['mean_depth'], queue['max_depth']))
+	return '\n'.join(lines)
+
+# File-like object over the blocks of the read stage (for the parser)
+#    As a raw file, a read returns at most size bytes of the current block (the rest of it if size is
+#    negative), the next block once it is used up and '' at the end
+class BlockFile(object):
+
+	def __init__(self, blocks):
+		self.blocks = iter(blocks)
+		self.block = ''
+		self.position = 0
+
+	def read(self, size=-1):
+		if self.position >= len(self.block):
+			self.block = next(self.blocks, '')
+			self.position = 0
+		end = len(self.block) if size < 0 else self.position + size
+		data = self.block[self.position:end]
+		self.position += len(data)
+		return data
+
+# Clean the entire osm file through the pipeline, with the same output as clean.clean_file
+#    block_size: bytes read at a time
+#    batch_size: elements parsed, cleaned and written together (one queue item)
+#    queue_size: batches (or blocks) each queue holds
+#    returns the stats of the pipeline (Pipeline.stats), with the ones of the decompression for a compressed file
+#    A PBF file is cleaned by clean.clean_file (its blocks are decoded by osm_pbf)
+def clean_file_pipelined(filename, compress=False, block_size=256 * 1024, batch_size=1000, queue_size=8):
+	if is_pbf(filename):
+		clean_file(filename, compress=compress)
+		return None
+
+	def read(_):
+		while True:
+			block = osm_file.read(block_size)
+			if not block:
+				return
+			yield block
+
+	def parse(blocks):
+		batch = []
+		for element in iter_expat(BlockFile(blocks), element_types):
+			batch.append(element)
+			if len(batch) >= batch_size:
+				yield batch
+				batch = []
+		if batch:
+			yield batch
+
+	def clean(batches):
+		for batch in batches:
+			yield ''.join(element_json(element) for element in batch)
+
+	def write(json_batches):
+		for json_lines in json_batches:
+			writer.write_raw(json_lines)
+			yield len(json_lines)
+
+	pipeline = Pipeline(queue_size)
+	for name, function in (('read', read), ('parse', parse), ('clean', clean), ('write', write)):
+		pipeline.add(name, function)
+
+	with open_osm(filename) as osm_file:
+		with JSONLinesWriter(json_list_path('cleaned', compress), buffer_size=queue_size, compress=compress) as writer:
+			pipeline.run()
+
+	stats = pipeline.stats()
+	if hasattr(osm_file, 'put_wait'):
+		# The background thread of the stream (finished once it is closed) is the decompression stage, feeding the read stage
+		stats['stages']['decompress'] = {'items': osm_file.chunks, 'waiting_input': 0.0, 'waiting_output': osm_file.put_wait,
+										 'busy': max(0.0, osm_file.thread_time - osm_file.put_wait)}
+		stats['stages']['read']['waiting_input'] = osm_file.get_wait
+		stats['stages']['read']['busy'] = max(0.0, stats['stages']['read']['busy'] - osm_file.get_wait)
+		stats['bottleneck'] = max(stats['stages'], key=lambda name: stats['stages'][name]['busy'])
+	return stats
+
+if __name__ == '__main__':
+	filename = sys.argv[1] if len(sys.argv) > 1 else '../data/file.osm'
+	stats = clean_file_pipelined(filename)
+	if stats is not None:
+		order = [name for name in ('decompress', 'read', 'parse', 'clean', 'write') if name in stats['stages']]
+		print summary(stats, order)
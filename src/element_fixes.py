@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+
+# Default fix file: {element id: [operations]}, each operation being one of
+#    {"op": "rename_key", "k": key, "to": new key}
+#    {"op": "set_value", "k": key, "v": new value}
+#    {"op": "add_tag", "k": key, "v": value}
+#    {"op": "remove_tag", "k": key} or {"op": "remove_tag", "v": value}
+# rename_key, set_value and remove_tag act on the first tag that matches (if any)
+FIXES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'element_fixes.json')
+
+element_id_pattern = re.compile(r'^-?[0-9]+$')
+
+# Position of the first tag of the element with the key k within element.tags (None if there is not any)
+def find_tag(element, k):
+	for i, (tag_k, tag_v) in enumerate(element.tags):
+		if tag_k == k:
+			return i
+	return None
+
+def rename_key(element, k, to):
+	i = find_tag(element, k)
+	if i is not None:
+		element.tags[i] = (to, element.tags[i][1])
+
+def set_value(element, k, v):
+	i = find_tag(element, k)
+	if i is not None:
+		element.tags[i] = (k, v)
+
+def add_tag(element, k, v):
+	element.tags.append((k, v))
+
+def remove_tag(element, k=None, v=None):
+	for i, (tag_k, tag_v) in enumerate(element.tags):
+		if (k is None or tag_k == k) and (v is None or tag_v == v):
+			del element.tags[i]
+			break
+
+# Operation name: (function, required fields, optional fields)
+OPERATIONS = {
+	'rename_key': (rename_key, ('k', 'to'), ()),
+	'set_value': (set_value, ('k', 'v'), ()),
+	'add_tag': (add_tag, ('k', 'v'), ()),
+	'remove_tag': (remove_tag, (), ('k', 'v'))
+}
+
+# Validate the fixes read from a fix file and compile them to {element id: ((function, kwargs), ...)}
+#    raises ValueError describing the first wrong entry
+def compile_fixes(raw_fixes, source='fixes'):
+	if not isinstance(raw_fixes, dict):
+		raise ValueError('{}: expected an object {{element id: [operations]}}'.format(source))
+
+	fixes = {}
+	for element_id, operations in raw_fixes.iteritems():
+		if not element_id_pattern.search(element_id):
+			raise ValueError('{}: wrong element id {!r}'.format(source, element_id))
+		if not isinstance(operations, list):
+			raise ValueError('{}: element {}: expected a list of operations'.format(source, element_id))
+
+		compiled = []
+		for i, operation in enumerate(operations):
+			where = '{}: element {}, operation {}'.format(source, element_id, i)
+			if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+				raise ValueError('{}: unknown operation {!r}'.format(where, operation))
+			function, required, optional = OPERATIONS[operation['op']]
+			fields = dict((str(field), value) for field, value in operation.iteritems() if field != 'op')
+			for field in required:
+				if field not in fields:
+					raise ValueError('{}: missing field {!r}'.format(where, field))
+			for field, value in fields.iteritems():
+				if field not in required and field not in optional:
+					raise ValueError('{}: unexpected field {!r}'.format(where, field))
+				if not isinstance(value, basestring):
+					raise ValueError('{}: field {!r} must be a string'.format(where, field))
+			if not required and not fields:
+				raise ValueError('{}: expected at least one of {}'.format(where, ', '.join(optional)))
+			compiled.append((function, fields))
+		fixes[element_id] = tuple(compiled)
+
+	return fixes
+
+# Load and compile a fix file
+def load_fixes(path=FIXES_FILE):
+	with open(path) as fixes_file:
+		return compile_fixes(json.load(fixes_file), os.path.basename(path))
+
+# Apply the fixes registered for the element record (osm_reader.OSMElement), one dict lookup per element
+def apply_fixes(element, fixes):
+	operations = fixes.get(element.attrs['id'])
+	if operations:
+		for function, fields in operations:
+			function(element, **fields)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Extract the elements of an osm file within an area (bounding box or polygon) and/or with some tags to
+# a smaller osm file, so a town or some features can be audited and cleaned without the whole region
+#    Built on the passes of sample.py: the first one chooses the elements (their ids kept in on-disk sets)
+#    and the second one writes them, with every node of the chosen ways so their geometry is complete;
+#    the second pass only builds the records of the types that have chosen elements
+#    python extract.py input output [--bbox=min_lon,min_lat,max_lon,max_lat] [--poly=area.poly] [--tag=expression]... [--open]
+
+import fnmatch
+import sys
+
+from id_set import IdSet
+from osm_reader import from_utf8, read_elements
+from sample import BBoxFilter, choose_elements, element_types, write_elements
+
+OSM_FILE = '../data/file.osm'
+EXTRACT_FILE = '../data/extract.osm'
+
+# Elements matching tag expressions: the ones with any tag matching any of the expressions
+#    'key' matches any value of the key, 'key=value' (or 'key=value1|value2') only those values; the
+#    keys can have shell wildcards ('addr:*')
+class TagPredicate(object):
+
+	def __init__(self, expressions):
+		self.any_value = set()
+		self.values = {}
+		self.patterns = []
+		# {key: [values of the patterns matching the key (None for any value)]}
+		self.matched = {}
+		for expression in expressions:
+			key, _, values = expression.partition('=')
+			values = set(from_utf8(v) for v in values.split('|')) if values else None
+			key = from_utf8(key)
+			if any(c in key for c in '*?['):
+				self.patterns.append((key, values))
+			elif values is None:
+				self.any_value.add(key)
+			else:
+				self.values.setdefault(key, set()).update(values)
+
+	def __call__(self, elem):
+		for k, v in elem.tags:
+			if k in self.any_value:
+				return True
+			values = self.values.get(k)
+			if values is not None and v in values:
+				return True
+			if self.patterns:
+				for values in self.pattern_values(k):
+					if values is None or v in values:
+						return True
+		return False
+
+	def pattern_values(self, key):
+		matched = self.matched.get(key)
+		if matched is None:
+			matched = [values for pattern, values in self.patterns if fnmatch.fnmatchcase(key, pattern)]
+			self.matched[key] = matched
+		return matched
+
+# Elements within a polygon: within any of the outer rings and not within any of the holes (rings of
+# (lon, lat) points); the points outside the bounding box of the rings are discarded first
+class PolygonFilter(BBoxFilter):
+
+	def __init__(self, outer, holes=(), directory=None):
+		points = [point for ring in outer for point in ring]
+		bbox = (min(p[0] for p in points), min(p[1] for p in points), max(p[0] for p in points), max(p[1] for p in points))
+		super(PolygonFilter, self).__init__(bbox, directory)
+		self.outer = outer
+		self.holes = holes
+
+	def contains(self, lon, lat):
+		if not BBoxFilter.contains(self, lon, lat):
+			return False
+		return (any(ring_contains(ring, lon, lat) for ring in self.outer) and
+				not any(ring_contains(ring, lon, lat) for ring in self.holes))
+
+# The point is within the ring (even-odd rule)
+def ring_contains(ring, lon, lat):
+	inside = False
+	j = len(ring) - 1
+	for i in xrange(len(ring)):
+		lon_i, lat_i = ring[i]
+		lon_j, lat_j = ring[j]
+		if (lat_i > lat) != (lat_j > lat) and lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+			inside = not inside
+		j = i
+	return inside
+
+# (outer rings, holes) of a polygon file (the Osmosis .poly format of the osm extracts): a name line,
+# then the rings (a name line, one 'lon lat' line per point and END; the names of the holes start
+# with '!') and a final END; blank lines are skipped
+def read_poly(path):
+	outer = []
+	holes = []
+	with open(path) as poly_file:
+		lines = [line.strip() for line in poly_file if line.strip()]
+	i = 1
+	while i < len(lines) and lines[i] != 'END':
+		name = lines[i]
+		ring = []
+		i += 1
+		while lines[i] != 'END':
+			lon, lat = lines[i].split()[:2]
+			ring.append((float(lon), float(lat)))
+			i += 1
+		(holes if name.startswith('!') else outer).append(ring)
+		i += 1
+	if not outer:
+		raise ValueError('No polygon in {}'.format(path))
+	return outer, holes
+
+# Selector of the elements matching a predicate (every element if None), for sample.choose_elements
+class PredicateSelector(object):
+
+	def __init__(self, predicate=None):
+		self.predicate = predicate
+
+	def offer(self, elem):
+		return self.predicate is None or self.predicate(elem)
+
+	def final(self):
+		return []
+
+# Write the elements of osm_file within the area and matching the predicate to extract_file
+#    bbox: (min_lon, min_lat, max_lon, max_lat) keep the nodes within it and the ways and relations using them
+#    polygon: path of a .poly file or list of (lon, lat) points, used like the bbox
+#    where: tag expressions (see TagPredicate) or function of the record the elements must match
+#    closed: add every node referenced by the extracted ways (otherwise the file is written in one pass)
+#    directory: directory of the temporary id sets (the system one if None)
+def extract_file(osm_file=OSM_FILE, extract_file=EXTRACT_FILE, bbox=None, polygon=None, where=None,
+				 closed=True, directory=None):
+	if bbox is not None and polygon is not None:
+		raise ValueError('Use either a bbox or a polygon, not both')
+	if polygon is not None:
+		outer, holes = read_poly(polygon) if isinstance(polygon, basestring) else ([list(polygon)], [])
+		inside = PolygonFilter(outer, holes, directory)
+	elif bbox is not None:
+		inside = BBoxFilter(bbox, directory)
+	else:
+		inside = None
+	if where is not None and not callable(where):
+		where = TagPredicate(where)
+	selector = PredicateSelector(where)
+
+	try:
+		with open(extract_file, 'wb') as output:
+			output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+			output.write('<osm version="0.6" generator="extract.py">\n  ')
+			if inside is not None:
+				output.write('<bounds maxlat="{}" maxlon="{}" minlat="{}" minlon="{}" />\n  '.format(
+					inside.max_lat, inside.max_lon, inside.min_lat, inside.min_lon))
+
+			if not closed:
+				for elem in read_elements(osm_file):
+					if (inside is None or inside(elem)) and selector.offer(elem):
+						output.write(elem.to_xml('utf-8') + '\n  ')
+			else:
+				selected = dict((t, IdSet(directory=directory)) for t in element_types)
+				referenced = IdSet(directory=directory)
+				try:
+					choose_elements(osm_file, selector, inside, closed, selected, referenced)
+					types = tuple(t for t in element_types if len(selected[t]) or (t == 'node' and len(referenced)))
+					if types:
+						write_elements(osm_file, output, selected, referenced, types)
+				finally:
+					for ids in selected.values() + [referenced]:
+						ids.close()
+
+			output.write('</osm>')
+	finally:
+		if inside is not None:
+			inside.close()
+
+if __name__ == '__main__':
+	arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--')]
+	options = dict(argument[2:].partition('=')[::2] for argument in sys.argv[1:] if argument.startswith('--') and argument[2:5] != 'tag')
+	tags = [argument[6:] for argument in sys.argv[1:] if argument.startswith('--tag=')]
+	extract_file(arguments[0] if arguments else OSM_FILE, arguments[1] if len(arguments) > 1 else EXTRACT_FILE,
+				 bbox=tuple(float(x) for x in options['bbox'].split(',')) if 'bbox' in options else None,
+				 polygon=options.get('poly'), where=tags or None, closed='open' not in options)
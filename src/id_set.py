@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# On-disk set of element ids (SQLite), so the sets of ids of a multi-GB file do not have to fit in memory
+
+import os
+import sqlite3
+import tempfile
+
+# Set of integer ids stored in a SQLite table
+#    path: database file (a temporary one, removed on close, if None)
+#    buffer_size: ids buffered in memory before inserting them
+class IdSet(object):
+
+	def __init__(self, path=None, buffer_size=100000, directory=None):
+		self.temporary = path is None
+		if self.temporary:
+			fd, path = tempfile.mkstemp(suffix='.ids', dir=directory)
+			os.close(fd)
+		self.path = path
+		self.buffer_size = buffer_size
+		self.buffer = []
+		self.db = sqlite3.connect(path)
+		self.db.execute('PRAGMA journal_mode = OFF')
+		self.db.execute('PRAGMA synchronous = OFF')
+		self.db.execute('CREATE TABLE IF NOT EXISTS ids (id INTEGER PRIMARY KEY)')
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def add(self, element_id):
+		self.buffer.append((element_id,))
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	def update(self, element_ids):
+		for element_id in element_ids:
+			self.add(element_id)
+
+	def flush(self):
+		if not self.buffer:
+			return
+		self.db.executemany('INSERT OR IGNORE INTO ids VALUES (?)', self.buffer)
+		self.db.commit()
+		self.buffer = []
+
+	def __contains__(self, element_id):
+		self.flush()
+		return self.db.execute('SELECT 1 FROM ids WHERE id = ?', (element_id,)).fetchone() is not None
+
+	# Any of the ids is in the set (one query per 500 ids)
+	def any_of(self, element_ids):
+		self.flush()
+		element_ids = list(element_ids)
+		for start in xrange(0, len(element_ids), 500):
+			chunk = element_ids[start:start + 500]
+			query = 'SELECT 1 FROM ids WHERE id IN ({}) LIMIT 1'.format(','.join('?' * len(chunk)))
+			if self.db.execute(query, chunk).fetchone() is not None:
+				return True
+		return False
+
+	def __len__(self):
+		self.flush()
+		return self.db.execute('SELECT COUNT(*) FROM ids').fetchone()[0]
+
+	# Ids in increasing order
+	def __iter__(self):
+		self.flush()
+		for row in self.db.execute('SELECT id FROM ids ORDER BY id'):
+			yield row[0]
+
+	# Membership test for ids asked in increasing order (like the elements of a type in an osm file):
+	#    the stored ids are read in order alongside them, with a query only for the ids that come out of order
+	def sorted_contains(self):
+		stored = iter(self)
+		state = {'current': next(stored, None), 'last': None}
+
+		def contains(element_id):
+			if state['last'] is not None and element_id < state['last']:
+				return element_id in self
+			state['last'] = element_id
+			while state['current'] is not None and state['current'] < element_id:
+				state['current'] = next(stored, None)
+			return state['current'] == element_id
+
+		return contains
+
+	def close(self):
+		self.buffer = []
+		self.db.close()
+		if self.temporary and os.path.exists(self.path):
+			os.remove(self.path)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Instrumentation of the long runs (cleaning, auditing): cumulative timers and counters per stage,
+# periodic progress (elements/s, bytes read, ETA, RSS), an optional profiler and a JSON report
+#    Nothing is instrumented unless an Instrumentation is given to clean_file / run_auditors: the timed
+#    functions are replaced by timing wrappers only during the run (and restored by finish), so the
+#    code paths without instrumentation are exactly the plain ones
+
+import cProfile
+import json
+import os
+import pstats
+import resource
+import signal
+import sys
+import time
+from functools import wraps
+
+# Current resident memory of the process in MB (the peak one where /proc is not available)
+def current_rss_mb():
+	try:
+		with open('/proc/self/statm') as statm:
+			return int(statm.read().split()[1]) * resource.getpagesize() / 1024.0 / 1024.0
+	except (IOError, IndexError, ValueError):
+		return peak_rss_mb()
+
+def peak_rss_mb():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def format_duration(seconds):
+	minutes, seconds = divmod(int(seconds), 60)
+	hours, minutes = divmod(minutes, 60)
+	return '{}h{:02d}m{:02d}s'.format(hours, minutes, seconds) if hours else '{}m{:02d}s'.format(minutes, seconds)
+
+# Instrumentation of one run
+#    progress_interval: seconds between progress lines (None for no progress)
+#    profile: None, 'cprofile' (deterministic profiler) or 'sampling' (stack samples every sampling_interval
+#             seconds of CPU time, with SIGPROF; only on the main thread)
+#    report_path: JSON file to write the report to when the run finishes (None to only keep it in self.report)
+#    stream: where the progress lines are written
+class Instrumentation(object):
+
+	def __init__(self, progress_interval=10.0, profile=None, report_path=None, sampling_interval=0.005,
+				 stream=sys.stderr, top=25):
+		if profile not in (None, 'cprofile', 'sampling'):
+			raise ValueError('Unknown profiler {!r} (expected cprofile or sampling)'.format(profile))
+		self.progress_interval = progress_interval
+		self.profile = profile
+		self.report_path = report_path
+		self.sampling_interval = sampling_interval
+		self.stream = stream
+		self.top = top
+
+		self.timers = {}
+		self.calls = {}
+		self.counters = {}
+		self.elements = 0
+		self.patches = []
+		self.input_file = None
+		self.position = None
+		self.total_bytes = None
+		self.start_time = None
+		self.profiler = None
+		self.samples = None
+		self.report = None
+
+	# Start the clock and the profiler (called by track, once per run)
+	def start(self):
+		if self.start_time is not None:
+			return
+		self.start_time = time.time()
+		self.next_progress = self.start_time + (self.progress_interval or 0)
+		if self.profile == 'cprofile':
+			self.profiler = cProfile.Profile()
+			self.profiler.enable()
+		elif self.profile == 'sampling':
+			self.samples = {}
+			signal.signal(signal.SIGPROF, self.sample)
+			signal.setitimer(signal.ITIMER_PROF, self.sampling_interval, self.sampling_interval)
+
+	def sample(self, signum, frame):
+		if frame is not None:
+			code = frame.f_code
+			key = '{}:{}({})'.format(os.path.basename(code.co_filename), code.co_firstlineno, code.co_name)
+			self.samples[key] = self.samples.get(key, 0) + 1
+
+	def add_time(self, stage, seconds):
+		self.timers[stage] = self.timers.get(stage, 0.0) + seconds
+		self.calls[stage] = self.calls.get(stage, 0) + 1
+
+	def count(self, counter, n=1):
+		self.counters[counter] = self.counters.get(counter, 0) + n
+
+	# Function that times every call of function as stage (inclusive of the stages it calls)
+	def timed(self, stage, function):
+		add_time = self.add_time
+		clock = time.time
+
+		@wraps(function)
+		def timed_function(*args, **kwargs):
+			start = clock()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				add_time(stage, clock() - start)
+		return timed_function
+
+	# Replace owner.name (a module function, a method of an instance...) by its timed version until finish
+	def patch(self, owner, name, stage=None):
+		had_own = name in vars(owner)
+		original = getattr(owner, name)
+		setattr(owner, name, self.timed(stage or name, original))
+		self.patches.append((owner, name, had_own, original))
+
+	def unpatch(self):
+		while self.patches:
+			owner, name, had_own, original = self.patches.pop()
+			if had_own:
+				setattr(owner, name, original)
+			else:
+				delattr(owner, name)
+
+	# Iterate over the records of a parser timing the parsing (stage 'parse'), counting the elements
+	# by type and writing the progress
+	#    input_file: file being parsed (its position gives the bytes read, its size the ETA)
+	def track(self, elements, input_file=None, stage='parse'):
+		self.start()
+		self.input_file = input_file
+		if input_file is not None and self.total_bytes is None:
+			try:
+				self.total_bytes = os.fstat(input_file.fileno()).st_size
+			except (AttributeError, ValueError, OSError):
+				self.total_bytes = None
+
+		clock = time.time
+		iterator = iter(elements)
+		while True:
+			start = clock()
+			try:
+				element = next(iterator)
+			except StopIteration:
+				self.add_time(stage, clock() - start)
+				self.bytes_read()
+				break
+			self.add_time(stage, clock() - start)
+			self.elements += 1
+			self.count(getattr(element, 'type', 'element'))
+			if self.progress_interval is not None and self.elements % 1000 == 0 and clock() >= self.next_progress:
+				self.print_progress()
+				self.next_progress = clock() + self.progress_interval
+			yield element
+
+	# Position of the input file (the last one known once it has been closed)
+	#    For a compressed file (osm_input.DecompressedStream) the position within the compressed data,
+	#    which is the one comparable with the size of the file
+	def bytes_read(self):
+		if self.input_file is not None:
+			try:
+				self.position = getattr(self.input_file, 'raw_tell', self.input_file.tell)()
+			except (ValueError, IOError, OSError):
+				pass
+		return self.position
+
+	def print_progress(self):
+		elapsed = time.time() - self.start_time
+		line = '{:,} elements  {:,.0f} elements/s'.format(self.elements, self.elements / elapsed if elapsed else 0)
+		position = self.bytes_read()
+		if position is not None:
+			line += '  {:.1f} MB'.format(position / 1024.0 / 1024.0)
+			if self.total_bytes:
+				line += ' of {:.1f} MB ({:.0%})'.format(self.total_bytes / 1024.0 / 1024.0, float(position) / self.total_bytes)
+				if position:
+					line += '  ETA {}'.format(format_duration(elapsed * (self.total_bytes - position) / position))
+		line += '  RSS {:.0f} MB'.format(current_rss_mb())
+		self.stream.write(line + '\n')
+		self.stream.flush()
+
+	# End of the run: restore the patched functions, stop the profiler and build (and write) the report
+	def finish(self):
+		self.unpatch()
+		if self.start_time is None:
+			self.start()
+		elapsed = time.time() - self.start_time
+		position = self.bytes_read()
+
+		report = {
+			'elapsed': elapsed,
+			'elements': self.elements,
+			'elements_s': self.elements / elapsed if elapsed else None,
+			'bytes': position,
+			'mb_s': position / 1024.0 / 1024.0 / elapsed if position is not None and elapsed else None,
+			'peak_rss_mb': peak_rss_mb(),
+			'stages': dict((stage, {'seconds': seconds, 'calls': self.calls[stage]}) for stage, seconds in self.timers.iteritems()),
+			'counters': dict(self.counters)
+		}
+
+		if self.profiler is not None:
+			self.profiler.disable()
+			stats = pstats.Stats(self.profiler)
+			functions = sorted(stats.stats.iteritems(), key=lambda item: item[1][3], reverse=True)[:self.top]
+			report['profile'] = [{'function': '{}:{}({})'.format(os.path.basename(f[0]), f[1], f[2]),
+								  'calls': s[1], 'tottime': s[2], 'cumtime': s[3]} for f, s in functions]
+			self.profiler = None
+		elif self.samples is not None:
+			signal.setitimer(signal.ITIMER_PROF, 0, 0)
+			signal.signal(signal.SIGPROF, signal.SIG_DFL)
+			total = sum(self.samples.values())
+			top = sorted(self.samples.iteritems(), key=lambda item: item[1], reverse=True)[:self.top]
+			report['profile'] = [{'function': f, 'samples': n, 'share': float(n) / total} for f, n in top]
+			self.samples = None
+
+		if self.report_path is not None:
+			with open(self.report_path, 'w') as report_file:
+				json.dump(report, report_file, indent=1, sort_keys=True)
+		self.report = report
+		return report
+
+	# Human-readable summary of the report
+	def summary(self):
+		report = self.report or self.finish()
+		lines = ['{:,} elements in {:.2f} s ({:,.0f} elements/s), peak RSS {:.0f} MB'.format(
+			report['elements'], report['elapsed'], report['elements_s'] or 0, report['peak_rss_mb'])]
+		for stage, timer in sorted(report['stages'].iteritems(), key=lambda item: item[1]['seconds'], reverse=True):
+			lines.append('  {:36} {:9.3f} s {:>12,} calls'.format(stage, timer['seconds'], timer['calls']))
+		for entry in report.get('profile', []):
+			if 'samples' in entry:
+				lines.append('  {:60} {:6.1%}'.format(entry['function'], entry['share']))
+			else:
+				lines.append('  {:60} {:9.3f} s cumulative'.format(entry['function'], entry['cumtime']))
+		return '\n'.join(lines)
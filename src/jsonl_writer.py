@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import os
+
+# Streaming writer of JSON Lines documents
+#    path: final path of the file
+#    buffer_size: number of documents kept in memory before writing them to the file
+#    compress: write a gzip file instead of plain text
+#    atomic: write to path + '.tmp' and rename it to path on close, so path is never left half written
+#    resume_length: continue a file left by an interrupted run, truncated to that length (one returned by checkpoint)
+#    keep_partial: if the writing fails, keep the partial file (to resume it) instead of discarding it
+class JSONLinesWriter(object):
+
+	def __init__(self, path, buffer_size=1000, compress=False, atomic=True, resume_length=None, keep_partial=False):
+		self.path = path
+		self.buffer_size = buffer_size
+		self.compress = compress
+		self.atomic = atomic
+		self.keep_partial = keep_partial
+		self.tmp_path = path + '.tmp' if atomic else path
+		if resume_length is None:
+			self.raw = open(self.tmp_path, 'wb')
+		else:
+			self.raw = open(self.tmp_path, 'r+b')
+			self.raw.truncate(resume_length)
+			self.raw.seek(0, 2)
+		# The gzip file is a member written on the raw file (a new member is started at every checkpoint)
+		self.file = gzip.GzipFile(fileobj=self.raw, mode='wb') if compress else self.raw
+		self.buffer = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		elif self.keep_partial:
+			self.suspend()
+		else:
+			self.abort()
+
+	# Add one document to the buffer (flushing it if it is full)
+	def write(self, doc):
+		self.buffer.append(json.dumps(doc) + '\n')
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	# Add already serialized JSON Lines (ending with a newline) to the buffer
+	def write_raw(self, json_lines):
+		self.buffer.append(json_lines)
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	# Write the buffered documents to the file
+	def flush(self):
+		if self.buffer:
+			self.file.write(''.join(self.buffer))
+			self.buffer = []
+		self.file.flush()
+
+	# Write the buffered documents and make them durable, returns the length of the file up to them
+	#    (a file truncated to that length is a complete document, see resume_length)
+	def checkpoint(self):
+		self.flush()
+		if self.compress:
+			self.file.close()
+		self.raw.flush()
+		os.fsync(self.raw.fileno())
+		length = self.raw.tell()
+		if self.compress:
+			self.file = gzip.GzipFile(fileobj=self.raw, mode='wb')
+		return length
+
+	# Flush and close the file, moving it to its final path
+	def close(self):
+		if self.raw.closed:
+			return
+		self.flush()
+		self.close_files()
+		if self.atomic:
+			os.rename(self.tmp_path, self.path)
+
+	# Close the file discarding it (the previous version of path, if any, is kept)
+	def abort(self):
+		if self.raw.closed:
+			return
+		self.buffer = []
+		self.close_files()
+		if self.atomic:
+			os.remove(self.tmp_path)
+
+	# Close the file keeping what has been written so far (without the buffer) to resume it later
+	def suspend(self):
+		if self.raw.closed:
+			return
+		self.buffer = []
+		self.close_files()
+
+	def close_files(self):
+		if self.file is not self.raw:
+			self.file.close()
+		self.raw.close()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+from collections import OrderedDict
+
+lower = re.compile(r'^([a-z]|_)*$')
+lower_colon = re.compile(r'^([a-z]|_)*:([a-z]|_)*$')
+lower_colon2 = re.compile(r'^([a-z]|_)*:([a-z]|_)*:([a-z]|_)*$')
+problemchars = re.compile(r'[=\+/&<>;\'"\?%#$@\,\. \t\r\n]')
+
+# Metadata of a tag key, computed once per distinct key
+#    kind: structure of the key ('lower', 'lower_colon', 'lower_colon2', 'problemchars' or 'other')
+#    path: key split by the namespace separator (addr:street -> ('addr', 'street'))
+#    depth: number of namespaces of the key (len(path) - 1)
+#    has_namespace: the key is lower_colon or lower_colon2
+class KeyInfo(object):
+	__slots__ = ('key', 'kind', 'path', 'depth', 'has_namespace')
+
+	def __init__(self, key):
+		self.key = key
+		if lower.search(key):
+			self.kind = 'lower'
+		elif lower_colon.search(key):
+			self.kind = 'lower_colon'
+		elif lower_colon2.search(key):
+			self.kind = 'lower_colon2'
+		elif problemchars.search(key):
+			self.kind = 'problemchars'
+		else:
+			self.kind = 'other'
+		self.path = tuple(intern(part) if isinstance(part, str) else part for part in key.split(':'))
+		self.depth = len(self.path) - 1
+		self.has_namespace = self.kind in ('lower_colon', 'lower_colon2')
+
+# Cache {key: KeyInfo} holding at most max_size keys (the oldest ones are evicted first)
+class KeyCache(object):
+
+	def __init__(self, max_size=100000):
+		self.max_size = max_size
+		self.infos = OrderedDict()
+
+	def get(self, key):
+		info = self.infos.get(key)
+		if info is None:
+			info = KeyInfo(key)
+			if len(self.infos) >= self.max_size:
+				self.infos.popitem(last=False)
+			self.infos[key] = info
+		return info
+
+	def clear(self):
+		self.infos.clear()
+
+# Cache shared by the auditing and cleaning scripts
+key_cache = KeyCache()
+key_info = key_cache.get
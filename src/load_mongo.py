@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Load the cleaned JSON Lines document into MongoDB (the merindades collection of the report)
+
+import json
+import multiprocessing
+import os
+from collections import deque
+
+import pymongo
+from pymongo.errors import BulkWriteError
+
+jsonl_filename = '../data/cleaned.jsonl'
+
+mongo_uri = 'mongodb://localhost:27017/'
+database_name = 'osm'
+collection_name = 'merindades'
+
+# Indexes created once the documents have been loaded (pos is the 2d index of the geospatial queries)
+default_indexes = [
+	[('pos', pymongo.GEO2D)],
+	[('type', pymongo.ASCENDING)],
+	[('amenity', pymongo.ASCENDING)],
+	[('place', pymongo.ASCENDING)],
+	[('created.user', pymongo.ASCENDING)]
+]
+
+# Collection of the current worker process (each worker has its own connection)
+worker_collection = None
+
+def init_worker(uri, database, collection):
+	global worker_collection
+	worker_collection = pymongo.MongoClient(uri)[database][collection]
+
+# Documents of a batch of JSON lines, with an _id built from the type and id of the element
+#    so a batch can be inserted again when resuming without duplicating documents
+def parse_batch(lines):
+	docs = []
+	for line in lines:
+		doc = json.loads(line)
+		doc['_id'] = '{}:{}'.format(doc['type'], doc['id'])
+		docs.append(doc)
+	return docs
+
+# Insert a batch with an unordered insert_many (ignoring the documents already inserted)
+#    returns (number of the batch, number of documents inserted)
+def insert_batch(args):
+	batch_number, lines = args
+	docs = parse_batch(lines)
+	try:
+		inserted = len(worker_collection.insert_many(docs, ordered=False).inserted_ids)
+	except BulkWriteError as e:
+		errors = e.details.get('writeErrors', [])
+		if any(error.get('code') != 11000 for error in errors):
+			raise
+		inserted = e.details.get('nInserted', 0)
+	return batch_number, inserted
+
+# Batches of lines of the JSON Lines document as (number of batch, lines), skipping the first skip_batches
+def read_batches(jsonl_path, batch_size, skip_batches=0):
+	batch_number = 0
+	lines = []
+	with open(jsonl_path) as jsonl_file:
+		for line in jsonl_file:
+			lines.append(line)
+			if len(lines) == batch_size:
+				if batch_number >= skip_batches:
+					yield batch_number, lines
+				batch_number += 1
+				lines = []
+	if lines and batch_number >= skip_batches:
+		yield batch_number, lines
+
+# Progress of a load: the first 'batches' batches of the file (identified by size and mtime) are loaded
+def progress_path(jsonl_path):
+	return jsonl_path + '.progress'
+
+def read_progress(jsonl_path, batch_size):
+	try:
+		with open(progress_path(jsonl_path)) as progress_file:
+			progress = json.load(progress_file)
+	except (IOError, ValueError):
+		return 0
+	stat = os.stat(jsonl_path)
+	if (progress.get('size'), progress.get('mtime'), progress.get('batch_size')) != (stat.st_size, stat.st_mtime, batch_size):
+		return 0
+	return progress['batches']
+
+def write_progress(jsonl_path, batch_size, batches):
+	stat = os.stat(jsonl_path)
+	tmp_path = progress_path(jsonl_path) + '.tmp'
+	with open(tmp_path, 'w') as progress_file:
+		json.dump({'size': stat.st_size, 'mtime': stat.st_mtime, 'batch_size': batch_size, 'batches': batches}, progress_file)
+	os.rename(tmp_path, progress_path(jsonl_path))
+
+# Load a JSON Lines document into a collection with a pool of worker connections
+#    batch_size: documents per insert_many
+#    workers: number of worker processes (one connection each)
+#    resume: skip the batches loaded by a previous (interrupted) run of the same file
+#    drop: drop the collection first (ignored when resuming)
+#    indexes: indexes to build after the load
+def load_jsonl(jsonl_path=jsonl_filename, uri=mongo_uri, database=database_name, collection=collection_name,
+			   batch_size=1000, workers=4, resume=True, drop=False, indexes=default_indexes):
+	skip_batches = read_progress(jsonl_path, batch_size) if resume else 0
+	if drop and not skip_batches:
+		client = pymongo.MongoClient(uri)
+		client[database].drop_collection(collection)
+		client.close()
+
+	inserted = 0
+	pool = multiprocessing.Pool(workers, init_worker, (uri, database, collection))
+	try:
+		# At most 2 batches per worker are read ahead; the results are collected in order,
+		# so every batch up to the last one collected has been loaded
+		pending = deque()
+		for batch in read_batches(jsonl_path, batch_size, skip_batches):
+			pending.append(pool.apply_async(insert_batch, (batch,)))
+			if len(pending) >= 2 * workers:
+				inserted += collect_batch(pending.popleft(), jsonl_path, batch_size)
+		while pending:
+			inserted += collect_batch(pending.popleft(), jsonl_path, batch_size)
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+
+	client = pymongo.MongoClient(uri)
+	for index in indexes:
+		client[database][collection].create_index(index)
+	client.close()
+
+	if os.path.exists(progress_path(jsonl_path)):
+		os.remove(progress_path(jsonl_path))
+	return inserted
+
+# Wait for the result of a batch and save the progress, returns the number of documents inserted
+def collect_batch(result, jsonl_path, batch_size):
+	batch_number, batch_inserted = result.get()
+	write_progress(jsonl_path, batch_size, batch_number + 1)
+	return batch_inserted
+
+if __name__ == '__main__':
+	print '{} documents inserted'.format(load_jsonl())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# On-disk store of the node positions (node id -> lon, lat), used to add geometry to the ways
+
+import heapq
+import json
+import mmap
+import os
+import struct
+
+from jsonl_writer import JSONLinesWriter
+from osm_reader import read_elements
+
+filename = '../data/file.osm'
+store_filename = '../data/nodes.store'
+
+# Every node is a fixed size record (id: int64, lon: float64, lat: float64) and the file is sorted by id
+record = struct.Struct('<qdd')
+node_id = struct.Struct('<q')
+
+# Write the node positions to a store file
+#    The records are sorted in buffers of buffer_size nodes; as long as the buffers come in order
+#    (OSM files are sorted by id) they are appended straight to the store, otherwise the sorted
+#    runs are merged on close, so memory stays bounded by the size of the buffer
+class NodeStoreWriter(object):
+
+	def __init__(self, path=store_filename, buffer_size=200000):
+		self.path = path
+		self.buffer_size = buffer_size
+		self.buffer = []
+		self.store = open(path + '.tmp', 'wb')
+		self.runs = []
+		self.last_id = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			self.abort()
+
+	def add(self, node_id, lon, lat):
+		self.buffer.append((node_id, lon, lat))
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	def flush(self):
+		if not self.buffer:
+			return
+		self.buffer.sort()
+		data = ''.join(record.pack(*node) for node in self.buffer)
+		if not self.runs and (self.last_id is None or self.buffer[0][0] > self.last_id):
+			self.store.write(data)
+		else:
+			run_path = '{}.run{}'.format(self.path, len(self.runs))
+			with open(run_path, 'wb') as run_file:
+				run_file.write(data)
+			self.runs.append(run_path)
+		self.last_id = self.buffer[-1][0]
+		self.buffer = []
+
+	def close(self):
+		self.flush()
+		self.store.close()
+		if self.runs:
+			self.merge_runs()
+		os.rename(self.path + '.tmp', self.path)
+
+	def abort(self):
+		self.buffer = []
+		self.store.close()
+		for path in [self.path + '.tmp'] + self.runs:
+			os.remove(path)
+
+	# Merge the records appended to the store with the sorted runs
+	def merge_runs(self):
+		os.rename(self.path + '.tmp', self.path + '.run')
+		runs = [self.path + '.run'] + self.runs
+		run_files = [open(path, 'rb') for path in runs]
+		try:
+			with open(self.path + '.tmp', 'wb') as store:
+				for node in heapq.merge(*[read_records(run_file) for run_file in run_files]):
+					store.write(record.pack(*node))
+		finally:
+			for run_file in run_files:
+				run_file.close()
+			for path in runs:
+				os.remove(path)
+
+# Records of a store (or run) file
+def read_records(store_file, chunk_records=4096):
+	while True:
+		data = store_file.read(record.size * chunk_records)
+		if not data:
+			break
+		for offset in xrange(0, len(data), record.size):
+			yield record.unpack_from(data, offset)
+
+# Read-only, memory-mapped node store: positions are found by binary search over the sorted ids
+class NodeStore(object):
+
+	def __init__(self, path=store_filename):
+		self.file = open(path, 'rb')
+		size = os.fstat(self.file.fileno()).st_size
+		self.count = size // record.size
+		self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else ''
+
+	def __len__(self):
+		return self.count
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def close(self):
+		if self.count:
+			self.data.close()
+		self.file.close()
+
+	# (lon, lat) of a node (None if it is not in the store)
+	def get(self, ref):
+		low, high = 0, self.count
+		while low < high:
+			middle = (low + high) // 2
+			if node_id.unpack_from(self.data, middle * record.size)[0] < ref:
+				low = middle + 1
+			else:
+				high = middle
+		if low < self.count:
+			found_id, lon, lat = record.unpack_from(self.data, low * record.size)
+			if found_id == ref:
+				return (lon, lat)
+		return None
+
+# Build the node store of an osm file
+def build_node_store(filename, path=store_filename):
+	with NodeStoreWriter(path) as writer:
+		for node in read_elements(filename, types=('node',)):
+			writer.add(node.id, float(node.attrs['lon']), float(node.attrs['lat']))
+
+# Add the geometry of a way document from its node_refs
+#    centroid: [lon, lat] mean of its nodes (the last one is not counted twice in closed ways)
+#    bbox: [min_lon, min_lat, max_lon, max_lat]
+#    coords: [[lon, lat], ...] of every node found in the store (only if coords is True)
+def add_way_geometry(doc, store, coords=False):
+	positions = []
+	# Refs of the positions (the nodes missing from the store are skipped)
+	found = []
+	for ref in doc.get('node_refs', []):
+		position = store.get(ref)
+		if position is not None:
+			positions.append(position)
+			found.append(ref)
+	if not positions:
+		return
+
+	unique = positions[:-1] if len(positions) > 1 and found[0] == found[-1] else positions
+	doc['centroid'] = [sum(p[0] for p in unique) / len(unique), sum(p[1] for p in unique) / len(unique)]
+	doc['bbox'] = [min(p[0] for p in positions), min(p[1] for p in positions),
+				   max(p[0] for p in positions), max(p[1] for p in positions)]
+	if coords:
+		doc['coords'] = [list(p) for p in positions]
+
+# Second stage: copy a cleaned JSON Lines document adding the geometry of the ways
+def attach_way_geometry(jsonl_path, output_path, path=store_filename, coords=False):
+	with NodeStore(path) as store:
+		with JSONLinesWriter(output_path) as writer:
+			with open(jsonl_path) as jsonl_file:
+				for line in jsonl_file:
+					doc = json.loads(line)
+					if doc.get('type') == 'way':
+						add_way_geometry(doc, store, coords)
+					writer.write(doc)
+
+if __name__ == '__main__':
+	build_node_store(filename)
+	attach_way_geometry('../data/cleaned.jsonl', '../data/cleaned_geometry.jsonl')
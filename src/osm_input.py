@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Transparent reading of compressed osm files (gzip, bzip2, xz), without decompressing them to disk
+#    The file is decompressed by a background thread that feeds the reader through a bounded queue of
+#    chunks, so decompression and parsing overlap and memory stays bounded. The multi-stream bzip2
+#    files (pbzip2, lbzip2, the planet dumps) are split at the stream headers and the streams are
+#    decompressed by a pool of threads (bz2 and zlib release the GIL). xz files are decompressed by an
+#    xz process, since Python 2 has no lzma module
+
+import bz2
+import multiprocessing
+import os
+import re
+import subprocess
+import threading
+import time
+import zlib
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from Queue import Queue, Empty, Full
+
+# Signature of each compression at the start of the file
+signatures = [
+	('gz', '\x1f\x8b'),
+	('bz2', 'BZh'),
+	('xz', '\xfd7zXZ\x00')
+]
+
+# Start of a bzip2 stream: header (block size 1-9) and magic of its first block
+bz2_stream_start = re.compile(r'BZh[1-9]1AY&SY')
+
+# Bytes of compressed data read at a time (and approximate size of the parallel bz2 segments)
+chunk_size = 1024 * 1024
+
+# Decompressed bytes kept before the current chunk, so the reader can seek back a little (up to that)
+seek_back = 64 * 1024
+
+# Compression of a file from its signature (None if it is not compressed)
+def compression(path):
+	with open(path, 'rb') as compressed_file:
+		start = compressed_file.read(6)
+	for name, signature in signatures:
+		if start.startswith(signature):
+			return name
+	return None
+
+# Open an osm file for reading, decompressing it on the fly if it is compressed
+#    processes: threads decompressing the multi-stream bz2 files (all the CPUs if None, 1 to decompress them sequentially)
+#    queue_size: decompressed chunks the background thread can be ahead of the reader
+#    returns a plain file if the file is not compressed and a DecompressedStream otherwise
+def open_osm(path, processes=None, queue_size=8):
+	kind = compression(path)
+	if kind is None:
+		return open(path, 'rb')
+	compressed_file = open(path, 'rb')
+	if kind == 'gz':
+		chunks = gz_chunks(compressed_file)
+	elif kind == 'bz2':
+		chunks = bz2_chunks(compressed_file, processes)
+	else:
+		chunks = xz_chunks(compressed_file)
+	return DecompressedStream(compressed_file, chunks, queue_size)
+
+# Read-only file-like object over the chunks decompressed by a background thread
+#    tell / seek work on the decompressed data: forward seeks skip data and backward seeks are only
+#    possible within the seek_back bytes before the current chunk
+#    raw_tell is the position within the compressed file (the progress of the decompression)
+#    chunks, thread_time, put_wait, get_wait: chunks decompressed, seconds the thread ran, seconds it waited
+#    for room in the queue and seconds the reader waited for a chunk (see clean_pipeline)
+class DecompressedStream(object):
+
+	def __init__(self, compressed_file, chunks, queue_size=8):
+		self.compressed_file = compressed_file
+		self.queue = Queue(queue_size)
+		self.buffer = ''
+		self.buffer_start = 0
+		self.offset = 0
+		self.finished = False
+		self.closed = False
+		self.chunks = 0
+		self.thread_time = 0.0
+		self.put_wait = 0.0
+		self.get_wait = 0.0
+		self.thread = threading.Thread(target=self.produce, args=(chunks,))
+		self.thread.daemon = True
+		self.thread.start()
+
+	# Body of the background thread: put the chunks in the queue, then None (or the exception raised)
+	def produce(self, chunks):
+		start = time.time()
+		try:
+			for chunk in chunks:
+				self.chunks += 1
+				if not self.put(chunk):
+					return
+			self.put(None)
+		except Exception as error:
+			self.put(error)
+		finally:
+			chunks.close()
+			self.thread_time = time.time() - start
+
+	# False if the stream was closed while waiting for room in the queue
+	def put(self, item):
+		start = time.time()
+		try:
+			while not self.closed:
+				try:
+					self.queue.put(item, timeout=0.1)
+					return True
+				except Full:
+					pass
+			return False
+		finally:
+			self.put_wait += time.time() - start
+
+	# Replace the buffer by the next chunk (keeping seek_back bytes of the previous one), False at the end
+	def next_chunk(self):
+		if self.finished:
+			return False
+		start = time.time()
+		chunk = self.queue.get()
+		self.get_wait += time.time() - start
+		if chunk is None:
+			self.finished = True
+			return False
+		if isinstance(chunk, Exception):
+			self.finished = True
+			raise chunk
+		kept = self.buffer[-seek_back:]
+		self.buffer_start += len(self.buffer) - len(kept)
+		self.offset -= len(self.buffer) - len(kept)
+		self.buffer = kept + chunk
+		return True
+
+	def read(self, size=-1):
+		if self.closed:
+			raise ValueError('I/O operation on closed file')
+		parts = []
+		while size != 0:
+			available = len(self.buffer) - self.offset
+			if available <= 0:
+				if not self.next_chunk():
+					break
+				continue
+			n = available if size < 0 else min(size, available)
+			parts.append(self.buffer[self.offset:self.offset + n])
+			self.offset += n
+			if size > 0:
+				size -= n
+		return ''.join(parts)
+
+	def readline(self):
+		parts = []
+		while True:
+			end = self.buffer.find('\n', self.offset)
+			if end >= 0:
+				parts.append(self.buffer[self.offset:end + 1])
+				self.offset = end + 1
+				break
+			parts.append(self.buffer[self.offset:])
+			self.offset = len(self.buffer)
+			if not self.next_chunk():
+				break
+		return ''.join(parts)
+
+	def __iter__(self):
+		while True:
+			line = self.readline()
+			if not line:
+				return
+			yield line
+
+	def tell(self):
+		return self.buffer_start + self.offset
+
+	def seek(self, position, whence=0):
+		if whence == 1:
+			position += self.tell()
+		elif whence != 0:
+			raise IOError('A compressed file can not be seeked from its end')
+		if position < self.buffer_start:
+			raise IOError('A compressed file can only be seeked back {} bytes'.format(seek_back))
+		while position > self.buffer_start + len(self.buffer):
+			self.offset = len(self.buffer)
+			if not self.next_chunk():
+				break
+		self.offset = min(position - self.buffer_start, len(self.buffer))
+
+	def raw_tell(self):
+		return os.lseek(self.compressed_file.fileno(), 0, os.SEEK_CUR)
+
+	def fileno(self):
+		return self.compressed_file.fileno()
+
+	def close(self):
+		if self.closed:
+			return
+		self.closed = True
+		# Unblock the thread if it is waiting for room in the queue
+		try:
+			while True:
+				self.queue.get_nowait()
+		except Empty:
+			pass
+		self.thread.join()
+		self.compressed_file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+# Decompressed chunks of a gzip file (of one or more members)
+def gz_chunks(compressed_file):
+	decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+	while True:
+		data = compressed_file.read(chunk_size)
+		if not data:
+			break
+		while data:
+			chunk = decompressor.decompress(data)
+			if chunk:
+				yield chunk
+			data = decompressor.unused_data
+			if data:
+				decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+	# A finished member leaves the data after it unused, a truncated one takes it as more compressed data
+	try:
+		decompressor.decompress('\x00')
+		finished = decompressor.unused_data == '\x00'
+	except zlib.error:
+		finished = False
+	if not finished:
+		raise IOError('Truncated gzip file')
+
+# Decompressed chunks of a bzip2 file, sequentially (of one or more streams)
+#    data: compressed data already read from the start of the file
+def bz2_sequential_chunks(compressed_file, data=''):
+	decompressor = bz2.BZ2Decompressor()
+	while True:
+		if not data:
+			data = compressed_file.read(chunk_size)
+			if not data:
+				break
+		chunk = decompressor.decompress(data)
+		if chunk:
+			yield chunk
+		data = decompressor.unused_data
+		if data:
+			decompressor = bz2.BZ2Decompressor()
+	# A finished stream does not take more data
+	try:
+		decompressor.decompress('')
+	except EOFError:
+		return
+	raise IOError('Truncated bzip2 file')
+
+# Decompressed chunks of a bzip2 file, decompressing its streams in parallel if it has several
+#    The file is split in segments of whole streams of about chunk_size bytes; a file without a second
+#    stream within its first chunk is decompressed sequentially
+def bz2_chunks(compressed_file, processes=None):
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	data = compressed_file.read(chunk_size)
+	if processes <= 1 or bz2_stream_start.search(data, 1) is None:
+		for chunk in bz2_sequential_chunks(compressed_file, data):
+			yield chunk
+		return
+
+	pool = ThreadPool(processes)
+	try:
+		pending = deque()
+		results = bz2_results(bz2_segments(compressed_file, data), pool, pending, 2 * processes)
+		for chunk in join_bz2_segments(results):
+			yield chunk
+	finally:
+		pool.terminate()
+		pool.join()
+
+# Raw segments of a multi-stream bzip2 file, each ending where a stream starts
+#    A segment may end at a false stream start (the pattern within the compressed data): join_bz2_segments merges it with the next one
+def bz2_segments(compressed_file, data):
+	while True:
+		more = compressed_file.read(chunk_size)
+		data += more
+		cut = None
+		for match in bz2_stream_start.finditer(data, 1):
+			cut = match.start()
+		if not more:
+			if data:
+				yield data
+			return
+		if cut is not None:
+			yield data[:cut]
+			data = data[cut:]
+
+# (segment, result of its decompression) of the segments, with at most ahead of them being decompressed
+def bz2_results(segments, pool, pending, ahead):
+	for segment in segments:
+		pending.append((segment, pool.apply_async(decompress_bz2_segment, (segment,))))
+		if len(pending) >= ahead:
+			yield pending.popleft()
+	while pending:
+		yield pending.popleft()
+
+# Decompressed data of a segment of whole bzip2 streams: (data, True), (data, False) if the last stream is
+# incomplete and (None, False) if the segment does not start with a stream
+def decompress_bz2_segment(segment):
+	parts = []
+	while segment:
+		decompressor = bz2.BZ2Decompressor()
+		try:
+			parts.append(decompressor.decompress(segment))
+		except IOError:
+			return None, False
+		segment = decompressor.unused_data
+		if not segment:
+			try:
+				decompressor.decompress('')
+			except EOFError:
+				break
+			return ''.join(parts), False
+	return ''.join(parts), True
+
+# Decompressed data of the segments in order, merging the ones split at a false stream start
+def join_bz2_segments(results):
+	carry = None
+	for segment, result in results:
+		if carry is None:
+			data, complete = result.get()
+		else:
+			carry += segment
+			data, complete = decompress_bz2_segment(carry)
+		if data is None:
+			raise IOError('Invalid bzip2 data')
+		if complete:
+			carry = None
+			yield data
+		elif carry is None:
+			carry = segment
+	if carry is not None:
+		raise IOError('Truncated bzip2 file')
+
+# Decompressed chunks of an xz file, from an xz process reading the file
+#    Its position in the compressed file is the one of the shared file descriptor (for raw_tell)
+def xz_chunks(compressed_file):
+	compressed_file.seek(0)
+	try:
+		process = subprocess.Popen(['xz', '--decompress', '--stdout'], stdin=compressed_file, stdout=subprocess.PIPE)
+	except OSError:
+		raise IOError('Reading xz files needs the xz command')
+	try:
+		while True:
+			chunk = process.stdout.read(chunk_size)
+			if not chunk:
+				break
+			yield chunk
+		if process.wait() != 0:
+			raise IOError('xz exited with code {}'.format(process.returncode))
+	finally:
+		if process.poll() is None:
+			process.kill()
+			process.wait()
+		process.stdout.close()
@@ -0,0 +1,556 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Reader (and writer, to build fixtures) of the OSM PBF format, in pure Python: the protocol buffers
+# messages of the format (osmformat.proto / fileformat.proto) are decoded by hand
+#    The file is a sequence of blobs (4 bytes length, BlobHeader, Blob): an OSMHeader one and then
+#    OSMData ones, each a zlib compressed PrimitiveBlock with its string table and groups of dense
+#    nodes, nodes, ways or relations. The blobs are decoded by a pool of processes and the records
+#    yielded in file order are the same ones (osm_reader.OSMElement) the XML backends yield
+
+import calendar
+import multiprocessing
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import deque
+
+from osm_reader import OSMElement, from_utf8, read_elements
+
+# Features of the OSMHeader this reader supports
+supported_features = ('OsmSchema-V0.6', 'DenseNodes', 'HistoricalInformation')
+
+# Limits of the format for the BlobHeader and the (uncompressed) Blob
+max_header_size = 64 * 1024
+max_blob_size = 32 * 1024 * 1024
+
+member_types = ('node', 'way', 'relation')
+
+# Numeric fields of the Info message and their attributes
+info_attributes = {1: 'version', 2: 'timestamp', 3: 'changeset', 4: 'uid'}
+
+# Protocol buffers decoding
+#    The messages are bytearrays (indexing them gives ints) and are decoded between offsets, without slicing
+
+# Varint starting at pos, returns (value, next position)
+def read_varint(data, pos):
+	byte = data[pos]
+	if byte < 128:
+		return byte, pos + 1
+	result = byte & 0x7f
+	shift = 7
+	while True:
+		pos += 1
+		byte = data[pos]
+		result |= (byte & 0x7f) << shift
+		if byte < 128:
+			return result, pos + 1
+		shift += 7
+
+# Signed value of an int32 / int64 field (negative numbers are encoded as 64 bit two's complement)
+def to_signed(value):
+	return value - (1 << 64) if value >= (1 << 63) else value
+
+def zigzag(value):
+	return (value >> 1) ^ -(value & 1)
+
+# Fields of a message between start and end as (field number, value), where value is an int for the
+# varint fields and (start, end) offsets for the length-delimited ones
+def iter_fields(data, start, end):
+	pos = start
+	while pos < end:
+		key, pos = read_varint(data, pos)
+		field, wire_type = key >> 3, key & 7
+		if wire_type == 0:
+			value, pos = read_varint(data, pos)
+		elif wire_type == 2:
+			length, pos = read_varint(data, pos)
+			value = (pos, pos + length)
+			pos += length
+		elif wire_type == 1:
+			value = struct.unpack_from('<q', buffer(data), pos)[0]
+			pos += 8
+		elif wire_type == 5:
+			value = struct.unpack_from('<i', buffer(data), pos)[0]
+			pos += 4
+		else:
+			raise ValueError('Unsupported protocol buffers wire type {}'.format(wire_type))
+		yield field, value
+
+# Values of a packed repeated varint field
+def read_packed(data, start, end):
+	values = []
+	append = values.append
+	pos = start
+	while pos < end:
+		byte = data[pos]
+		pos += 1
+		if byte < 128:
+			append(byte)
+			continue
+		result = byte & 0x7f
+		shift = 7
+		while True:
+			byte = data[pos]
+			pos += 1
+			result |= (byte & 0x7f) << shift
+			if byte < 128:
+				break
+			shift += 7
+		append(result)
+	return values
+
+# Values of a packed sint field stored as deltas (zigzag encoded)
+def read_packed_delta(data, start, end):
+	values = []
+	append = values.append
+	last = 0
+	for value in read_packed(data, start, end):
+		last += (value >> 1) ^ -(value & 1)
+		append(last)
+	return values
+
+def read_string(data, span):
+	return str(data[span[0]:span[1]])
+
+# File format
+
+# Raw (header type, blob data) of every blob of the file
+def read_blobs(osm_file):
+	while True:
+		size = osm_file.read(4)
+		if not size:
+			return
+		if len(size) < 4:
+			raise ValueError('Truncated PBF file (incomplete blob header length)')
+		header_size = struct.unpack('>I', size)[0]
+		if header_size > max_header_size:
+			raise ValueError('Blob header of {} bytes (the maximum is {})'.format(header_size, max_header_size))
+		header = bytearray(osm_file.read(header_size))
+		blob_type, data_size = None, None
+		for field, value in iter_fields(header, 0, len(header)):
+			if field == 1:
+				blob_type = read_string(header, value)
+			elif field == 3:
+				data_size = value
+		if blob_type is None or data_size is None:
+			raise ValueError('Wrong blob header (without type or size)')
+		if data_size > max_blob_size:
+			raise ValueError('Blob of {} bytes (the maximum is {})'.format(data_size, max_blob_size))
+		blob = osm_file.read(data_size)
+		if len(blob) < data_size:
+			raise ValueError('Truncated PBF file (incomplete blob)')
+		yield blob_type, blob
+
+# Uncompressed data of a Blob message
+def blob_data(blob):
+	blob = bytearray(blob)
+	for field, value in iter_fields(blob, 0, len(blob)):
+		if field == 1:
+			return bytearray(blob[value[0]:value[1]])
+		elif field == 3:
+			return bytearray(zlib.decompress(buffer(blob, value[0], value[1] - value[0])))
+		elif field in (4, 6, 7):
+			raise ValueError('Unsupported blob compression (lzma, lz4 or zstd), only raw and zlib blobs can be read')
+	raise ValueError('Blob without data')
+
+# Check the required features of an OSMHeader blob
+def check_header(blob):
+	data = blob_data(blob)
+	for field, value in iter_fields(data, 0, len(data)):
+		if field == 4:
+			feature = read_string(data, value)
+			if feature not in supported_features:
+				raise ValueError('The PBF file requires an unsupported feature: {}'.format(feature))
+
+# The file starts with an OSMHeader blob
+def is_pbf(osm_file):
+	if isinstance(osm_file, basestring):
+		with open(osm_file, 'rb') as opened_file:
+			return is_pbf(opened_file)
+	try:
+		position = osm_file.tell()
+		start = osm_file.read(15)
+		osm_file.seek(position)
+	except (AttributeError, IOError, ValueError):
+		return False
+	return start[4:15] == '\x0a\x09OSMHeader'
+
+# Decoding of a PrimitiveBlock
+
+# Block properties: string table, granularity and offsets
+class BlockContext(object):
+
+	def __init__(self, data):
+		self.strings = []
+		self.granularity = 100
+		self.lat_offset = 0
+		self.lon_offset = 0
+		self.date_granularity = 1000
+		self.groups = []
+		for field, value in iter_fields(data, 0, len(data)):
+			if field == 1:
+				self.strings = [from_utf8(str(data[s:e])) for f, (s, e) in iter_fields(data, value[0], value[1]) if f == 1]
+			elif field == 2:
+				self.groups.append(value)
+			elif field == 17:
+				self.granularity = value
+			elif field == 18:
+				self.date_granularity = value
+			elif field == 19:
+				self.lat_offset = to_signed(value)
+			elif field == 20:
+				self.lon_offset = to_signed(value)
+
+	def coordinate(self, offset, value):
+		return '{:.7f}'.format((offset + self.granularity * value) * 1e-9)
+
+	def timestamp(self, value):
+		return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(value * self.date_granularity // 1000))
+
+# Attributes of an element from its Info message
+#    The metadata missing from the file (the extracts without user data have no user, uid or changeset)
+#    is either not written or written as 0 (the empty string for the user, 0 is its index in the string
+#    table), so as the osm tools do the attributes with those values are left unset, like the
+#    attributes missing from an XML file (a uid 0 is only kept with a user)
+def read_info(data, start, end, block, attrs):
+	for field, value in iter_fields(data, start, end):
+		if field == 6:
+			attrs['visible'] = 'true' if value else 'false'
+		elif field == 5:
+			if value:
+				attrs['user'] = block.strings[value]
+		elif field in info_attributes:
+			value = to_signed(value)
+			if value or field == 4:
+				attrs[info_attributes[field]] = block.timestamp(value) if field == 2 else str(value)
+	if attrs.get('uid') == '0' and 'user' not in attrs:
+		del attrs['uid']
+
+def read_dense_nodes(data, start, end, block):
+	ids, lats, lons, keys_vals = [], [], [], []
+	info = {}
+	for field, value in iter_fields(data, start, end):
+		if field == 1:
+			ids = read_packed_delta(data, *value)
+		elif field == 5:
+			for info_field, info_value in iter_fields(data, *value):
+				if info_field == 1:
+					info['version'] = [to_signed(v) for v in read_packed(data, *info_value)]
+				elif info_field in (2, 3, 4, 5):
+					info[info_field] = read_packed_delta(data, *info_value)
+				elif info_field == 6:
+					info['visible'] = read_packed(data, *info_value)
+		elif field == 8:
+			lats = read_packed_delta(data, *value)
+		elif field == 9:
+			lons = read_packed_delta(data, *value)
+		elif field == 10:
+			keys_vals = read_packed(data, *value)
+
+	strings = block.strings
+	kv = 0
+	nodes = []
+	# The missing metadata is left unset (see read_info)
+	for i, node_id in enumerate(ids):
+		attrs = {'id': str(node_id), 'lat': block.coordinate(block.lat_offset, lats[i]), 'lon': block.coordinate(block.lon_offset, lons[i])}
+		if 'version' in info and info['version'][i]:
+			attrs['version'] = str(info['version'][i])
+		if 2 in info and info[2][i]:
+			attrs['timestamp'] = block.timestamp(info[2][i])
+		if 3 in info and info[3][i]:
+			attrs['changeset'] = str(info[3][i])
+		if 4 in info and (info[4][i] or 5 in info and info[5][i]):
+			attrs['uid'] = str(info[4][i])
+		if 5 in info and info[5][i]:
+			attrs['user'] = strings[info[5][i]]
+		if 'visible' in info:
+			attrs['visible'] = 'true' if info['visible'][i] else 'false'
+		tags = []
+		if keys_vals:
+			while keys_vals[kv] != 0:
+				tags.append((strings[keys_vals[kv]], strings[keys_vals[kv + 1]]))
+				kv += 2
+			kv += 1
+		nodes.append(OSMElement('node', attrs, tags))
+	return nodes
+
+# Fields shared by Node, Way and Relation: id (1), keys (2), vals (3) and info (4)
+def read_common(data, field, value, block, attrs, keys_vals):
+	if field == 1:
+		attrs['id'] = str(zigzag(value) if keys_vals.get('zigzag_id') else to_signed(value))
+	elif field == 2:
+		keys_vals['keys'] = read_packed(data, *value)
+	elif field == 3:
+		keys_vals['vals'] = read_packed(data, *value)
+	elif field == 4:
+		read_info(data, value[0], value[1], block, attrs)
+
+def tags_of(block, keys_vals):
+	strings = block.strings
+	return [(strings[k], strings[v]) for k, v in zip(keys_vals.get('keys', ()), keys_vals.get('vals', ()))]
+
+def read_node(data, start, end, block):
+	attrs = {}
+	keys_vals = {'zigzag_id': True}
+	lat = lon = 0
+	for field, value in iter_fields(data, start, end):
+		if field == 8:
+			lat = zigzag(value)
+		elif field == 9:
+			lon = zigzag(value)
+		else:
+			read_common(data, field, value, block, attrs, keys_vals)
+	attrs['lat'] = block.coordinate(block.lat_offset, lat)
+	attrs['lon'] = block.coordinate(block.lon_offset, lon)
+	return OSMElement('node', attrs, tags_of(block, keys_vals))
+
+def read_way(data, start, end, block):
+	attrs = {}
+	keys_vals = {}
+	refs = array('l')
+	for field, value in iter_fields(data, start, end):
+		if field == 8:
+			refs = array('l', read_packed_delta(data, *value))
+		else:
+			read_common(data, field, value, block, attrs, keys_vals)
+	return OSMElement('way', attrs, tags_of(block, keys_vals), refs)
+
+def read_relation(data, start, end, block):
+	attrs = {}
+	keys_vals = {}
+	roles, memids, types = [], [], []
+	for field, value in iter_fields(data, start, end):
+		if field == 8:
+			roles = read_packed(data, *value)
+		elif field == 9:
+			memids = read_packed_delta(data, *value)
+		elif field == 10:
+			types = read_packed(data, *value)
+		else:
+			read_common(data, field, value, block, attrs, keys_vals)
+	members = [(member_types[t], ref, block.strings[role]) for t, ref, role in zip(types, memids, roles)]
+	return OSMElement('relation', attrs, tags_of(block, keys_vals), members=members)
+
+# Records of the elements of an OSMData blob whose type is in types (None for all of them)
+#    The groups of unwanted types are skipped without decoding them
+def decode_blob(args):
+	blob, types = args
+	data = blob_data(blob)
+	block = BlockContext(data)
+	records = []
+	for start, end in block.groups:
+		for field, (s, e) in iter_fields(data, start, end):
+			if field == 2 and (types is None or 'node' in types):
+				records.extend(read_dense_nodes(data, s, e, block))
+			elif field == 1 and (types is None or 'node' in types):
+				records.append(read_node(data, s, e, block))
+			elif field == 3 and (types is None or 'way' in types):
+				records.append(read_way(data, s, e, block))
+			elif field == 4 and (types is None or 'relation' in types):
+				records.append(read_relation(data, s, e, block))
+	return records
+
+# Yield the records of the elements of a PBF file whose type is in types, in file order
+#    processes: processes decoding the blobs (all the CPUs if None, in this process if 0 or 1); at most
+#               2 blobs per process are read ahead, so memory stays bounded
+#    With types=None a bare record of the root element (osm) is yielded at the end, as the XML backends do
+def iter_pbf(osm_file, types=('node', 'way', 'relation'), processes=None):
+	if isinstance(osm_file, basestring):
+		with open(osm_file, 'rb') as opened_file:
+			for record in iter_pbf(opened_file, types, processes):
+				yield record
+		return
+
+	blobs = read_blobs(osm_file)
+	for blob_type, blob in blobs:
+		if blob_type != 'OSMHeader':
+			raise ValueError('The PBF file does not start with an OSMHeader blob')
+		check_header(blob)
+		break
+	data_blobs = ((blob, types) for blob_type, blob in blobs if blob_type == 'OSMData')
+
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	if processes <= 1:
+		for args in data_blobs:
+			for record in decode_blob(args):
+				yield record
+	else:
+		pool = multiprocessing.Pool(processes)
+		try:
+			pending = deque()
+			for args in data_blobs:
+				pending.append(pool.apply_async(decode_blob, (args,)))
+				if len(pending) >= 2 * processes:
+					for record in pending.popleft().get():
+						yield record
+			while pending:
+				for record in pending.popleft().get():
+					yield record
+			pool.close()
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+
+	if types is None:
+		yield OSMElement('osm', {})
+
+# Writer (used to build PBF fixtures from XML files)
+
+def encode_varint(value):
+	if value < 0:
+		value += 1 << 64
+	out = bytearray()
+	while value >= 128:
+		out.append((value & 0x7f) | 0x80)
+		value >>= 7
+	out.append(value)
+	return out
+
+def encode_zigzag(value):
+	return (value << 1) ^ (value >> 63)
+
+def encode_field(field, value):
+	return encode_varint(field << 3) + encode_varint(value)
+
+def encode_bytes(field, data):
+	return encode_varint((field << 3) | 2) + encode_varint(len(data)) + data
+
+def encode_packed(field, values):
+	data = bytearray()
+	for value in values:
+		data += encode_varint(value)
+	return encode_bytes(field, data)
+
+def encode_packed_delta(field, values):
+	last = 0
+	deltas = []
+	for value in values:
+		deltas.append(encode_zigzag(value - last))
+		last = value
+	return encode_packed(field, deltas)
+
+def encode_blob(blob_type, data):
+	blob = encode_field(2, len(data)) + encode_bytes(3, bytearray(zlib.compress(str(data))))
+	header = encode_bytes(1, bytearray(blob_type)) + encode_field(3, len(blob))
+	return struct.pack('>I', len(header)) + str(header) + str(blob)
+
+def to_utf8(text):
+	return text.encode('utf-8') if isinstance(text, unicode) else text
+
+# Seconds since the epoch of an OSM timestamp (None if it has another format)
+def parse_timestamp(timestamp):
+	try:
+		return calendar.timegm(time.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ'))
+	except (TypeError, ValueError):
+		return None
+
+# PrimitiveBlock with one group of the elements (all of the same type)
+def encode_block(element_type, elements):
+	strings = {'': 0}
+
+	def sid(text):
+		return strings.setdefault(to_utf8(text), len(strings))
+
+	def info(attrs):
+		data = bytearray()
+		if 'version' in attrs:
+			data += encode_field(1, int(attrs['version']))
+		if 'timestamp' in attrs:
+			data += encode_field(2, parse_timestamp(attrs['timestamp']) or 0)
+		if 'changeset' in attrs:
+			data += encode_field(3, int(attrs['changeset']))
+		if 'uid' in attrs:
+			data += encode_field(4, int(attrs['uid']))
+		if 'user' in attrs:
+			data += encode_field(5, sid(attrs['user']))
+		if 'visible' in attrs:
+			data += encode_field(6, 1 if attrs['visible'] == 'true' else 0)
+		return data
+
+	group = bytearray()
+	if element_type == 'node':
+		dense_info = dict((f, []) for f in (1, 2, 3, 4, 5, 6))
+		keys_vals = []
+		for node in elements:
+			attrs = node.attrs
+			dense_info[1].append(int(attrs.get('version', 0)))
+			dense_info[2].append(parse_timestamp(attrs.get('timestamp')) or 0)
+			dense_info[3].append(int(attrs.get('changeset', 0)))
+			dense_info[4].append(int(attrs.get('uid', 0)))
+			dense_info[5].append(sid(attrs.get('user', '')))
+			dense_info[6].append(1 if attrs.get('visible', 'true') == 'true' else 0)
+			for k, v in node.tags:
+				keys_vals.extend((sid(k), sid(v)))
+			keys_vals.append(0)
+		info_data = encode_packed(1, dense_info[1])
+		for f in (2, 3, 4, 5):
+			info_data += encode_packed_delta(f, dense_info[f])
+		if any('visible' in node.attrs for node in elements):
+			info_data += encode_packed(6, dense_info[6])
+		dense = encode_packed_delta(1, [node.id for node in elements]) + encode_bytes(5, info_data)
+		dense += encode_packed_delta(8, [int(round(float(node.attrs['lat']) * 1e7)) for node in elements])
+		dense += encode_packed_delta(9, [int(round(float(node.attrs['lon']) * 1e7)) for node in elements])
+		if any(node.tags for node in elements):
+			dense += encode_packed(10, keys_vals)
+		group += encode_bytes(2, dense)
+	else:
+		for element in elements:
+			message = encode_field(1, element.id)
+			message += encode_packed(2, [sid(k) for k, v in element.tags])
+			message += encode_packed(3, [sid(v) for k, v in element.tags])
+			message += encode_bytes(4, info(element.attrs))
+			if element_type == 'way':
+				message += encode_packed_delta(8, element.refs)
+				group += encode_bytes(3, message)
+			else:
+				message += encode_packed(8, [sid(role) for t, ref, role in element.members])
+				message += encode_packed_delta(9, [ref for t, ref, role in element.members])
+				message += encode_packed(10, [member_types.index(t) for t, ref, role in element.members])
+				group += encode_bytes(4, message)
+
+	table = bytearray()
+	for text, i in sorted(strings.iteritems(), key=lambda item: item[1]):
+		table += encode_bytes(1, bytearray(text))
+	return encode_bytes(1, table) + encode_bytes(2, group)
+
+# Write records (nodes, ways and relations) to a PBF file, block_size elements per block
+def write_pbf(elements, path, block_size=8000):
+	header = bytearray()
+	for feature in ('OsmSchema-V0.6', 'DenseNodes'):
+		header += encode_bytes(4, bytearray(feature))
+	header += encode_bytes(16, bytearray('osm_pbf.py'))
+
+	with open(path, 'wb') as output:
+		output.write(encode_blob('OSMHeader', header))
+		block_type, block = None, []
+		for element in elements:
+			if element.type not in member_types:
+				continue
+			if block and (element.type != block_type or len(block) >= block_size):
+				output.write(encode_blob('OSMData', encode_block(block_type, block)))
+				block = []
+			block_type = element.type
+			block.append(element)
+		if block:
+			output.write(encode_blob('OSMData', encode_block(block_type, block)))
+
+# Convert an osm XML file to PBF
+def xml_to_pbf(osm_path, pbf_path, block_size=8000):
+	write_pbf(read_elements(osm_path), pbf_path, block_size)
+
+if __name__ == '__main__':
+	# python osm_pbf.py file.osm file.osm.pbf: convert an XML file (to build fixtures)
+	# python osm_pbf.py file.osm.pbf: count the elements of a PBF file
+	if len(sys.argv) == 3:
+		xml_to_pbf(sys.argv[1], sys.argv[2])
+	else:
+		counts = {}
+		for element in iter_pbf(sys.argv[1] if len(sys.argv) > 1 else '../data/file.osm.pbf'):
+			counts[element.type] = counts.get(element.type, 0) + 1
+		print counts
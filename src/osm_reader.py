@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import xml.etree.cElementTree as ET
+import xml.parsers.expat
+from array import array
+
+from osm_input import open_osm
+
+try:
+	from lxml import etree as lxml_etree
+except ImportError:
+	lxml_etree = None
+
+# Yield the finished top-level elements (children of the root) of the osm file whose tag is in tags
+#    Nested children (nd, tag, member) are complete when the element is yielded, and every
+#    top-level element is cleared from the tree once it has been consumed, so memory stays
+#    bounded whatever the size of the file.
+#    With tags=None every top-level element is yielded, followed by the (already emptied) root element.
+def get_element(osm_file, tags=('node', 'way', 'relation')):
+	context = ET.iterparse(osm_file, events=('start', 'end'))
+	_, root = next(context)
+	depth = 1
+	for event, elem in context:
+		if event == 'start':
+			depth += 1
+			continue
+		depth -= 1
+		if depth == 1:
+			if tags is None or elem.tag in tags:
+				yield elem
+			root.clear()
+	if tags is None:
+		yield root
+
+# Same kind of strings as ElementTree: str for ASCII text, unicode otherwise
+def to_str(text):
+	try:
+		return text.encode('ascii')
+	except UnicodeError:
+		return text
+
+non_ascii = re.compile(r'[\x80-\xff]').search
+
+# UTF-8 text as ElementTree returns it: str if it is ASCII, unicode otherwise
+def from_utf8(text):
+	return text.decode('utf-8') if non_ascii(text) else text
+
+# Attribute value escaped as ElementTree does
+def escape_attrib(value):
+	value = unicode(value) if not isinstance(value, basestring) else value
+	if '&' in value:
+		value = value.replace('&', '&amp;')
+	if '<' in value:
+		value = value.replace('<', '&lt;')
+	if '>' in value:
+		value = value.replace('>', '&gt;')
+	if '"' in value:
+		value = value.replace('"', '&quot;')
+	if '\n' in value:
+		value = value.replace('\n', '&#10;')
+	return value
+
+# Compact record of a top-level element of the osm file (what the parser backends yield)
+#    type: tag of the element (node, way, relation... or osm for the root element)
+#    id: id of the element as an int (None if it has not any)
+#    attrs: {attribute: value} as written in the file (so attrs['id'] is the id as a string)
+#    tags: list of (k, v) tuples of its tag children, in document order
+#    refs: node references of its nd children (an array of 64 bit ints, typecode 'l' since Python 2 has no 'q')
+#    members: list of (type, ref, role) tuples of its member children
+#    offset: byte offset of the start of the element within the parsed data (None if the backend does not know it)
+class OSMElement(object):
+	__slots__ = ('type', 'id', 'attrs', 'tags', 'refs', 'members', 'offset')
+
+	def __init__(self, type, attrs, tags=None, refs=None, members=None, offset=None):
+		self.type = type
+		self.attrs = attrs
+		self.id = int(attrs['id']) if 'id' in attrs else None
+		self.tags = tags if tags is not None else []
+		self.refs = refs if refs is not None else array('l')
+		self.members = members if members is not None else []
+		self.offset = offset
+
+	# Pickled as its constructor arguments (much faster than the generic pickling of __slots__ classes,
+	# it matters sending the records decoded by other processes)
+	def __reduce__(self):
+		return OSMElement, (self.type, self.attrs, self.tags, self.refs, self.members, self.offset)
+
+	def __repr__(self):
+		return '<OSMElement {} {}>'.format(self.type, self.id)
+
+	# XML of the element, like ElementTree.tostring (sorted attributes, characters outside the encoding as references)
+	def to_xml(self, encoding='us-ascii'):
+		children = []
+		for ref in self.refs:
+			children.append('<nd ref="{}" />'.format(ref))
+		for member_type, ref, role in self.members:
+			children.append(u'<member ref="{}" role="{}" type="{}" />'.format(ref, escape_attrib(role), escape_attrib(member_type)))
+		for k, v in self.tags:
+			children.append(u'<tag k="{}" v="{}" />'.format(escape_attrib(k), escape_attrib(v)))
+
+		attrs = u''.join(u' {}="{}"'.format(name, escape_attrib(self.attrs[name])) for name in sorted(self.attrs))
+		if children:
+			xml = u'<{0}{1}>\n    {2}\n  </{0}>'.format(self.type, attrs, u'\n    '.join(children))
+		else:
+			xml = u'<{}{} />'.format(self.type, attrs)
+		return xml.encode(encoding, 'xmlcharrefreplace')
+
+# Record of an ElementTree (or lxml) element
+def from_etree(elem):
+	tags = []
+	refs = array('l')
+	members = []
+	for child in elem:
+		if child.tag == 'tag':
+			tags.append((child.attrib['k'], child.attrib['v']))
+		elif child.tag == 'nd':
+			refs.append(int(child.attrib['ref']))
+		elif child.tag == 'member':
+			members.append((child.attrib['type'], int(child.attrib['ref']), child.attrib['role']))
+	return OSMElement(elem.tag, dict(elem.attrib), tags, refs, members)
+
+# ElementTree backend: the elements of get_element converted to records
+def iter_etree(osm_file, types):
+	for elem in get_element(osm_file, types):
+		yield from_etree(elem)
+
+# expat backend: the records are built straight from the parser callbacks (no Element objects)
+#    Only the start of the elements is handled: nd, tag and member are always children of the element
+#    being built, any other element is the root (the first one) or a top-level one, which finishes the previous one
+#    The parser returns UTF-8 str and only the (few) values with non-ASCII characters are decoded, so
+#    the records hold the same kind of strings as the ElementTree ones
+#    The records have the offset of their element (the only backend that sets it)
+#    chunk_size: bytes fed to the parser at a time; the records finished within a chunk are yielded after it
+def iter_expat(osm_file, types, chunk_size=64 * 1024):
+	if isinstance(osm_file, basestring):
+		with open(osm_file, 'rb') as opened_file:
+			for record in iter_expat(opened_file, types, chunk_size):
+				yield record
+		return
+
+	parser = xml.parsers.expat.ParserCreate()
+	parser.returns_unicode = False
+	finished = []
+	# [record being built (None if its type is not wanted), root element name]
+	state = [None, None]
+
+	def start(name, attrs):
+		if name == 'nd':
+			if state[0] is not None:
+				state[0].refs.append(int(attrs['ref']))
+		elif name == 'tag':
+			if state[0] is not None:
+				state[0].tags.append((from_utf8(attrs['k']), from_utf8(attrs['v'])))
+		elif name == 'member':
+			if state[0] is not None:
+				state[0].members.append((attrs['type'], int(attrs['ref']), from_utf8(attrs['role'])))
+		elif state[1] is None:
+			state[1] = name
+		else:
+			if state[0] is not None:
+				finished.append(state[0])
+			if types is None or name in types:
+				if non_ascii(''.join(attrs.itervalues())):
+					attrs = dict((attr, from_utf8(value)) for attr, value in attrs.iteritems())
+				state[0] = OSMElement(name, attrs, offset=parser.CurrentByteIndex)
+			else:
+				state[0] = None
+
+	parser.StartElementHandler = start
+
+	while True:
+		data = osm_file.read(chunk_size)
+		parser.Parse(data, not data)
+		if not data and state[0] is not None:
+			finished.append(state[0])
+		for record in finished:
+			yield record
+		del finished[:]
+		if not data:
+			break
+
+	if types is None and state[1] is not None:
+		yield OSMElement(state[1], {})
+
+# lxml backend: iterparse filtered by tag (only the wanted elements reach Python)
+def iter_lxml(osm_file, types):
+	if lxml_etree is None:
+		raise ImportError('The lxml backend needs lxml installed')
+	context = lxml_etree.iterparse(osm_file, events=('end',), tag=types)
+	root = None
+	for _, elem in context:
+		parent = elem.getparent()
+		if parent is None:
+			root = elem
+			continue
+		if parent.getparent() is not None:
+			continue
+		yield from_etree(elem)
+		# Free the element and every previous sibling (the ones filtered out as well)
+		elem.clear()
+		while elem.getprevious() is not None:
+			del parent[0]
+	if types is None and root is not None:
+		yield OSMElement(root.tag, {})
+
+# PBF backend (osm_pbf imports this module, so it is imported when used)
+def iter_pbf(osm_file, types):
+	import osm_pbf
+	return osm_pbf.iter_pbf(osm_file, types)
+
+backends = {
+	'etree': iter_etree,
+	'expat': iter_expat,
+	'lxml': iter_lxml,
+	'pbf': iter_pbf
+}
+
+# Backend used when none is given (for the XML files, the PBF ones are detected)
+default_backend = 'expat'
+
+# Yield the records (OSMElement) of the top-level elements of the osm file whose type is in types
+#    Same semantics as get_element (with types=None every top-level element is yielded, followed by a
+#    bare record of the root element, without attributes or children), whatever the backend
+#    osm_file: path (of a plain or compressed file, see osm_input.open_osm) or file object
+#    backend: 'etree', 'expat', 'lxml' (needs lxml installed) or 'pbf' (PBF files); if None, 'pbf'
+#             for the PBF files (a path or a seekable file) and default_backend for the others
+def read_elements(osm_file, types=('node', 'way', 'relation'), backend=None):
+	if isinstance(osm_file, basestring):
+		return read_path(osm_file, types, backend)
+	if backend is None:
+		import osm_pbf
+		backend = 'pbf' if osm_pbf.is_pbf(osm_file) else default_backend
+	if backend not in backends:
+		raise ValueError('Unknown parser backend {!r} (expected one of {})'.format(backend, ', '.join(sorted(backends))))
+	return backends[backend](osm_file, types)
+
+def read_path(path, types, backend):
+	with open_osm(path) as osm_file:
+		for record in read_elements(osm_file, types, backend):
+			yield record
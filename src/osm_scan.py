@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Summary statistics of an osm file straight from its bytes, without parsing it: the counts of
+# count_elements, count_tags and the users of unique_users (audit_keys_basic)
+#    The file is mapped in memory (mmap) and split in chunks at a '<' (which always starts a markup in
+#    XML, so no element is cut), scanned in parallel by a pool of processes with str.count and compiled
+#    regexes; only the distinct keys and users are decoded at the end
+#    The scan assumes the XML of the osm tools (no comments or CDATA sections with markup, tag
+#    elements only within nodes, ways and relations); verify compares it with the auditors
+#    Compressed files (osm_input.open_osm) can not be mapped and are scanned sequentially as they are decompressed
+
+import mmap
+import multiprocessing
+import os
+import re
+import sys
+
+from osm_input import compression, open_osm
+from osm_reader import from_utf8
+
+filename = '../data/file.osm'
+
+# Bytes scanned by each task (the file is split in at least one chunk per process)
+chunk_size = 32 * 1024 * 1024
+
+# Elements counted with str.count (none of them is a prefix of another)
+frequent_elements = ('node', 'way', 'relation', 'tag', 'nd', 'member')
+
+# Start tag of any other element
+other_element = re.compile(r'<(?!(?:{})[\s/>])([A-Za-z_][-\w.:]*)'.format('|'.join(frequent_elements)))
+
+# Attributes of a start tag before the one looked for (a quoted value may hold any other attribute as text)
+attributes = r'(?:\s+[\w:.-]+\s*=\s*(?:"[^"]*"|' + r"'[^']*'))*?"
+
+# (fast pattern, pattern) of the key of the tag elements, with double and single quotes
+#    The fast pattern (the key as the first attribute after one space, as the osm tools write it) starts with a
+#    literal, which the regex engine looks for much faster; it is used when every tag element starts so
+tag_keys = [
+	(re.compile(r'<tag k="([^"]*)"'), re.compile(r'<tag' + attributes + r'\s+k\s*=\s*"([^"]*)"')),
+	(re.compile(r"<tag k='([^']*)'"), re.compile(r'<tag' + attributes + r"\s+k\s*=\s*'([^']*)'"))
+]
+tag_start = '<tag'
+fast_tag_start = '<tag k='
+
+# Patterns of the user of the nodes, ways and relations, with double and single quotes
+users = [
+	re.compile(r'<(?:node|way|relation)' + attributes + r'\s+user\s*=\s*"([^"]*)"'),
+	re.compile(r'<(?:node|way|relation)' + attributes + r"\s+user\s*=\s*'([^']*)'")
+]
+
+entity = re.compile(r'&(#x[0-9a-fA-F]+|#[0-9]+|amp|lt|gt|quot|apos);')
+entities = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+
+def replace_entity(match):
+	name = match.group(1)
+	if name[:2] == '#x':
+		return unichr(int(name[2:], 16)).encode('utf-8')
+	if name[:1] == '#':
+		return unichr(int(name[1:])).encode('utf-8')
+	return entities[name]
+
+# Attribute value as expat returns it (whitespace normalized, references replaced), then as the records hold it
+def attribute_value(raw):
+	if '\t' in raw or '\n' in raw or '\r' in raw:
+		raw = raw.replace('\r\n', ' ').replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+	if '&' in raw:
+		raw = entity.sub(replace_entity, raw)
+	return from_utf8(raw)
+
+# Keys of the tag elements within the data
+def find_keys(data):
+	fast = data.count(fast_tag_start) == data.count(tag_start)
+	keys = []
+	for fast_pattern, pattern in tag_keys:
+		keys.extend((fast_pattern if fast else pattern).findall(data))
+	return keys
+
+# Counts of the data, added to counts: ({element: count}, {raw key: count}, {raw user: count})
+def scan_data(data, counts):
+	elements, keys, found_users = counts
+	others = {}
+	for name in other_element.findall(data):
+		others[name] = others.get(name, 0) + 1
+	for name in frequent_elements:
+		# The other elements starting with the name are counted by str.count as well
+		n = data.count('<' + name) - sum(count for other, count in others.iteritems() if other.startswith(name))
+		if n:
+			elements[name] = elements.get(name, 0) + n
+	for name, n in others.iteritems():
+		elements[name] = elements.get(name, 0) + n
+	for key in find_keys(data):
+		keys[key] = keys.get(key, 0) + 1
+	for pattern in users:
+		for user in pattern.findall(data):
+			found_users[user] = found_users.get(user, 0) + 1
+	return counts
+
+def empty_counts():
+	return ({}, {}, {})
+
+def add_counts(counts, more):
+	for total, partial in zip(counts, more):
+		for k, n in partial.iteritems():
+			total[k] = total.get(k, 0) + n
+	return counts
+
+# Counts of the bytes [start, end) of the file (the task of a process)
+def scan_chunk(task):
+	path, start, end = task
+	with open(path, 'rb') as osm_file:
+		mapped = mmap.mmap(osm_file.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			return scan_data(mapped[start:end], empty_counts())
+		finally:
+			mapped.close()
+
+# [(path, start, end)] chunks of the file, each one (but the first) starting at a '<'
+def chunks(path, size, pieces):
+	with open(path, 'rb') as osm_file:
+		mapped = mmap.mmap(osm_file.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			bounds = [0]
+			for i in xrange(1, pieces):
+				cut = mapped.find('<', max(size * i // pieces, bounds[-1]))
+				if cut < 0:
+					break
+				if cut > bounds[-1]:
+					bounds.append(cut)
+		finally:
+			mapped.close()
+	bounds.append(size)
+	return [(path, start, end) for start, end in zip(bounds, bounds[1:])]
+
+# Counts of a compressed file, as it is decompressed (cutting the data at the last '<' of every block)
+def scan_stream(path, block_size=4 * 1024 * 1024):
+	counts = empty_counts()
+	rest = ''
+	with open_osm(path) as osm_file:
+		while True:
+			block = osm_file.read(block_size)
+			if not block:
+				break
+			data = rest + block
+			cut = data.rfind('<')
+			if cut <= 0:
+				rest = data
+				continue
+			scan_data(data[:cut], counts)
+			rest = data[cut:]
+	return scan_data(rest, counts)
+
+# Scan the osm file
+#    processes: processes scanning the chunks of the file (all the CPUs if None, 1 to scan it in this process)
+#    returns {'elements': {element: count}, 'keys': {tag key: count}, 'users': {user: elements}}
+def scan(path, processes=None):
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	if compression(path) is not None:
+		counts = scan_stream(path)
+	else:
+		size = os.path.getsize(path)
+		tasks = chunks(path, size, max(processes, -(-size // chunk_size))) if size else []
+		if processes <= 1 or len(tasks) <= 1:
+			counts = reduce(add_counts, map(scan_chunk, tasks), empty_counts())
+		else:
+			pool = multiprocessing.Pool(processes)
+			try:
+				counts = reduce(add_counts, pool.imap_unordered(scan_chunk, tasks), empty_counts())
+			finally:
+				pool.terminate()
+				pool.join()
+
+	elements, keys, found_users = counts
+	decoded = []
+	for raw in (keys, found_users):
+		values = {}
+		for value, n in raw.iteritems():
+			value = attribute_value(value)
+			values[value] = values.get(value, 0) + n
+		decoded.append(values)
+	return {'elements': elements, 'keys': decoded[0], 'users': decoded[1]}
+
+# Same results as audit_keys_basic.count_elements, count_tags and unique_users
+def count_elements(path, processes=None):
+	return scan(path, processes)['elements']
+
+def count_tags(path, processes=None):
+	return scan(path, processes)['keys']
+
+def unique_users(path, processes=None):
+	return set(scan(path, processes)['users'])
+
+# Compare the scan with the reports of the auditors (parsing the file)
+#    returns the names of the results that differ (none if the scan is right for the file)
+def verify(path, processes=None):
+	from audit_engine import run_auditors
+	from audit_keys_basic import CountElements, CountTags, UniqueUsers
+
+	expected = run_auditors(path, [CountElements(), CountTags(), UniqueUsers()], cache=False)
+	result = scan(path, processes)
+	differences = []
+	if result['elements'] != expected['count_elements']:
+		differences.append('count_elements')
+	if result['keys'] != expected['count_tags']:
+		differences.append('count_tags')
+	if set(result['users']) != expected['unique_users']:
+		differences.append('unique_users')
+	return differences
+
+if __name__ == '__main__':
+	arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--')]
+	path = arguments[0] if arguments else filename
+	if '--verify' in sys.argv[1:]:
+		differences = verify(path)
+		print 'differences: {}'.format(', '.join(differences) or 'none')
+		sys.exit(1 if differences else 0)
+	result = scan(path)
+	print 'elements: {}'.format(result['elements'])
+	print '{} distinct keys, {} users'.format(len(result['keys']), len(result['users']))
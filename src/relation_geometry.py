@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Geometry of the members of the relations of a cleaned JSON Lines document, resolved out of core
+#    The member references are sorted by id on disk (external sort) and joined with the way
+#    geometries (sorted the same way) and the node store (already sorted by id) by merging the
+#    sorted streams; the resolved members are sorted back by relation and merged with the document
+#    in a second pass, so memory stays bounded by the sort buffers whatever the size of the extract
+
+import heapq
+import json
+import marshal
+import os
+import sys
+import tempfile
+
+from jsonl_writer import JSONLinesWriter
+from node_store import add_way_geometry, build_node_store, read_records, store_filename, NodeStore
+
+filename = '../data/file.osm'
+
+# Sort of records (tuples of ints, floats, strings, lists and dicts) bigger than memory
+#    The records are sorted in buffers of buffer_size records and spilled to temporary runs, which
+#    are merged when the sorted records are read
+#    directory: directory of the runs (the system one if None)
+class ExternalSorter(object):
+
+	def __init__(self, buffer_size=200000, directory=None):
+		self.buffer_size = buffer_size
+		self.directory = directory
+		self.buffer = []
+		self.runs = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def add(self, record):
+		self.buffer.append(record)
+		if len(self.buffer) >= self.buffer_size:
+			self.spill()
+
+	def spill(self):
+		self.buffer.sort()
+		handle, path = tempfile.mkstemp(prefix='osm_sort_', suffix='.run', dir=self.directory)
+		with os.fdopen(handle, 'wb') as run_file:
+			for record in self.buffer:
+				marshal.dump(record, run_file)
+		self.runs.append(path)
+		self.buffer = []
+
+	# The records in order (can be read once)
+	def __iter__(self):
+		self.buffer.sort()
+		streams = [read_run(path) for path in self.runs]
+		if self.buffer:
+			streams.append(iter(self.buffer))
+		return heapq.merge(*streams)
+
+	def close(self):
+		self.buffer = []
+		while self.runs:
+			os.remove(self.runs.pop())
+
+def read_run(path):
+	with open(path, 'rb') as run_file:
+		while True:
+			try:
+				yield marshal.load(run_file)
+			except EOFError:
+				return
+
+# (request, item) of the requests whose key (first field) is the one of an item, from both sorted by key
+#    The keys of the items are unique (the first item of a key is used otherwise)
+def merge_join(requests, items):
+	items = iter(items)
+	item = next(items, None)
+	for request in requests:
+		while item is not None and item[0] < request[0]:
+			item = next(items, None)
+		if item is None:
+			return
+		if item[0] == request[0]:
+			yield request, item
+
+# Geometry of a way document: the one added by node_store.attach_way_geometry, computed from the store otherwise
+def way_geometry(doc, store, coords=False):
+	if 'centroid' not in doc:
+		add_way_geometry(doc, store, coords)
+	return dict((key, doc[key]) for key in ('centroid', 'bbox', 'coords') if key in doc)
+
+# Copy a cleaned JSON Lines document adding the geometry of the members of the relations
+#    The way members get the centroid and bbox of the way (and its coords if coords is True), the node
+#    members their pos; the members not found in the document (or in the node store) are left as they are
+#    path: node store of the osm file (node_store.build_node_store)
+#    buffer_size: records kept in memory by each external sort
+def attach_member_geometry(jsonl_path, output_path, path=store_filename, coords=False, buffer_size=200000, directory=None):
+	way_members = ExternalSorter(buffer_size, directory)
+	node_members = ExternalSorter(buffer_size, directory)
+	ways = ExternalSorter(buffer_size, directory)
+	resolved = ExternalSorter(buffer_size, directory)
+	try:
+		# First pass: way geometries and member references, by id
+		with NodeStore(path) as store:
+			with open(jsonl_path) as jsonl_file:
+				for line_number, line in enumerate(jsonl_file):
+					doc = json.loads(line)
+					if doc.get('type') == 'way':
+						ways.add((int(doc['id']), way_geometry(doc, store, coords)))
+					elif doc.get('type') == 'relation':
+						for i, member in enumerate(doc.get('members', [])):
+							if member['type'] == 'way':
+								way_members.add((member['ref'], line_number, i))
+							elif member['type'] == 'node':
+								node_members.add((member['ref'], line_number, i))
+
+		# Joins, the resolved members sorted back by (line, member)
+		for (ref, line_number, i), (way_id, geometry) in merge_join(way_members, ways):
+			resolved.add((line_number, i, geometry))
+		with open(path, 'rb') as store_file:
+			for (ref, line_number, i), (node_id, lon, lat) in merge_join(node_members, read_records(store_file)):
+				resolved.add((line_number, i, {'pos': [lon, lat]}))
+
+		# Second pass: add the geometry to the members of the relations
+		members = iter(resolved)
+		member = next(members, None)
+		with JSONLinesWriter(output_path) as writer:
+			with open(jsonl_path) as jsonl_file:
+				for line_number, line in enumerate(jsonl_file):
+					if member is None or member[0] != line_number:
+						writer.write_raw(line)
+						continue
+					doc = json.loads(line)
+					while member is not None and member[0] == line_number:
+						doc['members'][member[1]].update(member[2])
+						member = next(members, None)
+					writer.write_raw(json.dumps(doc, sort_keys=True) + '\n')
+	finally:
+		for sorter in (way_members, node_members, ways, resolved):
+			sorter.close()
+
+if __name__ == '__main__':
+	build_node_store(sys.argv[1] if len(sys.argv) > 1 else filename)
+	attach_member_geometry('../data/cleaned.jsonl', '../data/cleaned_relations.jsonl')
@@ -2,34 +2,187 @@
 # -*- coding: utf-8 -*-
 
 # Create a smaller sample of the osm file
+#    ratio: keep that fraction of the elements, evenly spaced (0.1 keeps every 10th element)
+#    size: keep that number of elements, chosen at random (reservoir sampling)
+#    stratified: apply the ratio / size to each element type separately, so the sample keeps their proportions
+#    bbox: (min_lon, min_lat, max_lon, max_lat) only keep the nodes within it and the ways and relations using them
+#    closed: add every node referenced by the sampled ways, so their geometry is complete
 
-import xml.etree.ElementTree as ET  # Use cElementTree or lxml if too slow
+import random
+from fractions import Fraction
+
+from id_set import IdSet
+from osm_reader import read_elements
 
 OSM_FILE = "../data/file.osm"  # Replace this with your osm file
 SAMPLE_FILE = "../data/sample.osm"
 
+element_types = ('node', 'way', 'relation')
+
+# Elements within a bounding box: the nodes inside it, the ways with any of those nodes and the
+# relations with any of those nodes or ways as members (the ids inside are kept in on-disk sets)
+class BBoxFilter(object):
+
+	def __init__(self, bbox, directory=None):
+		self.min_lon, self.min_lat, self.max_lon, self.max_lat = bbox
+		self.inside = {'node': IdSet(directory=directory), 'way': IdSet(directory=directory)}
+
+	# The point is within the area (the bounding box)
+	def contains(self, lon, lat):
+		return self.min_lon <= lon <= self.max_lon and self.min_lat <= lat <= self.max_lat
+
+	def __call__(self, elem):
+		if elem.type == 'node':
+			inside = self.contains(float(elem.attrs['lon']), float(elem.attrs['lat']))
+		elif elem.type == 'way':
+			inside = self.inside['node'].any_of(elem.refs)
+		else:
+			inside = any(self.inside[t].any_of(ref for member_type, ref, role in elem.members if member_type == t)
+						 for t in ('node', 'way'))
+		if inside and elem.type in self.inside:
+			self.inside[elem.type].add(elem.id)
+		return inside
+
+	def close(self):
+		for ids in self.inside.values():
+			ids.close()
+
+# Keep a ratio of the elements, evenly spaced (per type if stratified)
+class RatioSelector(object):
+
+	def __init__(self, ratio, stratified=False):
+		self.ratio = ratio
+		self.stratified = stratified
+		self.seen = {}
+		# The ratio as an exact fraction (0.1 is 1/10), so the spacing does not drift with the float errors
+		fraction = Fraction(repr(float(ratio)))
+		self.numerator, self.denominator = fraction.numerator, fraction.denominator
+
+	# The element is in the sample: the n-th element (from 0) is kept when [n * ratio, (n + 1) * ratio)
+	# holds an integer, so a ratio of 0.1 keeps the elements 0, 10, 20... as the original sampling did
+	def offer(self, elem):
+		key = elem.type if self.stratified else None
+		n = self.seen.get(key, 0)
+		self.seen[key] = n + 1
+		start = n * self.numerator
+		# First multiple of the denominator from start
+		multiple = -(-start // self.denominator) * self.denominator
+		return multiple < start + self.numerator
+
+	# Elements chosen at the end as (type, id, refs)
+	def final(self):
+		return []
+
+# Keep size elements chosen at random with reservoir sampling
+#    If stratified, one reservoir of size elements is kept per type and at the end each type
+#    gets a share of the size proportional to its number of elements
+#    keep_refs: keep the node references of the sampled ways (for the closed samples)
+class ReservoirSelector(object):
+
+	def __init__(self, size, stratified=False, keep_refs=False, rng=random):
+		self.size = size
+		self.stratified = stratified
+		self.keep_refs = keep_refs
+		self.rng = rng
+		self.reservoirs = {}
+		self.seen = {}
+
+	def offer(self, elem):
+		key = elem.type if self.stratified else None
+		n = self.seen.get(key, 0)
+		self.seen[key] = n + 1
+		reservoir = self.reservoirs.setdefault(key, [])
+		if n < self.size:
+			reservoir.append(self.entry(elem))
+		else:
+			i = self.rng.randint(0, n)
+			if i < self.size:
+				reservoir[i] = self.entry(elem)
+		return False
+
+	def entry(self, elem):
+		refs = elem.refs if self.keep_refs and elem.type == 'way' else None
+		return (elem.type, elem.id, refs)
+
+	def final(self):
+		if not self.stratified:
+			return self.reservoirs.get(None, [])
+		total = sum(self.seen.values())
+		shares = dict((t, self.size * float(n) / total) for t, n in self.seen.iteritems())
+		quotas = dict((t, int(share)) for t, share in shares.iteritems())
+		# The elements left by rounding down go to the types with the largest remainders
+		left = min(self.size, total) - sum(quotas.values())
+		for t in sorted(shares, key=lambda t: shares[t] - quotas[t], reverse=True)[:left]:
+			quotas[t] += 1
+		chosen = []
+		for t, reservoir in self.reservoirs.iteritems():
+			chosen.extend(self.rng.sample(reservoir, min(quotas[t], len(reservoir))))
+		return chosen
+
+# Write a sample of osm_file to sample_file
+#    The evenly spaced samples without closing are written in a single pass; the rest do a first pass
+#    to choose the elements (and the nodes referenced by them), kept in on-disk id sets, and a
+#    second one to write them
+#    seed: seed of the random choices of the reservoir samples
+#    directory: directory of the temporary id sets (the system one if None)
+def sample_file(osm_file=OSM_FILE, sample_file=SAMPLE_FILE, ratio=None, size=None, stratified=False,
+				bbox=None, closed=False, seed=None, directory=None):
+	if ratio is not None and size is not None:
+		raise ValueError('Use either a ratio or a size, not both')
+	if ratio is not None and not 0 < ratio <= 1:
+		raise ValueError('The ratio must be within (0, 1]: {}'.format(ratio))
+	if size is not None:
+		selector = ReservoirSelector(size, stratified, keep_refs=closed, rng=random.Random(seed))
+	else:
+		selector = RatioSelector(1 if ratio is None else ratio, stratified)
+	inside = BBoxFilter(bbox, directory) if bbox is not None else None
+
+	try:
+		with open(sample_file, 'wb') as output:
+			output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+			output.write('<osm>\n  ')
 
-def get_element(osm_file, tags=('node', 'way', 'relation')):
-    """Yield element if it is the right type of tag
+			if size is None and not closed:
+				for elem in read_elements(osm_file):
+					if (inside is None or inside(elem)) and selector.offer(elem):
+						output.write(elem.to_xml('utf-8') + '\n  ')
+			else:
+				selected = dict((t, IdSet(directory=directory)) for t in element_types)
+				referenced = IdSet(directory=directory)
+				try:
+					choose_elements(osm_file, selector, inside, closed, selected, referenced)
+					write_elements(osm_file, output, selected, referenced)
+				finally:
+					for ids in selected.values() + [referenced]:
+						ids.close()
 
-    Reference:
-    http://stackoverflow.com/questions/3095434/inserting-newlines-in-xml-file-generated-via-xml-etree-elementtree-in-python
-    """
-    context = ET.iterparse(osm_file, events=('start', 'end'))
-    _, root = next(context)
-    for event, elem in context:
-        if event == 'end' and elem.tag in tags:
-            yield elem
-            root.clear()
+			output.write('</osm>')
+	finally:
+		if inside is not None:
+			inside.close()
 
+# First pass: add the ids of the sampled elements to selected and the nodes of the sampled ways to referenced
+def choose_elements(osm_file, selector, inside, closed, selected, referenced):
+	def choose(element_type, element_id, refs):
+		selected[element_type].add(element_id)
+		if closed and refs:
+			referenced.update(refs)
 
-with open(SAMPLE_FILE, 'wb') as output:
-    output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-    output.write('<osm>\n  ')
+	for elem in read_elements(osm_file):
+		if (inside is None or inside(elem)) and selector.offer(elem):
+			choose(elem.type, elem.id, elem.refs if closed and elem.type == 'way' else None)
+	for entry in selector.final():
+		choose(*entry)
 
-    # Write every 10th top level element
-    for i, element in enumerate(get_element(OSM_FILE)):
-        if i % 10 == 0:
-            output.write(ET.tostring(element, encoding='utf-8'))
+# Second pass: write the selected elements and the referenced nodes
+#    types: types of the elements that can be selected (the others are not even built by the reader)
+def write_elements(osm_file, output, selected, referenced, types=element_types):
+	contains = dict((t, ids.sorted_contains()) for t, ids in selected.iteritems())
+	contains_ref = referenced.sorted_contains()
+	for elem in read_elements(osm_file, types=types):
+		if contains[elem.type](elem.id) or (elem.type == 'node' and contains_ref(elem.id)):
+			output.write(elem.to_xml('utf-8') + '\n  ')
 
-    output.write('</osm>')
\ No newline at end of file
+if __name__ == '__main__':
+	# Every 10th element, with the nodes of the sampled ways
+	sample_file(OSM_FILE, SAMPLE_FILE, ratio=0.1, closed=True)
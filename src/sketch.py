@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Probabilistic sketches of the values seen by the auditors, with bounded memory and known error
+#    HyperLogLog: number of distinct values (relative standard error 1.04 / sqrt(2 ** precision))
+#    SpaceSaving: most frequent values (every count is an upper bound, at most total / capacity above the true one)
+#    CountMin: frequency of any value (an upper bound, at most e * total / width above the true one with
+#              probability 1 - e ** -depth)
+#    DistinctSample: uniform random sample of the distinct values (example values)
+#    Every sketch can be merged with another one of the same parameters (built from another shard of
+#    the data), with the same guarantees over the union; the hashes are stable across processes
+
+import hashlib
+import heapq
+import math
+import struct
+from array import array
+
+# Two independent 64 bit hashes of a value (of its UTF-8 encoding if it is unicode)
+def hash128(value):
+	if isinstance(value, unicode):
+		value = value.encode('utf-8')
+	return struct.unpack('<QQ', hashlib.md5(value).digest())
+
+# Number of distinct values
+#    precision: the sketch has 2 ** precision registers of one byte
+class HyperLogLog(object):
+
+	def __init__(self, precision=12):
+		if not 4 <= precision <= 18:
+			raise ValueError('The precision must be within [4, 18]: {}'.format(precision))
+		self.precision = precision
+		self.registers = bytearray(1 << precision)
+
+	def add(self, value, hashes=None):
+		h = (hashes or hash128(value))[0]
+		bits = 64 - self.precision
+		index = h >> bits
+		rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+		if rank > self.registers[index]:
+			self.registers[index] = rank
+
+	def count(self):
+		m = len(self.registers)
+		alpha = 0.7213 / (1 + 1.079 / m)
+		estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+		zeros = self.registers.count('\x00')
+		if estimate <= 2.5 * m and zeros:
+			# Small cardinalities: linear counting
+			estimate = m * math.log(float(m) / zeros)
+		return int(round(estimate))
+
+	def error(self):
+		return 1.04 / math.sqrt(len(self.registers))
+
+	def merge(self, other):
+		if other.precision != self.precision:
+			raise ValueError('Only sketches of the same precision can be merged')
+		merged = HyperLogLog(self.precision)
+		merged.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+		return merged
+
+# Most frequent values (Space-Saving): capacity values are monitored with their counts; a new value
+# replaces the one with the lowest count and inherits it (as its error)
+class SpaceSaving(object):
+
+	def __init__(self, capacity=100):
+		self.capacity = capacity
+		self.counts = {}
+		self.errors = {}
+		# (count, value) of every monitored value; the counts of the values incremented since they
+		# were pushed are stale (lower) and are updated when they reach the top
+		self.heap = []
+		self.total = 0
+
+	def add(self, value, n=1):
+		self.total += n
+		counts = self.counts
+		if value in counts:
+			counts[value] += n
+		elif len(counts) < self.capacity:
+			counts[value] = n
+			self.errors[value] = 0
+			heapq.heappush(self.heap, (n, value))
+		else:
+			minimum, evicted = self.pop_minimum()
+			del counts[evicted]
+			del self.errors[evicted]
+			counts[value] = minimum + n
+			self.errors[value] = minimum
+			heapq.heappush(self.heap, (minimum + n, value))
+
+	def pop_minimum(self):
+		while True:
+			count, value = heapq.heappop(self.heap)
+			if self.counts[value] == count:
+				return count, value
+			heapq.heappush(self.heap, (self.counts[value], value))
+
+	# Count of the values not monitored (at most): the lowest count once the summary is full
+	def minimum(self):
+		return min(self.counts.itervalues()) if len(self.counts) >= self.capacity else 0
+
+	# [(value, count, error)] of the k most frequent values (all the monitored ones if k is None)
+	#    The true count of a value is within [count - error, count]
+	def top(self, k=None):
+		ranked = sorted(self.counts.iteritems(), key=lambda item: item[1], reverse=True)
+		return [(value, count, self.errors[value]) for value, count in ranked[:k]]
+
+	def merge(self, other):
+		merged = SpaceSaving(max(self.capacity, other.capacity))
+		minimum, other_minimum = self.minimum(), other.minimum()
+		candidates = []
+		for value in set(self.counts) | set(other.counts):
+			count = self.counts.get(value, minimum) + other.counts.get(value, other_minimum)
+			error = self.errors.get(value, minimum) + other.errors.get(value, other_minimum)
+			candidates.append((count, error, value))
+		for count, error, value in heapq.nlargest(merged.capacity, candidates):
+			merged.counts[value] = count
+			merged.errors[value] = error
+		merged.heap = [(count, value) for value, count in merged.counts.iteritems()]
+		heapq.heapify(merged.heap)
+		merged.total = self.total + other.total
+		return merged
+
+# Frequency of any value (Count-Min): depth rows of width counters
+class CountMin(object):
+
+	def __init__(self, width=1024, depth=4):
+		self.width = width
+		self.depth = depth
+		self.rows = [array('l', [0]) * width for _ in xrange(depth)]
+		self.total = 0
+
+	def indexes(self, hashes):
+		h1, h2 = hashes
+		return [(h1 + i * h2) % self.width for i in xrange(self.depth)]
+
+	def add(self, value, n=1, hashes=None):
+		self.total += n
+		for row, index in zip(self.rows, self.indexes(hashes or hash128(value))):
+			row[index] += n
+
+	def estimate(self, value):
+		return min(row[index] for row, index in zip(self.rows, self.indexes(hash128(value))))
+
+	def error(self):
+		return math.e * self.total / self.width
+
+	def merge(self, other):
+		if (other.width, other.depth) != (self.width, self.depth):
+			raise ValueError('Only sketches of the same width and depth can be merged')
+		merged = CountMin(self.width, self.depth)
+		merged.rows = [array('l', (a + b for a, b in zip(row, other_row))) for row, other_row in zip(self.rows, other.rows)]
+		merged.total = self.total + other.total
+		return merged
+
+# Uniform random sample of size distinct values (bottom-k): the values with the lowest hashes, so a
+# value is kept once however many times it is added, as the examples of the exact audits (sets)
+#    seed: salt of the hashes (the same values with another seed give another sample)
+class DistinctSample(object):
+
+	def __init__(self, size=20, seed=None):
+		self.size = size
+		self.seed = seed
+		self.salt = '' if seed is None else '{!r}\x00'.format(seed)
+		# (-hash, value) of the values kept (the top of the heap is the highest hash)
+		self.heap = []
+		self.kept = set()
+		self.seen = 0
+
+	# Hash ordering the values (the second hash of hash128, the first one is the one of HyperLogLog)
+	def key(self, value, hashes=None):
+		if self.salt:
+			return hash128(self.salt + value)[1]
+		return (hashes or hash128(value))[1]
+
+	def add(self, value, hashes=None):
+		self.seen += 1
+		if value in self.kept:
+			return
+		h = self.key(value, hashes)
+		if len(self.heap) < self.size:
+			heapq.heappush(self.heap, (-h, value))
+			self.kept.add(value)
+		elif h < -self.heap[0][0]:
+			_, evicted = heapq.heapreplace(self.heap, (-h, value))
+			self.kept.discard(evicted)
+			self.kept.add(value)
+
+	@property
+	def values(self):
+		return [value for _, value in self.heap]
+
+	# Sample of the union: the values with the lowest hashes of both samples
+	def merge(self, other):
+		if other.seed != self.seed:
+			raise ValueError('Only samples of the same seed can be merged')
+		merged = DistinctSample(max(self.size, other.size), self.seed)
+		merged.seen = self.seen + other.seen
+		merged.heap = [(-h, value) for h, value in heapq.nsmallest(merged.size, set((-h, value) for h, value in self.heap + other.heap))]
+		heapq.heapify(merged.heap)
+		merged.kept = set(value for _, value in merged.heap)
+		return merged
+
+# Sketch of the values of one key (or category): how many, how many distinct, the most frequent ones,
+# the frequency of any one and some examples
+#    Used by the auditors in sketch mode instead of the set of every distinct value
+class ValueSketch(object):
+
+	def __init__(self, precision=12, capacity=100, width=1024, depth=4, sample_size=20, seed=None):
+		self.count = 0
+		self.distinct = HyperLogLog(precision)
+		self.top = SpaceSaving(capacity)
+		self.frequencies = CountMin(width, depth)
+		self.examples = DistinctSample(sample_size, seed)
+
+	def add(self, value):
+		hashes = hash128(value)
+		self.count += 1
+		self.distinct.add(value, hashes)
+		self.top.add(value)
+		self.frequencies.add(value, hashes=hashes)
+		self.examples.add(value, hashes)
+
+	def __len__(self):
+		return self.distinct.count()
+
+	def frequency(self, value):
+		return self.frequencies.estimate(value)
+
+	def merge(self, other):
+		merged = ValueSketch.__new__(ValueSketch)
+		merged.count = self.count + other.count
+		merged.distinct = self.distinct.merge(other.distinct)
+		merged.top = self.top.merge(other.top)
+		merged.frequencies = self.frequencies.merge(other.frequencies)
+		merged.examples = self.examples.merge(other.examples)
+		return merged
+
+	# Plain dict with the answers of the sketch (to print or save)
+	def summary(self, k=10):
+		return {
+			'count': self.count,
+			'distinct': self.distinct.count(),
+			'distinct_error': round(self.distinct.error(), 4),
+			'top': self.top.top(k),
+			'examples': sorted(self.examples.values)
+		}
+
+	def __repr__(self):
+		return '<ValueSketch {} values, ~{} distinct>'.format(self.count, self.distinct.count())
+
+# New collection of distinct values: a ValueSketch in sketch mode, a set otherwise (both have add)
+def value_set(sketch=False):
+	return ValueSketch() if sketch else set()
+
+# Merge two reports of the same auditor built from different shards: the sketches are merged, the sets
+# joined, the numbers added and the dicts merged key by key
+def merge(a, b):
+	if isinstance(a, dict):
+		merged = dict(a)
+		for key, value in b.iteritems():
+			merged[key] = merge(a[key], value) if key in a else value
+		return merged
+	if isinstance(a, (set, frozenset)):
+		return a | b
+	if isinstance(a, list):
+		return a + b
+	if isinstance(a, (int, long, float)):
+		return a + b
+	return a.merge(b)
+
+# The report with its sketches replaced by their summaries (to print it)
+def summarize(report, k=10):
+	if isinstance(report, dict):
+		return dict((key, summarize(value, k)) for key, value in report.iteritems())
+	if isinstance(report, ValueSketch):
+		return report.summary(k)
+	return report
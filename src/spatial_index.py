@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Local geospatial index over the positions of the cleaned documents, to run proximity
+# queries (like the $near ones of the report) without a database
+
+import cPickle as pickle
+import json
+import math
+from array import array
+
+jsonl_filename = '../data/cleaned.jsonl'
+index_filename = '../data/cleaned.spatial'
+
+earth_radius = 6378.1  # km (the same one used on the report)
+
+# Tags indexed by default to filter the queries (dotted paths for the nested ones)
+default_keys = ('amenity', 'shop', 'tourism', 'leisure', 'historic', 'place', 'highway', 'building', 'addr.city', 'addr.street')
+
+# Value of a (dotted) key within a cleaned document, taking the 'default' value of the nested ones
+def get_value(doc, key):
+	value = doc
+	for part in key.split('.'):
+		if not isinstance(value, dict) or part not in value:
+			return None
+		value = value[part]
+	if isinstance(value, dict):
+		value = value.get('default')
+	return value if isinstance(value, basestring) else None
+
+# Great-circle distance in km between two (lon, lat) positions
+def haversine(lon1, lat1, lon2, lat2):
+	lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+	a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+	return 2 * earth_radius * math.asin(min(1.0, math.sqrt(a)))
+
+# Grid index over the positions of the documents
+#    lon, lat, ids: coordinates and ids of the indexed points (stored in arrays)
+#    cells: {(column, row): array of point indices} for cells of cell_size degrees
+#    tags: {key: {value: array of point indices}} for the keys used to filter the queries
+class SpatialIndex(object):
+
+	def __init__(self, cell_size=0.02, keys=default_keys):
+		self.cell_size = cell_size
+		self.keys = tuple(keys)
+		self.lon = array('d')
+		self.lat = array('d')
+		self.ids = array('l')
+		self.cells = {}
+		self.tags = {key: {} for key in self.keys}
+
+	def cell(self, lon, lat):
+		return (int(math.floor(lon / self.cell_size)), int(math.floor(lat / self.cell_size)))
+
+	# Add one cleaned document with a pos attribute
+	def add(self, doc):
+		lon, lat = doc['pos']
+		i = len(self.ids)
+		self.lon.append(lon)
+		self.lat.append(lat)
+		self.ids.append(int(doc['id']))
+		self.cells.setdefault(self.cell(lon, lat), array('l')).append(i)
+		for key in self.keys:
+			value = get_value(doc, key)
+			if value is not None:
+				self.tags[key].setdefault(value, array('l')).append(i)
+
+	# Point indices matching the filters {key: value, tuple of values or None (any value)}
+	def matching(self, where):
+		result = None
+		for key, values in where.iteritems():
+			if key not in self.tags:
+				raise KeyError('{} is not an indexed key ({})'.format(key, ', '.join(self.keys)))
+			if values is None:
+				values = self.tags[key].keys()
+			elif isinstance(values, basestring):
+				values = (values,)
+			matches = set()
+			for value in values:
+				matches.update(self.tags[key].get(value, ()))
+			result = matches if result is None else result & matches
+		return result
+
+	# Point indices within the cells that overlap a bounding box
+	def candidates(self, min_lon, min_lat, max_lon, max_lat):
+		min_col, min_row = self.cell(min_lon, min_lat)
+		max_col, max_row = self.cell(max_lon, max_lat)
+		if (max_col - min_col + 1) * (max_row - min_row + 1) > len(self.cells):
+			for (col, row), points in self.cells.iteritems():
+				if min_col <= col <= max_col and min_row <= row <= max_row:
+					for i in points:
+						yield i
+		else:
+			for col in xrange(min_col, max_col + 1):
+				for row in xrange(min_row, max_row + 1):
+					for i in self.cells.get((col, row), ()):
+						yield i
+
+	# Ids of the points within a bounding box, as a list of (id, lon, lat)
+	def bbox(self, min_lon, min_lat, max_lon, max_lat, where=None):
+		allowed = self.matching(where) if where else None
+		result = []
+		for i in self.candidates(min_lon, min_lat, max_lon, max_lat):
+			if allowed is not None and i not in allowed:
+				continue
+			lon, lat = self.lon[i], self.lat[i]
+			if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat:
+				result.append((self.ids[i], lon, lat))
+		return result
+
+	# Points within distance km of (lon, lat), as a list of (distance, id, lon, lat) from nearest to farthest
+	def radius(self, lon, lat, distance, where=None):
+		allowed = self.matching(where) if where else None
+		d_lat = math.degrees(distance / earth_radius)
+		cos_lat = math.cos(math.radians(lat))
+		d_lon = 180.0 if cos_lat < 1e-9 else min(180.0, d_lat / cos_lat)
+		result = []
+		for i in self.candidates(lon - d_lon, lat - d_lat, lon + d_lon, lat + d_lat):
+			if allowed is not None and i not in allowed:
+				continue
+			d = haversine(lon, lat, self.lon[i], self.lat[i])
+			if d <= distance:
+				result.append((d, self.ids[i], self.lon[i], self.lat[i]))
+		result.sort()
+		return result
+
+	def save(self, path=index_filename):
+		with open(path, 'wb') as index_file:
+			pickle.dump(self, index_file, pickle.HIGHEST_PROTOCOL)
+
+	@staticmethod
+	def load(path=index_filename):
+		with open(path, 'rb') as index_file:
+			return pickle.load(index_file)
+
+# Build the index from the documents with position of a cleaned JSON Lines document
+def build_index(jsonl_path=jsonl_filename, cell_size=0.02, keys=default_keys):
+	index = SpatialIndex(cell_size, keys)
+	with open(jsonl_path) as jsonl_file:
+		for line in jsonl_file:
+			doc = json.loads(line)
+			if 'pos' in doc:
+				index.add(doc)
+	return index
+
+# Proximity queries of the report (Medina de Pomar)
+def main():
+	index = build_index()
+	index.save()
+
+	medina = (-3.4861165, 42.9322093)
+	print 'Elements within 5 km:', len(index.radius(medina[0], medina[1], 5))
+	print 'Amenities within 5 km:', len(index.radius(medina[0], medina[1], 5, where={'amenity': None}))
+	print 'Bars, cafes and restaurants within 5 km:', len(index.radius(medina[0], medina[1], 5, where={'amenity': ('bar', 'cafe', 'restaurant')}))
+
+if __name__ == '__main__':
+	main()
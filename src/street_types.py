@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+
+# Default mapping file {wrong street type: corrected street type}
+STREET_TYPES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'street_types.json')
+
+kalea = re.compile(r'(k|K)alea$')
+
+# Type of street of an addr:street value: the last word for the basque 'kalea', the first one otherwise
+def street_type(street):
+	words = street.split()
+	if not words:
+		return street
+	if kalea.search(street):
+		return words[-1]
+	return words[0]
+
+# Load the mapping of street types from one or more files (the later ones override the former)
+def load_mapping(*paths):
+	mapping = {}
+	for path in paths or (STREET_TYPES_FILE,):
+		with open(path) as mapping_file:
+			mapping.update(json.load(mapping_file))
+	return mapping
+
+# Street type normalization built once from a mapping {wrong street type: corrected street type}
+#    All the wrong types are matched literally with one compiled alternation (the longest first,
+#    so 'AUTOVIA' wins over 'AU'); the first one found in the value is replaced by its corrected type
+class StreetTypeNormalizer(object):
+
+	def __init__(self, mapping):
+		self.mapping = dict(mapping)
+		keys = sorted(self.mapping, key=len, reverse=True)
+		self.pattern = re.compile(u'|'.join(re.escape(k) for k in keys), re.UNICODE)
+
+	# Corrected addr:street value
+	def normalize(self, street):
+		match = self.pattern.search(street)
+		if match is None:
+			return street
+		key = match.group(0)
+		return street.replace(key, self.mapping[key])
+
+	# Type of street of an addr:street value once it has been corrected
+	def normalized_type(self, street):
+		return street_type(self.normalize(street))
+
+# Normalizer with the default mapping file, shared by the cleaning and the auditing scripts
+normalizer = StreetTypeNormalizer(load_mapping())
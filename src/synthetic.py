@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Deterministic synthetic osm files (same parameters and seed, same bytes) to test and benchmark
+# the pipeline without the real extract
+
+import random
+import sys
+
+from osm_reader import escape_attrib
+import street_types
+
+SYNTHETIC_FILE = '../data/synthetic.osm'
+
+# Bounding box of Las Merindades (the one of the overpass query)
+default_bbox = (-4.2339, 42.5966, -2.7370, 43.2832)
+
+street_names = ['Real', 'Mayor', 'San Juan', 'La Paz', u'Santa Mar\xeda', 'del Castillo', 'Nueva', 'de la Iglesia', u'Jos\xe9 Antonio Primo']
+good_street_types = ['Calle', 'Avenida', 'Plaza', 'Carretera', 'Barrio', 'Camino', 'Paseo', u'Pol\xedgono']
+# The wrong street types are the ones corrected by the cleaning (street_types.json)
+wrong_street_types = sorted(street_types.normalizer.mapping)
+cities = ['Medina de Pomar', 'Villarcayo', 'Espinosa de los Monteros', 'Trespaderne', 'Villasana de Mena']
+
+amenities = ['cafe', 'bar', 'restaurant', 'bank', 'pharmacy', 'school', 'place_of_worship', 'fuel', 'parking']
+highways = ['residential', 'service', 'track', 'unclassified', 'primary', 'secondary', 'footway', 'path']
+name_words = ['Casa', 'Bar', 'Torre', 'Fuente', 'Molino', 'Puente', 'Ermita', 'Plaza', 'Castillo', 'Mirador']
+languages = ['es', 'eu', 'en', 'fr']
+name_variants = ['old', 'short', 'official']
+problem_keys = ['FIXME', 'fuel:', 'N', 'name es', 'ref.catastral', 'note=1']
+
+# Generator of a synthetic osm file
+#    nodes, ways, relations: number of elements of each type
+#    tags_per_element: mean number of tags of the tagged elements (a share of the nodes and every way and relation)
+#    tagged_nodes: share of the nodes with tags
+#    namespace_depth: maximum number of namespaces of the keys (0 no namespaces, up to 2 as in name:es:old)
+#    addr_rate: share of the tagged elements with an address
+#    addr_error_rate: share of the addresses with some error (wrong street type, number, postcode or city)
+#    problem_key_rate: share of the tags with a weird key (problem characters, capitals...)
+#    users: number of different users
+#    seed: seed of the random choices
+class SyntheticOSM(object):
+
+	def __init__(self, nodes=10000, ways=1000, relations=50, tags_per_element=3, tagged_nodes=0.2,
+				 namespace_depth=2, addr_rate=0.3, addr_error_rate=0.1, problem_key_rate=0.01, users=50,
+				 bbox=default_bbox, seed=0):
+		self.nodes = nodes
+		self.ways = ways
+		self.relations = relations
+		self.tags_per_element = tags_per_element
+		self.tagged_nodes = tagged_nodes
+		self.namespace_depth = namespace_depth
+		self.addr_rate = addr_rate
+		self.addr_error_rate = addr_error_rate
+		self.problem_key_rate = problem_key_rate
+		self.users = users
+		self.bbox = bbox
+		self.seed = seed
+
+	# Write the file, returns the number of elements of each type
+	def write(self, path=SYNTHETIC_FILE):
+		self.rng = random.Random(self.seed)
+		min_lon, min_lat, max_lon, max_lat = self.bbox
+		with open(path, 'wb') as output:
+			output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+			output.write('<osm version="0.6" generator="synthetic.py">\n')
+			output.write(' <bounds minlat="{}" minlon="{}" maxlat="{}" maxlon="{}"/>\n'.format(min_lat, min_lon, max_lat, max_lon))
+
+			for i in xrange(self.nodes):
+				attrs = self.common_attrs(1 + i)
+				attrs.append(('lat', '{:.7f}'.format(self.rng.uniform(min_lat, max_lat))))
+				attrs.append(('lon', '{:.7f}'.format(self.rng.uniform(min_lon, max_lon))))
+				tags = self.tags('node') if self.rng.random() < self.tagged_nodes else []
+				output.write(self.element_xml('node', attrs, [], tags))
+
+			for i in xrange(self.ways):
+				refs = self.way_refs()
+				children = ['<nd ref="{}"/>'.format(ref) for ref in refs]
+				output.write(self.element_xml('way', self.common_attrs(1 + i), children, self.tags('way')))
+
+			for i in xrange(self.relations):
+				children = []
+				for _ in xrange(self.rng.randint(1, 5)):
+					if self.ways and self.rng.random() < 0.8:
+						member = ('way', self.rng.randint(1, self.ways), self.rng.choice(['outer', 'inner']))
+					else:
+						member = ('node', self.rng.randint(1, max(self.nodes, 1)), '')
+					children.append('<member type="{}" ref="{}" role="{}"/>'.format(*member))
+				tags = [('type', self.rng.choice(['multipolygon', 'route', 'boundary']))] + self.tags('relation')
+				output.write(self.element_xml('relation', self.common_attrs(1 + i), children, tags))
+
+			output.write('</osm>\n')
+		return {'node': self.nodes, 'way': self.ways, 'relation': self.relations}
+
+	def common_attrs(self, element_id):
+		uid = self.rng.randint(1, self.users)
+		return [('id', str(element_id)), ('visible', 'true'), ('version', str(self.rng.randint(1, 9))),
+				('changeset', str(self.rng.randint(1000000, 30000000))),
+				('timestamp', '20{:02d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}Z'.format(
+					self.rng.randint(8, 15), self.rng.randint(1, 12), self.rng.randint(1, 28),
+					self.rng.randint(0, 23), self.rng.randint(0, 59), self.rng.randint(0, 59))),
+				('user', u'user{}{}'.format(uid, u'\xf1' if uid % 7 == 0 else '')), ('uid', str(uid))]
+
+	# Node references of a way: consecutive nodes (like the ones of a real street), closed sometimes
+	def way_refs(self):
+		if not self.nodes:
+			return []
+		length = self.rng.randint(2, 12)
+		start = self.rng.randint(1, self.nodes)
+		refs = [min(self.nodes, start + j) for j in xrange(length)]
+		if self.rng.random() < 0.2:
+			refs.append(refs[0])
+		return refs
+
+	# Tags of an element: an address (right or wrong), a name with its translations and some common tags
+	def tags(self, element_type):
+		tags = []
+		count = max(1, int(self.rng.expovariate(1.0 / self.tags_per_element)))
+		if element_type == 'way':
+			tags.append(('highway', self.rng.choice(highways)))
+		elif self.rng.random() < 0.5:
+			tags.append(('amenity', self.rng.choice(amenities)))
+
+		if self.rng.random() < self.addr_rate:
+			tags.extend(self.address())
+
+		name = u'{} {}'.format(self.rng.choice(name_words), self.rng.choice(street_names))
+		tags.append(('name', name))
+		while len(tags) < count:
+			tags.append(self.namespaced_tag(name))
+
+		for i in xrange(len(tags)):
+			if self.rng.random() < self.problem_key_rate:
+				tags[i] = (self.rng.choice(problem_keys), tags[i][1])
+		return tags
+
+	# Tag with up to namespace_depth namespaces (name:es, name:es:old)
+	def namespaced_tag(self, name):
+		depth = self.rng.randint(0, self.namespace_depth)
+		if depth == 0:
+			return (self.rng.choice(['source', 'note', 'building', 'wheelchair', 'atm']), self.rng.choice(['yes', 'no', 'survey']))
+		key = 'name:' + self.rng.choice(languages)
+		if depth == 2:
+			key += ':' + self.rng.choice(name_variants)
+		return (key, name)
+
+	def address(self):
+		street_type = self.rng.choice(good_street_types)
+		housenumber = str(self.rng.randint(1, 120))
+		postcode = '09{:03d}'.format(self.rng.randint(500, 599))
+		city = self.rng.choice(cities)
+
+		if self.rng.random() < self.addr_error_rate:
+			error = self.rng.choice(['street', 'housenumber', 'postcode', 'city'])
+			if error == 'street':
+				street_type = self.rng.choice(wrong_street_types)
+			elif error == 'housenumber':
+				housenumber = self.rng.choice(['{}, BIS', u'{}, 1\xba D', '{}-{}', 's/n']).format(housenumber, int(housenumber) + 2)
+			elif error == 'postcode':
+				postcode = self.rng.choice(['Larrabetzu', '09 550', postcode + ';' + postcode])
+			else:
+				city = city.lower()
+
+		return [('addr:street', u'{} {}'.format(street_type, self.rng.choice(street_names))),
+				('addr:housenumber', housenumber), ('addr:postcode', postcode), ('addr:city', city)]
+
+	def element_xml(self, element_type, attrs, children, tags):
+		attributes = u' '.join(u'{}="{}"'.format(k, escape_attrib(v)) for k, v in attrs)
+		children = children + [u'<tag k="{}" v="{}"/>'.format(escape_attrib(k), escape_attrib(v)) for k, v in tags]
+		if not children:
+			xml = u'  <{} {}/>\n'.format(element_type, attributes)
+		else:
+			xml = u'  <{0} {1}>\n    {2}\n  </{0}>\n'.format(element_type, attributes, u'\n    '.join(children))
+		return xml.encode('utf-8')
+
+# Write a synthetic osm file with the given parameters (see SyntheticOSM)
+def generate(path=SYNTHETIC_FILE, **params):
+	return SyntheticOSM(**params).write(path)
+
+if __name__ == '__main__':
+	# Optional number of nodes (ways and relations keep the default proportion)
+	nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+	print generate(SYNTHETIC_FILE, nodes=nodes, ways=nodes // 10, relations=nodes // 200)
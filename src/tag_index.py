@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Persistent inverted index of the tags of an osm file: key -> value -> elements, with the byte
+# offset of every element so the auditors can read the matching ones without rescanning the file
+
+import cPickle as pickle
+import os
+import re
+import xml.parsers.expat
+from array import array
+from cStringIO import StringIO
+
+from osm_input import open_osm
+from osm_reader import read_elements, to_str
+
+filename = '../data/file.osm'
+
+element_types = ('node', 'way', 'relation')
+
+# End of a start tag or start of a quoted attribute value (which can hold a '>')
+tag_markup = re.compile('[>"\']')
+
+# Inverted index of the tags of the top-level elements
+#    types, ids, offsets: type (index in element_types), id and byte offset of every indexed element
+#    tags: {key: {value: array of element numbers}}
+#    source: (size, mtime) of the osm file when the index was built
+#    by_element: {key: {element number: [values]}} of the keys looked up by element (not saved)
+class TagIndex(object):
+
+	def __init__(self, osm_path):
+		self.osm_path = osm_path
+		self.types = array('b')
+		self.ids = array('l')
+		self.offsets = array('l')
+		self.tags = {}
+		self.source = None
+		self.by_element = {}
+
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		del state['by_element']
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.by_element = {}
+
+	# Build the index with one pass of expat over the file
+	def build(self):
+		stat = os.stat(self.osm_path)
+		parser = xml.parsers.expat.ParserCreate()
+		state = {'depth': 0, 'element': -1}
+		strings = {}
+
+		def start(name, attrs):
+			state['depth'] += 1
+			if state['depth'] == 2 and name in element_types:
+				state['element'] = len(self.ids)
+				self.types.append(element_types.index(name))
+				self.ids.append(int(attrs['id']))
+				self.offsets.append(parser.CurrentByteIndex)
+			elif state['depth'] == 3 and name == 'tag' and state['element'] >= 0:
+				k = strings.setdefault(attrs['k'], to_str(attrs['k']))
+				v = to_str(attrs['v'])
+				self.tags.setdefault(k, {}).setdefault(v, array('l')).append(state['element'])
+
+		def end(name):
+			state['depth'] -= 1
+			if state['depth'] == 1:
+				state['element'] = -1
+
+		parser.StartElementHandler = start
+		parser.EndElementHandler = end
+		with open_osm(self.osm_path) as osm_file:
+			parser.ParseFile(osm_file)
+		self.source = (stat.st_size, stat.st_mtime)
+		return self
+
+	# The osm file has not changed since the index was built
+	def is_current(self):
+		stat = os.stat(self.osm_path)
+		return self.source == (stat.st_size, stat.st_mtime)
+
+	def save(self, path):
+		with open(path, 'wb') as index_file:
+			pickle.dump(self, index_file, pickle.HIGHEST_PROTOCOL)
+
+	# Values of a key within the elements of the given types
+	def values(self, key, types=element_types):
+		type_numbers = set(element_types.index(t) for t in types)
+		return set(v for v, elements in self.tags.get(key, {}).iteritems()
+				   if any(self.types[i] in type_numbers for i in elements))
+
+	# Sorted element numbers with the key (and the value, if given) within the elements of the given types
+	def elements(self, key, value=None, types=element_types):
+		type_numbers = set(element_types.index(t) for t in types)
+		by_value = self.tags.get(key, {})
+		if value is None:
+			candidates = set(i for elements in by_value.itervalues() for i in elements)
+		else:
+			candidates = set(by_value.get(value, ()))
+		return sorted(i for i in candidates if self.types[i] in type_numbers)
+
+	# Sorted (element number, value) of the elements with the key (and the value, if given) within the
+	# elements of the given types
+	def items(self, key, value=None, types=element_types):
+		type_numbers = set(element_types.index(t) for t in types)
+		by_value = self.tags.get(key, {})
+		values = by_value.iteritems() if value is None else [(value, by_value.get(value, ()))]
+		return sorted(set((i, v) for v, elements in values for i in elements if self.types[i] in type_numbers))
+
+	# Values of the key for one element (the values of the key by element are mapped on its first lookup)
+	def element_values(self, element, key):
+		if key not in self.by_element:
+			by_element = {}
+			for v, elements in self.tags.get(key, {}).iteritems():
+				for i in elements:
+					values = by_element.setdefault(i, [])
+					if v not in values:
+						values.append(v)
+			self.by_element[key] = by_element
+		return list(self.by_element[key].get(element, ()))
+
+	# Read an element from the osm file (seeking to its offset) as a record (osm_reader.OSMElement)
+	#    The offsets are the ones of the decompressed data, so on a compressed file (osm_input.open_osm) the
+	#    elements can only be fetched in order
+	def fetch(self, element, osm_file=None):
+		if osm_file is None:
+			with open_osm(self.osm_path) as osm_file:
+				return self.fetch(element, osm_file)
+		element_type = element_types[self.types[element]]
+		raw = read_raw_element(osm_file, self.offsets[element], element_type)
+		return next(read_elements(StringIO('<osm>' + raw + '</osm>'), types=(element_type,)))
+
+# Position of the '>' ending the start tag at the beginning of data (-1 if data does not hold all of it)
+#    The quoted attribute values are skipped: XML allows a '>' within them
+def start_tag_end(data):
+	position = 0
+	while True:
+		match = tag_markup.search(data, position)
+		if match is None:
+			return -1
+		if match.group() == '>':
+			return match.start()
+		position = data.find(match.group(), match.end()) + 1
+		if not position:
+			return -1
+
+# Raw XML of the element of type element_type that starts at offset
+def read_raw_element(osm_file, offset, element_type, chunk_size=4096):
+	osm_file.seek(offset)
+	data = ''
+	while True:
+		chunk = osm_file.read(chunk_size)
+		if not chunk:
+			return data
+		data += chunk
+		start_end = start_tag_end(data)
+		if start_end < 0:
+			continue
+		if data[start_end - 1] == '/':
+			return data[:start_end + 1]
+		closing = data.find('</' + element_type + '>', start_end)
+		if closing >= 0:
+			return data[:closing + len(element_type) + 3]
+
+# Path of the index file of an osm file
+def index_path(osm_path):
+	return osm_path + '.tagidx'
+
+# Load the index of an osm file, building (and saving) it again if it does not exist or the file has changed
+def open_tag_index(osm_path=filename):
+	path = index_path(osm_path)
+	try:
+		with open(path, 'rb') as index_file:
+			index = pickle.load(index_file)
+		if index.osm_path == osm_path and index.is_current():
+			return index
+	except (IOError, EOFError, pickle.UnpicklingError, AttributeError):
+		pass
+	index = TagIndex(osm_path).build()
+	index.save(path)
+	return index
+
+if __name__ == '__main__':
+	index = open_tag_index(filename)
+	print '{} elements, {} keys indexed'.format(len(index.ids), len(index.tags))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# Stand-in of the part of pymongo used by load_mongo, for the tests (no MongoDB server needed)
+#    The uri of the client is a directory: every collection is a directory with a file per document,
+#    named by its _id and created exclusively, so the worker processes of a load share the collection
+#    and a duplicated _id fails as in MongoDB (code 11000)
+#    Every operation is appended to the log file of the collection ('insert_many <n>', 'create_index <keys>', 'drop')
+#    A collection fails the first insert_many with a document whose _id is in its fail_once file (removing it)
+
+import errno
+import json
+import os
+
+from pymongo.errors import BulkWriteError, OperationFailure
+
+ASCENDING = 1
+DESCENDING = -1
+GEO2D = '2d'
+
+LOG_FILENAME = 'operations.log'
+FAIL_FILENAME = 'fail_once'
+
+class InsertManyResult(object):
+
+	def __init__(self, inserted_ids):
+		self.inserted_ids = inserted_ids
+
+class Collection(object):
+
+	def __init__(self, directory):
+		self.directory = directory
+		if not os.path.isdir(directory):
+			try:
+				os.makedirs(directory)
+			except OSError as e:
+				if e.errno != errno.EEXIST:
+					raise
+
+	def log(self, operation):
+		with open(os.path.join(self.directory, LOG_FILENAME), 'a') as log_file:
+			log_file.write(operation + '\n')
+
+	def document_path(self, _id):
+		return os.path.join(self.directory, '{}.json'.format(_id))
+
+	def fail_once(self, docs):
+		path = os.path.join(self.directory, FAIL_FILENAME)
+		try:
+			with open(path) as fail_file:
+				_id = fail_file.read().strip()
+		except IOError:
+			return
+		if any(doc['_id'] == _id for doc in docs):
+			os.remove(path)
+			raise OperationFailure('Failing the batch with {}'.format(_id))
+
+	def insert_many(self, docs, ordered=True):
+		self.fail_once(docs)
+		self.log('insert_many {}'.format(len(docs)))
+		inserted_ids = []
+		errors = []
+		for i, doc in enumerate(docs):
+			try:
+				handle = os.open(self.document_path(doc['_id']), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+			except OSError as e:
+				if e.errno != errno.EEXIST:
+					raise
+				errors.append({'index': i, 'code': 11000, 'errmsg': 'E11000 duplicate key error: {}'.format(doc['_id'])})
+				if ordered:
+					break
+				continue
+			with os.fdopen(handle, 'w') as doc_file:
+				json.dump(doc, doc_file)
+			inserted_ids.append(doc['_id'])
+		if errors:
+			raise BulkWriteError({'writeErrors': errors, 'nInserted': len(inserted_ids)})
+		return InsertManyResult(inserted_ids)
+
+	def create_index(self, keys):
+		self.log('create_index {}'.format(json.dumps(keys)))
+		return '_'.join('{}_{}'.format(key, direction) for key, direction in keys)
+
+	# Documents of the collection by _id
+	def documents(self):
+		docs = {}
+		for name in os.listdir(self.directory):
+			if name.endswith('.json'):
+				with open(os.path.join(self.directory, name)) as doc_file:
+					doc = json.load(doc_file)
+				docs[doc['_id']] = doc
+		return docs
+
+	def operations(self):
+		try:
+			with open(os.path.join(self.directory, LOG_FILENAME)) as log_file:
+				return log_file.read().splitlines()
+		except IOError:
+			return []
+
+class Database(object):
+
+	def __init__(self, directory):
+		self.directory = directory
+
+	def __getitem__(self, name):
+		return Collection(os.path.join(self.directory, name))
+
+	def drop_collection(self, name):
+		collection = self[name]
+		for filename in os.listdir(collection.directory):
+			if filename.endswith('.json'):
+				os.remove(os.path.join(collection.directory, filename))
+		collection.log('drop')
+
+class MongoClient(object):
+
+	def __init__(self, uri):
+		self.directory = uri
+
+	def __getitem__(self, name):
+		return Database(os.path.join(self.directory, name))
+
+	def close(self):
+		pass
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+# Stand-in of pymongo.errors (see the stand-in pymongo)
+
+class PyMongoError(Exception):
+	pass
+
+class OperationFailure(PyMongoError):
+	pass
+
+class BulkWriteError(OperationFailure):
+
+	def __init__(self, results):
+		super(BulkWriteError, self).__init__('batch op errors occurred')
+		self.details = results
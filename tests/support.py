@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Shared setup of the tests: the modules of src are importable and every test can run within a
+# temporary copy of the layout of the repo (src next to data), since the scripts use '../data' paths
+#    python -m unittest discover -s tests (from the root of the repo)
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+SRC_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src')
+SRC_DIRECTORY = os.path.normpath(SRC_DIRECTORY)
+
+if SRC_DIRECTORY not in sys.path:
+	sys.path.insert(0, SRC_DIRECTORY)
+
+# Test case run within a temporary work directory: work/src (the current directory) and work/data
+class WorkDirectoryTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.previous_directory = os.getcwd()
+		self.work_directory = tempfile.mkdtemp(prefix='osm_test_')
+		self.src_directory = os.path.join(self.work_directory, 'src')
+		self.data_directory = os.path.join(self.work_directory, 'data')
+		os.mkdir(self.src_directory)
+		os.mkdir(self.data_directory)
+		os.chdir(self.src_directory)
+
+	def tearDown(self):
+		os.chdir(self.previous_directory)
+		shutil.rmtree(self.work_directory, ignore_errors=True)
+
+	def data_path(self, name):
+		return os.path.join(self.data_directory, name)
+
+# Write a simple osm file with nodes tagged nodes, ways (of consecutive nodes) and relations (of
+# consecutive ways), returns its path
+#    metadata: write the user, uid and changeset of the elements (the extracts without user data only have
+#              their version and timestamp)
+def write_osm(path, nodes, ways=0, relations=0, metadata=True):
+
+	def attributes(i):
+		if not metadata:
+			return 'version="1" timestamp="2015-01-01T00:00:00Z"'
+		return 'version="1" timestamp="2015-01-01T00:00:00Z" changeset="{}" uid="{}" user="user{}"'.format(i % 97 + 1, i % 13 + 1, i % 13)
+
+	with open(path, 'wb') as osm_file:
+		osm_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="tests">\n')
+		for i in xrange(1, nodes + 1):
+			osm_file.write(' <node id="{0}" lat="42.{0:07d}" lon="-3.{0:07d}" {1}>\n'
+						   '  <tag k="name" v="Node {0}"/>\n  <tag k="addr:street" v="Calle {2}"/>\n </node>\n'.format(i, attributes(i), i % 97))
+		for i in xrange(1, ways + 1):
+			refs = ''.join('  <nd ref="{}"/>\n'.format((i + j) % nodes + 1) for j in xrange(4))
+			osm_file.write(' <way id="{0}" {1}>\n{2}  <tag k="highway" v="residential"/>\n </way>\n'.format(i, attributes(i), refs))
+		for i in xrange(1, relations + 1):
+			osm_file.write(' <relation id="{0}" {1}>\n'
+						   '  <member type="way" ref="{2}" role="outer"/>\n  <member type="node" ref="{0}" role=""/>\n'
+						   '  <tag k="type" v="multipolygon"/>\n </relation>\n'.format(i, attributes(i), i % max(ways, 1) + 1))
+		osm_file.write('</osm>\n')
+	return path
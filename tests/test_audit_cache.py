@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The cache of the auditor reports: the hits do not parse the file, the misses are run together in one
+# parse, the key changes with the arguments, the cache format and the files the auditor depends on
+
+import os
+import sys
+import unittest
+
+from support import WorkDirectoryTestCase, write_osm
+
+import audit_cache
+import audit_engine
+from audit_cache import AuditCache, auditor_key, dependency_files
+from audit_keys_basic import CountElements, CountTags, UniqueUsers
+from audit_values_basic import TypeOfStreetDict
+
+# An auditor module and the project module (with its data file) it imports
+HELPER_SOURCE = '''import json
+import os
+
+mapping = json.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_helper.json')))
+'''
+
+AUDITOR_SOURCE = '''from audit_engine import Auditor
+import cache_helper
+
+class MappedStreets(Auditor):
+	name = 'mapped_streets'
+'''
+
+class AuditCacheTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(AuditCacheTest, self).setUp()
+		self.osm_path = write_osm(self.data_path('file.osm'), 500, ways=50, relations=5)
+		self.cache = AuditCache(self.data_path('cache'))
+		self.parses = 0
+		self.read_elements = audit_engine.read_elements
+
+		def counted(*args, **kwargs):
+			self.parses += 1
+			return self.read_elements(*args, **kwargs)
+
+		audit_engine.read_elements = counted
+
+	def tearDown(self):
+		audit_engine.read_elements = self.read_elements
+		super(AuditCacheTest, self).tearDown()
+
+	def auditors(self, sketch=False):
+		return [CountElements(), CountTags(), UniqueUsers(sketch=sketch)]
+
+	def run_cached(self, auditors, osm_path=None):
+		hits, misses, parses = self.cache.hits, self.cache.misses, self.parses
+		results = self.cache.run(osm_path or self.osm_path, auditors)
+		return results, (self.cache.hits - hits, self.cache.misses - misses, self.parses - parses)
+
+	def test_repeated_run(self):
+		results, counts = self.run_cached(self.auditors())
+		self.assertEqual(counts, (0, 3, 1))
+		self.assertEqual(results, audit_engine.run_auditors(self.osm_path, self.auditors(), cache=False))
+		cached, counts = self.run_cached(self.auditors())
+		self.assertEqual(counts, (3, 0, 0))
+		self.assertEqual(cached, results)
+
+	# Only the auditor with another argument is run, in a single parse
+	def test_changed_argument(self):
+		self.run_cached(self.auditors())
+		results, counts = self.run_cached(self.auditors(sketch=True))
+		self.assertEqual(counts, (2, 1, 1))
+		expected = audit_engine.run_auditors(self.osm_path, [UniqueUsers(sketch=True)], cache=False)['unique_users']
+		self.assertEqual(results['unique_users'].summary(), expected.summary())
+		self.assertNotEqual(auditor_key(UniqueUsers()), auditor_key(UniqueUsers(sketch=True)))
+		self.assertEqual(auditor_key(TypeOfStreetDict(normalized=True)), auditor_key(TypeOfStreetDict(normalized=True)))
+
+	# A new mtime with the same content keeps the reports, a new content does not
+	def test_mtime(self):
+		self.run_cached(self.auditors())
+		stat = os.stat(self.osm_path)
+		os.utime(self.osm_path, (stat.st_atime + 100, stat.st_mtime + 100))
+		_, counts = self.run_cached(self.auditors())
+		self.assertEqual(counts, (3, 0, 0))
+		with open(self.osm_path, 'ab') as osm_file:
+			osm_file.write('\n')
+		_, counts = self.run_cached(self.auditors())
+		self.assertEqual(counts, (0, 3, 1))
+
+	def test_eviction(self):
+		self.run_cached(self.auditors())
+		entries = sorted(self.cache.entries())
+		self.assertEqual(len(entries), 3)
+		# Use the reports in another order: the one of count_tags is the least recently used
+		key = auditor_key(CountTags())
+		for i, (_, _, path) in enumerate(sorted(entries, key=lambda entry: key in entry[2], reverse=True)):
+			os.utime(path, (1000000 + i, 1000000 + i))
+		self.cache.max_bytes = sum(size for _, size, _ in entries) - 1
+		self.cache.evict()
+		remaining = [path for _, _, path in self.cache.entries()]
+		self.assertEqual(len(remaining), 2)
+		self.assertFalse(any(key in path for path in remaining))
+		_, counts = self.run_cached(self.auditors())
+		self.assertEqual(counts, (2, 1, 1))
+
+	def test_invalidate(self):
+		other_path = write_osm(self.data_path('other.osm'), 300)
+		self.run_cached(self.auditors())
+		self.run_cached(self.auditors(), other_path)
+		self.assertEqual(len(self.cache.entries()), 6)
+		self.cache.invalidate(self.osm_path, [CountTags()])
+		self.assertEqual(len(self.cache.entries()), 5)
+		_, counts = self.run_cached(self.auditors(), other_path)
+		self.assertEqual(counts, (3, 0, 0))
+		_, counts = self.run_cached(self.auditors())
+		self.assertEqual(counts, (2, 1, 1))
+		self.cache.invalidate(other_path)
+		self.assertEqual(len(self.cache.entries()), 3)
+		self.cache.invalidate()
+		self.assertEqual(self.cache.entries(), [])
+
+	def test_format(self):
+		key = auditor_key(CountTags())
+		cache_format = audit_cache.CACHE_FORMAT
+		audit_cache.CACHE_FORMAT += 1
+		try:
+			self.assertNotEqual(auditor_key(CountTags()), key)
+		finally:
+			audit_cache.CACHE_FORMAT = cache_format
+
+	# The project modules imported by the auditor module, and their data files, are part of the key
+	def test_dependencies(self):
+		names = [os.path.basename(path) for path in dependency_files(TypeOfStreetDict)]
+		for name in ('audit_values_basic.py', 'audit_engine.py', 'street_types.py', 'street_types.json', 'key_cache.py', 'sketch.py'):
+			self.assertIn(name, names)
+
+		files = {'cache_helper.py': HELPER_SOURCE, 'cache_helper.json': '{"CL": "CALLE"}', 'cache_auditor.py': AUDITOR_SOURCE}
+		for name, source in files.iteritems():
+			with open(os.path.join(self.src_directory, name), 'wb') as source_file:
+				source_file.write(source)
+		sys.path.insert(0, self.src_directory)
+		try:
+			from cache_auditor import MappedStreets
+			names = [os.path.basename(path) for path in dependency_files(MappedStreets)]
+			self.assertIn('cache_helper.json', names)
+			key = auditor_key(MappedStreets())
+			with open(os.path.join(self.src_directory, 'cache_helper.json'), 'wb') as data_file:
+				data_file.write('{"CL": "CALLEJA"}')
+			data_key = auditor_key(MappedStreets())
+			self.assertNotEqual(data_key, key)
+			with open(os.path.join(self.src_directory, 'cache_helper.py'), 'ab') as source_file:
+				source_file.write('\n# edited\n')
+			self.assertNotEqual(auditor_key(MappedStreets()), data_key)
+		finally:
+			sys.path.remove(self.src_directory)
+			for name in ('cache_helper', 'cache_auditor'):
+				sys.modules.pop(name, None)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The multi-process cleaning writes the same output as clean.clean_file
+
+import gzip
+import unittest
+
+from support import WorkDirectoryTestCase, write_osm
+
+from clean import clean_file, json_list_path
+from clean_parallel import clean_file_parallel, split_file
+
+# Small chunks: the boundaries fall between the elements of every type
+CHUNK_SIZE = 4000
+
+class CleanParallelTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(CleanParallelTest, self).setUp()
+		self.path = write_osm(self.data_path('file.osm'), 2000, ways=300, relations=60)
+
+	def output(self, compress=False):
+		with (gzip.open if compress else open)(json_list_path('cleaned', compress), 'rb') as output_file:
+			return output_file.read()
+
+	def expected_output(self):
+		clean_file(self.path)
+		return self.output()
+
+	def test_chunks(self):
+		chunks = split_file(self.path, CHUNK_SIZE)
+		with open(self.path, 'rb') as osm_file:
+			data = osm_file.read()
+		starts = set(data[start:start + 4] for start, end in chunks)
+		self.assertEqual(starts, set(['<nod', '<way', '<rel']))
+		self.assertEqual([start for start, end in chunks[1:]], [end for start, end in chunks[:-1]])
+		self.assertEqual(data[chunks[-1][1]:], '</osm>\n')
+
+	def test_same_output(self):
+		expected = self.expected_output()
+		for processes in (1, 3):
+			clean_file_parallel(self.path, processes=processes, chunk_size=CHUNK_SIZE)
+			self.assertEqual(self.output(), expected)
+
+	def test_same_compressed_output(self):
+		expected = self.expected_output()
+		clean_file_parallel(self.path, processes=2, chunk_size=CHUNK_SIZE, compress=True)
+		self.assertEqual(self.output(compress=True), expected)
+
+if __name__ == '__main__':
+	unittest.main()
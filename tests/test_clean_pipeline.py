@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The pipelined cleaning writes the same output as clean.clean_file, and a failing stage stops the
+# pipeline and raises its error
+
+import gzip
+import shutil
+import threading
+import unittest
+
+from support import WorkDirectoryTestCase, write_osm
+
+import clean_pipeline
+from clean import clean_file, json_list_path
+from clean_pipeline import BlockFile, Pipeline, clean_file_pipelined
+
+class BlockFileTest(unittest.TestCase):
+
+	def test_read(self):
+		blocks = ['abcdef', 'gh', 'ijklmnop']
+		block_file = BlockFile(blocks)
+		parts = []
+		while True:
+			data = block_file.read(3)
+			if not data:
+				break
+			self.assertLessEqual(len(data), 3)
+			parts.append(data)
+		self.assertEqual(parts, ['abc', 'def', 'gh', 'ijk', 'lmn', 'op'])
+		self.assertEqual([data for data in iter(BlockFile(blocks).read, '')], blocks)
+
+class CleanPipelineTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(CleanPipelineTest, self).setUp()
+		self.path = write_osm(self.data_path('file.osm'), 2000, ways=300, relations=60)
+
+	def output(self):
+		with open(json_list_path('cleaned', False), 'rb') as output_file:
+			return output_file.read()
+
+	# Small blocks and batches, so the blocks end within the elements and every queue fills up
+	def test_same_output(self):
+		clean_file(self.path)
+		expected = self.output()
+		gzip_path = self.path + '.gz'
+		with open(self.path, 'rb') as osm_file:
+			with gzip.open(gzip_path, 'wb') as compressed:
+				shutil.copyfileobj(osm_file, compressed)
+		for path in (self.path, gzip_path):
+			stats = clean_file_pipelined(path, block_size=1000, batch_size=7, queue_size=2)
+			self.assertEqual(self.output(), expected)
+			self.assertEqual(stats['stages']['clean']['items'], -(-2360 // 7))
+
+	def test_failing_stage(self):
+		element_json = clean_pipeline.element_json
+		cleaned = []
+
+		def failing(element):
+			if len(cleaned) == 500:
+				raise ValueError('Invalid element')
+			cleaned.append(element)
+			return element_json(element)
+
+		clean_pipeline.element_json = failing
+		try:
+			with self.assertRaises(ValueError):
+				clean_file_pipelined(self.path, block_size=1000, batch_size=7, queue_size=2)
+		finally:
+			clean_pipeline.element_json = element_json
+		self.assertEqual(len(cleaned), 500)
+
+class PipelineTest(unittest.TestCase):
+
+	# The stages before and after the failing one stop, and the error is raised by run
+	def test_failing_stage(self):
+
+		def count(_):
+			i = 0
+			while True:
+				yield i
+				i += 1
+
+		def fail(items):
+			for item in items:
+				if item == 50:
+					raise ValueError('Stage failed')
+				yield item
+
+		def consume(items):
+			for item in items:
+				yield item
+
+		threads = threading.active_count()
+		pipeline = Pipeline(queue_size=4)
+		for name, function in (('count', count), ('fail', fail), ('consume', consume)):
+			pipeline.add(name, function)
+		with self.assertRaises(ValueError):
+			pipeline.run()
+		self.assertEqual(threading.active_count(), threads)
+		stats = pipeline.stats()
+		self.assertEqual(stats['stages']['fail']['items'], 50)
+		self.assertLessEqual(stats['stages']['consume']['items'], 50)
+		# The first stage stops with the queue after it full: the 51 items taken, the ones in the queue and
+		# the one it was putting
+		self.assertLessEqual(stats['stages']['count']['items'], 51 + 4 + 1)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# clean.element_json writes the same bytes as json.dumps(clean.clean_element(element), sort_keys=True),
+# straight from the record or (colliding keys) through the document
+
+import cPickle as pickle
+import json
+import unittest
+from cStringIO import StringIO
+
+from support import WorkDirectoryTestCase, write_osm
+
+import clean
+from osm_reader import read_elements
+
+# (name, XML of the element, serialized through the document)
+ELEMENTS = [
+	('plain node', '<node id="1" lat="42.1" lon="-3.25" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+				   '<tag k="name" v="Fuente"/><tag k="amenity" v="drinking_water"/></node>', False),
+	('node without tags', '<node id="2" lat="0.0000001" lon="-179.9999999" version="3" timestamp="2015-01-01T00:00:00Z" '
+						  'changeset="5" uid="2" user="ana" visible="true"/>', False),
+	('float coordinates', '<node id="3" lat="43" lon="-3.10000000" version="1" timestamp="t" changeset="5" uid="2" user="ana"/>', False),
+	('unicode values', u'<node id="4" lat="42.5" lon="-3.5" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" '
+					   u'user="Jos\xe9 €"><tag k="name" v="Pe\xf1a “La Ca\xf1ada” \U0001f600"/>'
+					   u'<tag k="name:eu" v="Pe\xf1a"/><tag k="note" v="a &quot;b&quot; \\ c&#9;d&#10;e/&lt;"/></node>', False),
+	('namespaces', '<node id="5" lat="42.5" lon="-3.5" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+				   '<tag k="addr:street" v="Calle Mayor"/><tag k="addr:housenumber" v="3"/><tag k="name:es:old" v="Vieja"/>'
+				   '<tag k="a:b:c:d" v="too deep"/><tag k="zz" v="last"/><tag k="AA" v="capitals"/></node>', False),
+	('way', '<way id="6" version="2" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+			'<nd ref="1"/><nd ref="2"/><nd ref="1"/><tag k="highway" v="residential"/><tag k="name" v="Calle"/></way>', False),
+	('relation with members', '<relation id="7" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+							  '<member type="way" ref="6" role="outer"/><member type="node" ref="1" role="adm\xc3\xadn"/>'
+							  '<member type="relation" ref="8" role=""/><tag k="type" v="multipolygon"/>'
+							  '<tag k="name" v="\xc3\x81rea"/></relation>', False),
+	('relation without members', '<relation id="8" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana"/>', False),
+	('missing metadata', '<way id="9"><nd ref="1"/><tag k="name" v="Sin usuario"/></way>', False),
+	# A key that is also a namespace is moved to its default (addr:default), so it does not collide
+	('key and namespace', '<node id="10" lat="42.5" lon="-3.5" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+						  '<tag k="addr" v="x"/><tag k="addr:street" v="Calle Mayor"/></node>', False),
+	('namespace and key', '<node id="11" lat="42.5" lon="-3.5" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+						  '<tag k="addr:street" v="Calle Mayor"/><tag k="addr" v="x"/></node>', False),
+	('tag named created', '<node id="12" lat="42.5" lon="-3.5" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+						  '<tag k="created" v="2010"/></node>', True),
+	('tag within created', '<way id="13" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+						   '<nd ref="1"/><tag k="created:user" v="other"/></way>', True),
+	('tag named like an attribute', '<node id="14" lat="42.5" lon="-3.5" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" '
+									'uid="2" user="ana"><tag k="pos" v="here"/><tag k="id" v="x"/></node>', True),
+	('repeated key', '<node id="15" lat="42.5" lon="-3.5" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+					 '<tag k="name" v="Uno"/><tag k="name" v="Dos"/></node>', True),
+	('repeated relation type', '<relation id="16" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+							   '<member type="node" ref="1" role=""/><tag k="type" v="route"/><tag k="relation_type" v="x"/></relation>', True),
+	('two-level namespace', '<node id="17" lat="42.5" lon="-3.5" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">'
+							'<tag k="name:es" v="A"/><tag k="name:es:old" v="B"/></node>', False)
+]
+
+def records(xml):
+	if isinstance(xml, unicode):
+		xml = xml.encode('utf-8')
+	return list(read_elements(StringIO('<osm>' + xml + '</osm>')))
+
+def dict_json(element):
+	return json.dumps(clean.clean_element(element), sort_keys=True) + '\n'
+
+class ElementJSONTest(WorkDirectoryTestCase):
+
+	# (element_json line, json.dumps line, serialized through the document) of a record
+	def serialize(self, element):
+		data = pickle.dumps(element, pickle.HIGHEST_PROTOCOL)
+		fallbacks = []
+		element_dict = clean.element_dict
+
+		def counted(element):
+			fallbacks.append(element)
+			return element_dict(element)
+
+		clean.element_dict = counted
+		try:
+			line = clean.element_json(pickle.loads(data))
+		finally:
+			clean.element_dict = element_dict
+		return line, dict_json(pickle.loads(data)), bool(fallbacks)
+
+	def test_elements(self):
+		for name, xml, fallback in ELEMENTS:
+			element, = records(xml)
+			line, expected, through_document = self.serialize(element)
+			self.assertEqual(line, expected, name)
+			self.assertEqual(through_document, fallback, name)
+			json.loads(line)
+
+	def test_documents(self):
+		element, = records(ELEMENTS[3][1])
+		document = json.loads(self.serialize(element)[0])
+		self.assertEqual(document['name'], {'default': u'Pe\xf1a “La Ca\xf1ada” \U0001f600', 'eu': u'Pe\xf1a'})
+		self.assertEqual(document['note'], u'a "b" \\ c\td\ne/<')
+		element, = records(ELEMENTS[2][1])
+		self.assertEqual(self.serialize(element)[0].count('"pos": [-3.1, 43.0]'), 1)
+		element, = records(ELEMENTS[6][1])
+		document = json.loads(self.serialize(element)[0])
+		self.assertEqual(document['relation_type'], 'multipolygon')
+		self.assertEqual([member['ref'] for member in document['members']], [6, 1, 8])
+
+	# Every element of a generated file
+	def test_file(self):
+		path = write_osm(self.data_path('file.osm'), 500, ways=50, relations=5)
+		for element in read_elements(path):
+			line, expected, _ = self.serialize(element)
+			self.assertEqual(line, expected)
+
+if __name__ == '__main__':
+	unittest.main()
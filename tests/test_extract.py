@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Extracts of the osm file: the polygon files, the containment of the points, the tag expressions and
+# the elements written
+
+import unittest
+from cStringIO import StringIO
+
+from support import WorkDirectoryTestCase, write_osm
+
+from extract import PolygonFilter, TagPredicate, extract_file, read_poly, ring_contains
+from osm_reader import read_elements
+
+SQUARE = [(0.0, 0.0), (10.0, 0.0), (10.0, 10.0), (0.0, 10.0)]
+
+# Outer ring (closed, with blank lines), hole and a second outer ring
+POLY = '''area
+
+1
+   0.0E+00   0.0E+00
+   1.0E+01   0.0E+00
+
+   1.0E+01   1.0E+01
+   0.0E+00   1.0E+01
+   0.0E+00   0.0E+00
+END
+!1
+   4.0   4.0
+   6.0   4.0
+   6.0   6.0
+   4.0   6.0
+END
+2
+   20.0   20.0
+   21.0   20.0
+   21.0   21.0
+END
+END
+'''
+
+# Nodes 50 to 150 of write_osm (node i is at lon -3 - i / 10 ** 7, lat 42 + i / 10 ** 7)
+BBOX = (-3.00001505, 42.00000495, -3.00000495, 42.00001505)
+
+def records(xml):
+	return list(read_elements(StringIO('<osm>' + xml + '</osm>')))
+
+def ids(path):
+	return [(elem.type, int(elem.id)) for elem in read_elements(path)]
+
+class PolygonTest(WorkDirectoryTestCase):
+
+	def test_read_poly(self):
+		path = self.data_path('area.poly')
+		with open(path, 'wb') as poly_file:
+			poly_file.write(POLY)
+		outer, holes = read_poly(path)
+		self.assertEqual(outer, [SQUARE + [(0.0, 0.0)], [(20.0, 20.0), (21.0, 20.0), (21.0, 21.0)]])
+		self.assertEqual(holes, [[(4.0, 4.0), (6.0, 4.0), (6.0, 6.0), (4.0, 6.0)]])
+
+		polygon = PolygonFilter(outer, holes)
+		try:
+			self.assertTrue(polygon.contains(1.0, 1.0))
+			self.assertTrue(polygon.contains(9.0, 5.0))
+			self.assertFalse(polygon.contains(5.0, 5.0))
+			self.assertTrue(polygon.contains(20.9, 20.5))
+			self.assertFalse(polygon.contains(20.1, 20.5))
+			self.assertFalse(polygon.contains(15.0, 15.0))
+		finally:
+			polygon.close()
+
+	def test_empty_poly(self):
+		path = self.data_path('empty.poly')
+		with open(path, 'wb') as poly_file:
+			poly_file.write('empty\nEND\n')
+		with self.assertRaises(ValueError):
+			read_poly(path)
+
+	def test_ring_contains(self):
+		self.assertTrue(ring_contains(SQUARE, 5.0, 5.0))
+		self.assertFalse(ring_contains(SQUARE, 11.0, 5.0))
+		self.assertFalse(ring_contains(SQUARE, 5.0, -1.0))
+		# Concave ring (a U): its notch is outside
+		ring = [(0.0, 0.0), (3.0, 0.0), (3.0, 3.0), (2.0, 3.0), (2.0, 1.0), (1.0, 1.0), (1.0, 3.0), (0.0, 3.0)]
+		self.assertTrue(ring_contains(ring, 0.5, 2.5))
+		self.assertTrue(ring_contains(ring, 2.5, 2.5))
+		self.assertFalse(ring_contains(ring, 1.5, 2.0))
+		self.assertTrue(ring_contains(ring, 1.5, 0.5))
+
+class TagPredicateTest(unittest.TestCase):
+
+	def matches(self, expressions, tags):
+		xml = ''.join('<tag k="{}" v="{}"/>'.format(k, v) for k, v in tags)
+		elem, = records('<node id="1" lat="0" lon="0">' + xml + '</node>')
+		return TagPredicate(expressions)(elem)
+
+	def test_key(self):
+		self.assertTrue(self.matches(['shop'], [('name', 'x'), ('shop', 'bakery')]))
+		self.assertFalse(self.matches(['shop'], [('name', 'shop'), ('shop:type', 'x')]))
+
+	def test_values(self):
+		predicate = ['highway=primary|secondary']
+		self.assertTrue(self.matches(predicate, [('highway', 'primary')]))
+		self.assertTrue(self.matches(predicate, [('highway', 'secondary')]))
+		self.assertFalse(self.matches(predicate, [('highway', 'residential')]))
+		self.assertTrue(self.matches(['name=Pe\xc3\xb1a'], [('name', 'Pe\xc3\xb1a')]))
+		self.assertTrue(self.matches(['highway=primary', 'highway=tertiary'], [('highway', 'tertiary')]))
+
+	def test_patterns(self):
+		self.assertTrue(self.matches(['addr:*'], [('addr:street', 'Calle')]))
+		self.assertFalse(self.matches(['addr:*'], [('address', 'Calle'), ('addr', 'x')]))
+		self.assertTrue(self.matches(['name:*=Bilbo|Bilbao'], [('name:eu', 'Bilbo')]))
+		self.assertFalse(self.matches(['name:*=Bilbo'], [('name:eu', 'Bilbao'), ('name', 'Bilbo')]))
+
+class ExtractTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(ExtractTest, self).setUp()
+		self.osm_path = write_osm(self.data_path('file.osm'), 300, ways=100, relations=60)
+
+	def extract(self, name, **options):
+		path = self.data_path(name)
+		extract_file(self.osm_path, path, **options)
+		return path
+
+	def read(self, path):
+		with open(path, 'rb') as extract:
+			return extract.read()
+
+	# A polygon of the corners of the bbox extracts the same elements
+	def test_square_polygon(self):
+		min_lon, min_lat, max_lon, max_lat = BBOX
+		square = [(min_lon, min_lat), (max_lon, min_lat), (max_lon, max_lat), (min_lon, max_lat)]
+		for closed in (True, False):
+			bbox_path = self.extract('bbox.osm', bbox=BBOX, closed=closed)
+			polygon_path = self.extract('polygon.osm', polygon=square, closed=closed)
+			self.assertEqual(self.read(polygon_path), self.read(bbox_path))
+			self.assertIn(('node', 100), ids(bbox_path))
+
+	def test_closed(self):
+		elements = ids(self.extract('open.osm', bbox=BBOX, closed=False))
+		nodes = [i for t, i in elements if t == 'node']
+		ways = [i for t, i in elements if t == 'way']
+		self.assertEqual(nodes, range(50, 151))
+		# The ways using the nodes within the bbox (way i has the nodes i + 1 to i + 4)
+		self.assertEqual(ways, range(46, 101))
+		# The relations of those ways or nodes (relation i has the way i + 1 and the node i)
+		self.assertEqual([i for t, i in elements if t == 'relation'], range(45, 61))
+
+		closed = ids(self.extract('closed.osm', bbox=BBOX))
+		self.assertEqual([i for t, i in closed if t == 'node'], range(47, 151))
+		self.assertEqual([(t, i) for t, i in closed if t != 'node'], [(t, i) for t, i in elements if t != 'node'])
+
+	def test_where(self):
+		elements = ids(self.extract('highways.osm', where=['highway=residential']))
+		self.assertEqual([i for t, i in elements if t == 'way'], range(1, 101))
+		self.assertEqual([i for t, i in elements if t == 'node'], range(2, 105))
+		self.assertFalse(any(t == 'relation' for t, i in elements))
+		elements = ids(self.extract('streets.osm', bbox=BBOX, where=['addr:*'], closed=False))
+		self.assertEqual(elements, [('node', i) for i in range(50, 151)])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Loading of the cleaned JSON Lines document into MongoDB, against the stand-in pymongo of
+# tests/stand_in (a collection on disk shared by the worker processes)
+
+import json
+import os
+import sys
+import unittest
+
+from support import WorkDirectoryTestCase
+
+STAND_IN_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stand_in')
+sys.path.insert(0, STAND_IN_DIRECTORY)
+
+import pymongo
+import load_mongo
+
+DOCUMENTS = 2500
+BATCH_SIZE = 1000
+
+class LoadMongoTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(LoadMongoTest, self).setUp()
+		self.assertEqual(os.path.dirname(pymongo.__file__), os.path.join(STAND_IN_DIRECTORY, 'pymongo'))
+		self.uri = self.data_path('mongo')
+		self.jsonl_path = self.data_path('cleaned.jsonl')
+		with open(self.jsonl_path, 'w') as jsonl_file:
+			for i in xrange(DOCUMENTS):
+				element_type = 'node' if i % 3 else 'way'
+				jsonl_file.write(json.dumps({'type': element_type, 'id': str(i), 'name': u'Calle {}'.format(i)}) + '\n')
+		self.collection = pymongo.MongoClient(self.uri)[load_mongo.database_name][load_mongo.collection_name]
+
+	def load(self, **options):
+		return load_mongo.load_jsonl(self.jsonl_path, uri=self.uri, batch_size=BATCH_SIZE, workers=2, **options)
+
+	def inserts(self):
+		return [int(operation.split()[1]) for operation in self.collection.operations() if operation.startswith('insert_many')]
+
+	def test_batched_inserts(self):
+		self.assertEqual(self.load(), DOCUMENTS)
+		self.assertEqual(sorted(self.inserts()), [500, 1000, 1000])
+		docs = self.collection.documents()
+		self.assertEqual(len(docs), DOCUMENTS)
+		self.assertEqual(docs['way:0']['name'], u'Calle 0')
+		self.assertFalse(os.path.exists(load_mongo.progress_path(self.jsonl_path)))
+
+	# A second load of the same file inserts no document again
+	def test_rerun_without_duplicates(self):
+		self.assertEqual(self.load(), DOCUMENTS)
+		self.assertEqual(self.load(), 0)
+		self.assertEqual(len(self.collection.documents()), DOCUMENTS)
+
+	# A load interrupted by a failed batch resumes after the last batch loaded in order, and the batches
+	# loaded again (the ones read ahead) insert no document twice
+	def test_resume_without_duplicates(self):
+		with open(os.path.join(self.collection.directory, pymongo.FAIL_FILENAME), 'w') as fail_file:
+			fail_file.write('node:1001')
+		with self.assertRaises(pymongo.errors.OperationFailure):
+			self.load(indexes=[])
+		self.assertEqual(load_mongo.read_progress(self.jsonl_path, BATCH_SIZE), 1)
+		self.assertLess(len(self.collection.documents()), DOCUMENTS)
+		calls = len(self.inserts())
+
+		self.load()
+		self.assertEqual(len(self.inserts()) - calls, 2)
+		self.assertEqual(len(self.collection.documents()), DOCUMENTS)
+		self.assertFalse(os.path.exists(load_mongo.progress_path(self.jsonl_path)))
+
+	def test_drop_is_ignored_when_resuming(self):
+		self.assertEqual(self.load(), DOCUMENTS)
+		load_mongo.write_progress(self.jsonl_path, BATCH_SIZE, 3)
+		self.assertEqual(self.load(drop=True), 0)
+		self.assertEqual(len(self.collection.documents()), DOCUMENTS)
+		self.assertEqual(self.load(drop=True), DOCUMENTS)
+		self.assertIn('drop', self.collection.operations())
+
+	# The indexes are built once every document is loaded
+	def test_indexes_after_load(self):
+		self.load()
+		operations = self.collection.operations()
+		indexes = [operation for operation in operations if operation.startswith('create_index')]
+		self.assertEqual(indexes, ['create_index ' + json.dumps(index) for index in load_mongo.default_indexes])
+		last_insert = max(i for i, operation in enumerate(operations) if operation.startswith('insert_many'))
+		self.assertLess(last_insert, operations.index(indexes[0]))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Geometry of the ways from the node store
+
+import unittest
+
+from support import WorkDirectoryTestCase
+
+from node_store import NodeStore, NodeStoreWriter, add_way_geometry
+
+class WayGeometryTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(WayGeometryTest, self).setUp()
+		self.path = self.data_path('nodes.store')
+		with NodeStoreWriter(self.path) as writer:
+			for ref, lon, lat in ((1, 0.0, 0.0), (2, 4.0, 0.0), (3, 4.0, 4.0), (4, 0.0, 4.0)):
+				writer.add(ref, lon, lat)
+
+	def geometry(self, refs):
+		doc = {'type': 'way', 'node_refs': refs}
+		with NodeStore(self.path) as store:
+			add_way_geometry(doc, store, coords=True)
+		return doc
+
+	def test_closed_way(self):
+		doc = self.geometry([1, 2, 3, 4, 1])
+		self.assertEqual(doc['centroid'], [2.0, 2.0])
+		self.assertEqual(doc['bbox'], [0.0, 0.0, 4.0, 4.0])
+		self.assertEqual(len(doc['coords']), 5)
+
+	def test_open_way(self):
+		doc = self.geometry([1, 2, 3])
+		self.assertEqual(doc['centroid'], [8.0 / 3, 4.0 / 3])
+
+	# The closing node missing from the store: the last position is another node, counted once
+	def test_closed_way_missing_closing_node(self):
+		doc = self.geometry([5, 2, 3, 4, 5])
+		self.assertEqual(doc['centroid'], [8.0 / 3, 8.0 / 3])
+		self.assertEqual(doc['bbox'], [0.0, 0.0, 4.0, 4.0])
+
+	def test_no_node_found(self):
+		doc = self.geometry([7, 8])
+		self.assertNotIn('centroid', doc)
+
+if __name__ == '__main__':
+	unittest.main()
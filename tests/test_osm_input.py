@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compressed osm files are read back byte-identical to the plain ones: gzip (of one or more members),
+# bzip2 of one stream and of several ones (decompressed in parallel), and the truncated ones fail
+
+import bz2
+import gzip
+import re
+import unittest
+import zlib
+from cStringIO import StringIO
+
+from support import WorkDirectoryTestCase, write_osm
+
+import osm_input
+from osm_input import decompress_bz2_segment, join_bz2_segments, open_osm
+
+# Small reads, so the files are several chunks and parallel segments
+CHUNK_SIZE = 16 * 1024
+
+class ImmediateResult(object):
+
+	def __init__(self, result):
+		self.result = result
+
+	def get(self):
+		return self.result
+
+class CompressedInputTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(CompressedInputTest, self).setUp()
+		self.chunk_size = osm_input.chunk_size
+		self.stream_start = osm_input.bz2_stream_start
+		osm_input.chunk_size = CHUNK_SIZE
+		with open(write_osm(self.data_path('file.osm'), 3000, ways=300, relations=30), 'rb') as osm_file:
+			self.data = osm_file.read()
+		size = len(self.data) // 6
+		self.pieces = [self.data[i:i + size] for i in xrange(0, len(self.data), size)]
+
+	def tearDown(self):
+		osm_input.chunk_size = self.chunk_size
+		osm_input.bz2_stream_start = self.stream_start
+		super(CompressedInputTest, self).tearDown()
+
+	def write(self, name, data):
+		path = self.data_path(name)
+		with open(path, 'wb') as compressed_file:
+			compressed_file.write(data)
+		return path
+
+	def read(self, path, processes=None, size=10000):
+		parts = []
+		with open_osm(path, processes) as osm_file:
+			while True:
+				data = osm_file.read(size)
+				if not data:
+					break
+				parts.append(data)
+		return ''.join(parts)
+
+	def gzip_member(self, data):
+		compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+		return compressor.compress(data) + compressor.flush()
+
+	def test_gzip(self):
+		path = self.data_path('file.osm.gz')
+		with gzip.open(path, 'wb') as compressed_file:
+			compressed_file.write(self.data)
+		self.assertEqual(osm_input.compression(path), 'gz')
+		self.assertEqual(self.read(path), self.data)
+
+	def test_gzip_members(self):
+		path = self.write('file.osm.gz', ''.join(self.gzip_member(piece) for piece in self.pieces))
+		self.assertEqual(self.read(path), self.data)
+
+	def test_bz2(self):
+		path = self.write('file.osm.bz2', bz2.compress(self.data))
+		self.assertEqual(osm_input.compression(path), 'bz2')
+		for processes in (1, 3):
+			self.assertEqual(self.read(path, processes), self.data)
+
+	def test_bz2_streams(self):
+		streams = [bz2.compress(piece) for piece in self.pieces]
+		path = self.write('file.osm.bz2', ''.join(streams))
+		for processes in (1, 3):
+			self.assertEqual(self.read(path, processes), self.data)
+
+	# A false stream start within the compressed data of a stream (a match of the pattern that is not a
+	# stream header) splits it in two segments, which are joined again
+	def test_bz2_false_stream_start(self):
+		# A first stream shorter than the reads, so the file is decompressed in parallel
+		size = (len(self.data) - 2000) // 5
+		pieces = [self.data[:2000]] + [self.data[i:i + size] for i in xrange(2000, len(self.data), size)]
+		streams = [bz2.compress(piece) for piece in pieces]
+		self.assertLess(len(streams[0]), 1024)
+		compressed = ''.join(streams)
+		stream = streams[2]
+		middle = len(stream) // 2
+		while compressed.count(stream[middle:middle + 8]) > 1:
+			middle += 1
+		false_start = stream[middle:middle + 8]
+		osm_input.bz2_stream_start = re.compile(r'BZh[1-9]1AY&SY|' + re.escape(false_start))
+		# Reads smaller than the streams, so the segments are cut at every match
+		osm_input.chunk_size = 1024
+		start = len(streams[0]) + len(streams[1])
+		cut = 0
+		cuts = []
+		for segment in osm_input.bz2_segments(StringIO(compressed), ''):
+			cut += len(segment)
+			cuts.append(cut)
+		self.assertIn(start + middle, cuts)
+		path = self.write('file.osm.bz2', compressed)
+		decompressed = []
+
+		def recorded(segment):
+			result = decompress_bz2_segment(segment)
+			decompressed.append(result[1])
+			return result
+
+		osm_input.decompress_bz2_segment = recorded
+		try:
+			self.assertEqual(self.read(path, 3), self.data)
+		finally:
+			osm_input.decompress_bz2_segment = decompress_bz2_segment
+		self.assertIn(False, decompressed)
+
+		# A segment ending within a stream is incomplete, one starting within it is invalid
+		first = compressed[:start + middle]
+		second = compressed[start + middle:]
+		self.assertEqual(decompress_bz2_segment(first)[1], False)
+		self.assertEqual(decompress_bz2_segment(second), (None, False))
+		segments = [first, second]
+		joined = join_bz2_segments([(segment, ImmediateResult(decompress_bz2_segment(segment))) for segment in segments])
+		self.assertEqual(''.join(joined), self.data)
+
+	def test_truncated(self):
+		streams = [bz2.compress(piece) for piece in self.pieces]
+		files = [
+			('gz', self.gzip_member(self.data)[:-100], None),
+			('gz', ''.join(self.gzip_member(piece) for piece in self.pieces)[:-20], None),
+			('bz2', bz2.compress(self.data)[:-100], 1),
+			('bz2', bz2.compress(self.data)[:-100], 3),
+			('bz2', ''.join(streams)[:-100], 1),
+			('bz2', ''.join(streams)[:-100], 3)
+		]
+		for i, (kind, data, processes) in enumerate(files):
+			path = self.write('truncated{}.osm.{}'.format(i, kind), data)
+			with self.assertRaises(IOError):
+				self.read(path, processes)
+
+if __name__ == '__main__':
+	unittest.main()
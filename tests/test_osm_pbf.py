@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# PBF files built from XML ones (osm_pbf.xml_to_pbf) are read back as the same records, with and
+# without the user metadata
+
+import json
+import unittest
+
+from support import WorkDirectoryTestCase, write_osm
+
+import osm_pbf
+from audit_engine import run_auditors
+from audit_keys_basic import CountElements, UniqueUsers
+from clean import clean_element, element_json
+from osm_reader import read_elements
+
+OSM = u'''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="42.9876543" lon="-3.1234567" version="2" timestamp="2014-05-06T07:08:09Z" changeset="12" uid="3" user="Jos\xe9"/>
+ <node id="-5" lat="-0.0000001" lon="179.9999999" version="1" timestamp="2015-01-01T00:00:00Z" changeset="7" uid="4" user="ana">
+  <tag k="name" v="Fuente de la \xd1"/>
+  <tag k="amenity" v="drinking_water"/>
+ </node>
+ <way id="10" version="3" timestamp="2013-01-01T10:00:00Z" changeset="8" uid="3" user="Jos\xe9" visible="true">
+  <nd ref="1"/>
+  <nd ref="-5"/>
+  <nd ref="1"/>
+  <tag k="highway" v="footway"/>
+ </way>
+ <relation id="20" version="1" timestamp="2016-02-03T04:05:06Z" changeset="9" uid="4" user="ana">
+  <member type="way" ref="10" role="outer"/>
+  <member type="node" ref="1" role=""/>
+  <tag k="type" v="route"/>
+ </relation>
+</osm>
+'''
+
+def records(path):
+	return [(elem.type, elem.attrs, elem.tags, list(elem.refs), elem.members) for elem in read_elements(path)]
+
+class PBFRoundTripTest(WorkDirectoryTestCase):
+
+	def convert(self, xml_path, block_size=8000):
+		pbf_path = xml_path + '.pbf'
+		osm_pbf.xml_to_pbf(xml_path, pbf_path, block_size)
+		with open(pbf_path, 'rb') as pbf_file:
+			self.assertTrue(osm_pbf.is_pbf(pbf_file))
+		return pbf_path
+
+	def test_records(self):
+		path = self.data_path('file.osm')
+		with open(path, 'wb') as osm_file:
+			osm_file.write(OSM.encode('utf-8'))
+		pbf_path = self.convert(path)
+		self.assertEqual(records(pbf_path), records(path))
+		self.assertEqual([element_json(elem) for elem in read_elements(pbf_path)],
+						 [element_json(elem) for elem in read_elements(path)])
+
+	# Several blocks of every type, decoded by a pool of processes
+	def test_blocks(self):
+		path = write_osm(self.data_path('file.osm'), 3000, ways=300, relations=30)
+		pbf_path = self.convert(path, block_size=500)
+		self.assertEqual(records(pbf_path), records(path))
+		with open(pbf_path, 'rb') as pbf_file:
+			self.assertEqual(records(path), [(elem.type, elem.attrs, elem.tags, list(elem.refs), elem.members)
+											 for elem in osm_pbf.iter_pbf(pbf_file, processes=2)])
+
+	# The extracts without user data: the elements have no user, uid or changeset
+	def test_without_user_metadata(self):
+		path = write_osm(self.data_path('file.osm'), 200, ways=20, relations=2, metadata=False)
+		pbf_path = self.convert(path)
+		self.assertEqual(records(pbf_path), records(path))
+		for elem in read_elements(pbf_path):
+			self.assertEqual(sorted(attr for attr in elem.attrs if attr not in ('lat', 'lon')), ['id', 'timestamp', 'version'])
+			document = clean_element(elem)
+			self.assertEqual(document['created'], {'user': None, 'uid': None, 'changeset': None, 'version': '1',
+												   'timestamp': '2015-01-01T00:00:00Z'})
+			self.assertEqual(element_json(elem), json.dumps(document, sort_keys=True) + '\n')
+		reports = run_auditors(pbf_path, [CountElements(), UniqueUsers()], cache=False)
+		self.assertEqual(reports['unique_users'], set())
+		self.assertEqual(reports['count_elements'], run_auditors(path, [CountElements()], cache=False)['count_elements'])
+
+	# Elements without any metadata
+	def test_without_metadata(self):
+		path = self.data_path('file.osm')
+		with open(path, 'wb') as osm_file:
+			osm_file.write('<osm version="0.6">\n <node id="1" lat="1.5" lon="2.5"/>\n'
+						   ' <way id="2">\n  <nd ref="1"/>\n </way>\n</osm>\n')
+		pbf_path = self.convert(path)
+		self.assertEqual(records(pbf_path), [('node', {'id': '1', 'lat': '1.5000000', 'lon': '2.5000000'}, [], [], []),
+											 ('way', {'id': '2'}, [], [1], [])])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The streaming readers keep the memory bounded: the parsed elements are freed once consumed, so the
+# peak memory does not grow with the size of the file
+
+import os
+import subprocess
+import sys
+import textwrap
+import unittest
+
+from support import SRC_DIRECTORY, WorkDirectoryTestCase, write_osm
+
+import osm_reader
+
+# Nodes of the big file (about 40 MB, several hundred MB as a whole tree)
+BIG_NODES = 150000
+
+# Growth of the peak RSS allowed while reading the big file
+MAX_GROWTH_MB = 25
+
+# Top-level elements the root of get_element can hold (iterparse parses ahead one block of the file)
+MAX_RETAINED = 1000
+
+class StreamingMemoryTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(StreamingMemoryTest, self).setUp()
+		self.path = write_osm(self.data_path('big.osm'), BIG_NODES, ways=BIG_NODES // 10, relations=BIG_NODES // 100)
+
+	# The root of get_element only holds the elements of the block being parsed, whatever the size of the file
+	def test_get_element_clears_the_root(self):
+		roots = []
+		iterparse = osm_reader.ET.iterparse
+
+		def recording_iterparse(source, events=None):
+			for event, elem in iterparse(source, events):
+				if not roots:
+					roots.append(elem)
+				yield event, elem
+
+		osm_reader.ET.iterparse = recording_iterparse
+		try:
+			retained = 0
+			elements = 0
+			for elem in osm_reader.get_element(self.path):
+				retained = max(retained, len(roots[0]))
+				elements += 1
+				self.assertIn(elem.tag, ('node', 'way', 'relation'))
+		finally:
+			osm_reader.ET.iterparse = iterparse
+		self.assertEqual(elements, BIG_NODES + BIG_NODES // 10 + BIG_NODES // 100)
+		self.assertLessEqual(retained, MAX_RETAINED)
+		self.assertEqual(len(roots[0]), 0)
+
+	# The peak RSS of a fresh process reading the whole file with every backend grows by a fixed bound
+	def test_peak_memory_is_bounded(self):
+		script = textwrap.dedent('''
+			import resource, sys
+			sys.path.insert(0, {src!r})
+			import osm_reader
+			def peak_mb():
+				return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+			before = peak_mb()
+			for backend in ('etree', 'expat'):
+				n = sum(1 for _ in osm_reader.read_elements({path!r}, backend=backend))
+			n += sum(1 for _ in osm_reader.get_element({path!r}))
+			print peak_mb() - before
+		''').format(src=SRC_DIRECTORY, path=self.path)
+		growth = float(subprocess.check_output([sys.executable, '-c', script]))
+		self.assertGreater(os.path.getsize(self.path), 1024 * 1024 * MAX_GROWTH_MB)
+		self.assertLess(growth, MAX_GROWTH_MB)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The scan of the bytes gives the same counts as the auditors (verify), also with values holding
+# apostrophes, quotes, entities and text like attributes, in files of double and single quotes
+
+import gzip
+import shutil
+import unittest
+
+from support import WorkDirectoryTestCase, write_osm
+
+import osm_scan
+from osm_scan import scan, verify
+
+# Elements of a file written with double quotes
+DOUBLE_QUOTED = '''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="tests">
+ <node id="1" lat="42.1" lon="-3.2" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">
+  <tag k="note" v="set k='x' and user='bob'"/>
+  <tag k="name" v="O'Donnell &quot;the &lt;1st&gt;&quot; &amp; k=&quot;y&quot;"/>
+  <tag k="description" v=" user=&quot;z&quot; k=&quot;w&quot; > "/>
+ </node>
+ <node id="2" lat="42.2" lon="-3.3" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="3" user="D&apos;Arcy &amp; co">
+  <tag k="addr:street" v="Calle d'Ali &#233;"/>
+ </node>
+ <way id="3" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="4" user="k=&quot;q&quot;">
+  <nd ref="1"/>
+  <nd ref="2"/>
+  <tag k="name:eu" v="user=&quot;phantom&quot;"/>
+ </way>
+ <relation id="4" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">
+  <member type="way" ref="3" role="outer"/>
+  <tag k="type" v="multipolygon"/>
+ </relation>
+</osm>
+'''
+
+# Elements of a file written with single quotes
+SINGLE_QUOTED = '''<?xml version='1.0' encoding='UTF-8'?>
+<osm version='0.6' generator='tests'>
+ <node id='1' lat='42.1' lon='-3.2' version='1' timestamp='2015-01-01T00:00:00Z' changeset='5' uid='2' user='ana'>
+  <tag k='note' v='set k="x" and user="bob"'/>
+  <tag k='name' v='O&apos;Donnell "the &lt;1st&gt;" &amp; k=&apos;y&apos;'/>
+ </node>
+ <node id='2' lat='42.2' lon='-3.3' version='1' timestamp='2015-01-01T00:00:00Z' changeset='5' uid='3' user='Say "hi"'>
+  <tag k='addr:street' v='user="z"'/>
+ </node>
+ <way id='3' version='1' timestamp='2015-01-01T00:00:00Z' changeset='5' uid='4' user='O&apos;Neil'>
+  <nd ref='1'/>
+  <tag k='it&apos;s' v='&#34;quoted&#34;'/>
+ </way>
+</osm>
+'''
+
+# Tag elements with their key after the value or spaces around '=' (the scan does not take the fast pattern)
+OTHER_ORDER = '''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="tests">
+ <node id="1" lat="42.1" lon="-3.2" version="1" timestamp="2015-01-01T00:00:00Z" changeset="5" uid="2" user="ana">
+  <tag v="k='x' user='bob'" k="note"/>
+  <tag k = "name" v="a > b"/>
+ </node>
+ <node user='eve' id="2" lat="42.2" lon="-3.3" version="1" timestamp="2015-01-01T00:00:00Z">
+  <tag k="name" v='user="z"'/>
+ </node>
+</osm>
+'''
+
+class ScanTest(WorkDirectoryTestCase):
+
+	def write(self, name, data):
+		path = self.data_path(name)
+		with open(path, 'wb') as osm_file:
+			osm_file.write(data)
+		return path
+
+	def check(self, path):
+		for processes in (1, 2):
+			self.assertEqual(verify(path, processes), [])
+
+	def test_double_quotes(self):
+		path = self.write('double.osm', DOUBLE_QUOTED)
+		self.check(path)
+		result = scan(path, 1)
+		self.assertEqual(sorted(result['keys']), ['addr:street', 'description', 'name', 'name:eu', 'note', 'type'])
+		self.assertEqual(sorted(result['users']), ['D\'Arcy & co', 'ana', 'k="q"'])
+
+	def test_single_quotes(self):
+		path = self.write('single.osm', SINGLE_QUOTED)
+		self.check(path)
+		result = scan(path, 1)
+		self.assertEqual(sorted(result['keys']), ['addr:street', 'it\'s', 'name', 'note'])
+		self.assertEqual(sorted(result['users']), ['O\'Neil', 'Say "hi"', 'ana'])
+
+	def test_other_order(self):
+		path = self.write('other.osm', OTHER_ORDER)
+		self.check(path)
+		self.assertEqual(scan(path, 1)['keys'], {'note': 1, 'name': 2})
+
+	# Small chunks, so the chunks of the processes end within the elements
+	def test_chunks(self):
+		path = write_osm(self.data_path('file.osm'), 2000, ways=200, relations=20)
+		chunk_size = osm_scan.chunk_size
+		osm_scan.chunk_size = 10000
+		try:
+			self.check(path)
+		finally:
+			osm_scan.chunk_size = chunk_size
+
+	def test_compressed(self):
+		path = self.write('double.osm', DOUBLE_QUOTED)
+		with open(path, 'rb') as osm_file:
+			with gzip.open(path + '.gz', 'wb') as compressed:
+				shutil.copyfileobj(osm_file, compressed)
+		self.assertEqual(verify(path + '.gz'), [])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# A clean_file run killed (SIGKILL) after a checkpoint and resumed writes the same output as an
+# uninterrupted run
+
+import bz2
+import gzip
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import unittest
+
+from support import SRC_DIRECTORY, WorkDirectoryTestCase, write_osm
+
+import clean
+
+CHECKPOINT_EVERY = 2000
+
+# Run clean_file in another process: filename compress checkpoint_every resume
+CLEAN_SCRIPT = '''
+import sys
+sys.path.insert(0, {src!r})
+import clean
+filename, compress, checkpoint_every, resume = sys.argv[1:]
+clean.clean_file(filename, compress=compress == '1', checkpoint_every=int(checkpoint_every), resume=resume == '1')
+'''.format(src=SRC_DIRECTORY)
+
+class ResumeTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(ResumeTest, self).setUp()
+		self.osm_path = write_osm(self.data_path('file.osm'), 30000, ways=3000, relations=300)
+
+	def clean_process(self, filename, compress, resume):
+		return subprocess.Popen([sys.executable, '-c', CLEAN_SCRIPT, filename, '1' if compress else '0',
+								 str(CHECKPOINT_EVERY), '1' if resume else '0'])
+
+	def clean(self, filename, compress=False, resume=False):
+		self.assertEqual(self.clean_process(filename, compress, resume).wait(), 0)
+
+	# Start a run and kill it once a checkpoint after the given number of elements is written, returns the checkpoint
+	def clean_killed(self, filename, compress=False, resume=False, after=0):
+		path = clean.json_list_path('cleaned', compress)
+		process = self.clean_process(filename, compress, resume)
+		try:
+			while process.poll() is None:
+				checkpoint = clean.read_checkpoint(path, filename, compress)
+				if checkpoint is not None and checkpoint['elements'] > after:
+					process.send_signal(signal.SIGKILL)
+					break
+				time.sleep(0.005)
+		finally:
+			process.wait()
+		self.assertEqual(process.returncode, -signal.SIGKILL, 'The run finished before it could be killed')
+		self.assertFalse(os.path.exists(path))
+		checkpoint = clean.read_checkpoint(path, filename, compress)
+		self.assertIsNotNone(checkpoint)
+		return checkpoint
+
+	def output(self, compress):
+		path = clean.json_list_path('cleaned', compress)
+		if compress:
+			with gzip.open(path, 'rb') as output_file:
+				return output_file.read()
+		with open(path, 'rb') as output_file:
+			return output_file.read()
+
+	# Output of an uninterrupted run (removed afterwards)
+	def expected_output(self, filename, compress=False):
+		self.clean(filename, compress)
+		output = self.output(compress)
+		os.remove(clean.json_list_path('cleaned', compress))
+		self.assertEqual(len(output.splitlines()), 33300)
+		return output
+
+	def check_resume(self, filename, compress=False, kills=1):
+		expected = self.expected_output(filename, compress)
+		checkpoint = self.clean_killed(filename, compress)
+		for _ in xrange(kills - 1):
+			checkpoint = self.clean_killed(filename, compress, resume=True, after=checkpoint['elements'])
+		self.assertLess(checkpoint['elements'], 33300)
+		self.clean(filename, compress, resume=True)
+		self.assertEqual(self.output(compress), expected)
+		self.assertFalse(os.path.exists(clean.checkpoint_path(clean.json_list_path('cleaned', compress))))
+		for line in expected.splitlines()[::1000]:
+			json.loads(line)
+
+	def test_plain(self):
+		self.check_resume(self.osm_path, kills=2)
+
+	def test_gzip_input(self):
+		path = self.osm_path + '.gz'
+		with open(self.osm_path, 'rb') as osm_file:
+			with gzip.open(path, 'wb') as compressed:
+				shutil.copyfileobj(osm_file, compressed)
+		self.check_resume(path)
+
+	def test_bz2_input(self):
+		path = self.osm_path + '.bz2'
+		with open(self.osm_path, 'rb') as osm_file:
+			with open(path, 'wb') as compressed:
+				compressed.write(bz2.compress(osm_file.read()))
+		self.check_resume(path)
+
+	# The gzip output gets a new member at every checkpoint: its content is the same
+	def test_gzip_output(self):
+		self.check_resume(self.osm_path, compress=True)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Samples of the osm file
+
+import unittest
+
+from support import WorkDirectoryTestCase, write_osm
+
+from osm_reader import read_elements
+from sample import RatioSelector, sample_file
+
+class Element(object):
+
+	def __init__(self, type):
+		self.type = type
+
+class RatioSampleTest(WorkDirectoryTestCase):
+
+	def kept(self, ratio, elements=1000, stratified=False, types=('node',)):
+		selector = RatioSelector(ratio, stratified)
+		return [n for n in xrange(elements) if selector.offer(Element(types[n % len(types)]))]
+
+	# A ratio of 0.1 keeps every 10th element from the first one, as the original sample.py
+	def test_same_elements_as_every_10th(self):
+		path = write_osm(self.data_path('file.osm'), 500, ways=60, relations=7)
+		sample_path = self.data_path('sample.osm')
+		sample_file(path, sample_path, ratio=0.1)
+		expected = [(elem.type, elem.id) for i, elem in enumerate(read_elements(path)) if i % 10 == 0]
+		self.assertEqual([(elem.type, elem.id) for elem in read_elements(sample_path)], expected)
+
+	def test_spacing(self):
+		self.assertEqual(self.kept(0.1)[:4], [0, 10, 20, 30])
+		self.assertEqual(self.kept(0.1), range(0, 1000, 10))
+		self.assertEqual(self.kept(0.25)[:4], [0, 4, 8, 12])
+		self.assertEqual(len(self.kept(0.3)), 300)
+		self.assertEqual(self.kept(1), range(1000))
+
+	def test_stratified(self):
+		kept = self.kept(0.5, 12, stratified=True, types=('node', 'node', 'way'))
+		self.assertEqual(kept, [0, 2, 3, 6, 8, 9])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Example values of the sketches: distinct values, as the sets of the exact audits
+
+import cPickle as pickle
+import os
+import unittest
+
+import support
+
+from audit_cache import auditor_key, dependency_files, source_hashes
+from audit_keys_basic import UniqueUsers
+from sketch import DistinctSample, ValueSketch, merge
+
+class DistinctSampleTest(unittest.TestCase):
+
+	def test_repeated_values(self):
+		sample = DistinctSample(5)
+		for i in xrange(1000):
+			sample.add(str(i % 3))
+		self.assertEqual(sorted(sample.values), ['0', '1', '2'])
+		self.assertEqual(sample.seen, 1000)
+
+	def test_distinct_values(self):
+		sample = DistinctSample(20)
+		for i in xrange(5000):
+			sample.add(str(i % 400))
+		self.assertEqual(len(sample.values), 20)
+		self.assertEqual(len(set(sample.values)), 20)
+		self.assertTrue(set(sample.values) <= set(str(i) for i in xrange(400)))
+
+	# The sample of a union is the merge of the samples of its parts
+	def test_merge(self):
+		first, second, union = DistinctSample(10), DistinctSample(10), DistinctSample(10)
+		for i in xrange(500):
+			first.add(str(i))
+			union.add(str(i))
+		for i in xrange(300, 900):
+			second.add(str(i))
+			union.add(str(i))
+		merged = first.merge(second)
+		self.assertEqual(sorted(merged.values), sorted(union.values))
+		self.assertEqual(merged.seen, 1100)
+		with self.assertRaises(ValueError):
+			first.merge(DistinctSample(10, seed=1))
+
+	def test_seed(self):
+		samples = []
+		for seed in (None, 1, 2):
+			sample = DistinctSample(10, seed)
+			for i in xrange(1000):
+				sample.add(unicode(i))
+			samples.append(sorted(sample.values))
+		self.assertEqual(len(set(map(tuple, samples))), 3)
+
+	def test_value_sketch(self):
+		sketches = [ValueSketch(), ValueSketch()]
+		for i in xrange(200):
+			sketches[i % 2].add(u'Calle {}'.format(i % 8))
+		merged = merge({'street': sketches[0]}, {'street': sketches[1]})['street']
+		examples = pickle.loads(pickle.dumps(merged, pickle.HIGHEST_PROTOCOL)).summary()['examples']
+		self.assertEqual(examples, sorted(u'Calle {}'.format(i) for i in xrange(8)))
+
+	# The reports cached with other sketches (like the former reservoir of the examples) are not used: the
+	# cache key of the auditors in sketch mode covers the source of this module
+	def test_cache_key(self):
+		path = [path for path in dependency_files(UniqueUsers) if os.path.basename(path) == 'sketch.py'][0]
+		key = auditor_key(UniqueUsers(sketch=True))
+		size, mtime, content = source_hashes[path]
+		source_hashes[path] = (size, mtime, 'other source')
+		try:
+			self.assertNotEqual(auditor_key(UniqueUsers(sketch=True)), key)
+		finally:
+			source_hashes[path] = (size, mtime, content)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Lookups of the tag index and the elements read back from their offsets
+
+import cPickle as pickle
+import unittest
+
+from support import WorkDirectoryTestCase
+
+from osm_reader import read_elements
+from tag_index import TagIndex, element_types, open_tag_index, read_raw_element
+
+OSM = '''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="42.1" lon="-3.1" user="a>b/"/>
+ <node id="2" lat="42.2" lon="-3.2" user='c">/d'>
+  <tag k="name" v="x > y"/>
+  <tag k="FIXME" v="a/>b"/>
+  <tag k="FIXME" v="check"/>
+ </node>
+ <way id="3" user="e">
+  <nd ref="1"/>
+  <nd ref="2"/>
+  <tag k="FIXME" v="check"/>
+  <tag k="note" v="&lt;/way&gt; >"/>
+ </way>
+ <node id="4" lat="42.4" lon="-3.4"/>
+ <node id="5" lat="42.5" lon="-3.5" user="x/>y">
+  <tag k="FIXME" v="check"/>
+ </node>
+</osm>
+'''
+
+class TagIndexTest(WorkDirectoryTestCase):
+
+	def setUp(self):
+		super(TagIndexTest, self).setUp()
+		self.path = self.data_path('file.osm')
+		with open(self.path, 'wb') as osm_file:
+			osm_file.write(OSM)
+		self.index = open_tag_index(self.path)
+
+	# Every element read back from its offset is the one of the file, with '>' within its attribute values
+	def test_fetch(self):
+		expected = [elem.to_xml() for elem in read_elements(self.path)]
+		with open(self.path, 'rb') as osm_file:
+			fetched = [self.index.fetch(element, osm_file).to_xml() for element in xrange(len(self.index.ids))]
+		self.assertEqual(fetched, expected)
+
+	# The element is the same whatever the reads the start tag is split in
+	def test_read_raw_element(self):
+		ends = ['/>', '</node>', '</way>', '/>', '</node>']
+		with open(self.path, 'rb') as osm_file:
+			for element, offset in enumerate(self.index.offsets):
+				element_type = element_types[self.index.types[element]]
+				raw = read_raw_element(osm_file, offset, element_type)
+				self.assertEqual(raw, OSM[offset:OSM.index(ends[element], offset) + len(ends[element])])
+				for chunk_size in (1, 5, 7):
+					self.assertEqual(read_raw_element(osm_file, offset, element_type, chunk_size), raw)
+
+	def test_lookups(self):
+		index = self.index
+		self.assertEqual(index.values('FIXME'), set(['a/>b', 'check']))
+		self.assertEqual(index.values('FIXME', types=('way',)), set(['check']))
+		self.assertEqual(index.elements('FIXME'), [1, 2, 4])
+		self.assertEqual(index.items('FIXME'), [(1, 'a/>b'), (1, 'check'), (2, 'check'), (4, 'check')])
+		self.assertEqual(index.items('FIXME', 'check', types=('node',)), [(1, 'check'), (4, 'check')])
+		self.assertEqual(sorted(index.element_values(1, 'FIXME')), ['a/>b', 'check'])
+		self.assertEqual(index.element_values(0, 'FIXME'), [])
+		self.assertEqual(index.element_values(2, 'missing'), [])
+
+	# The values by element are not saved with the index
+	def test_saved_index(self):
+		self.index.element_values(1, 'FIXME')
+		loaded = pickle.loads(pickle.dumps(self.index, pickle.HIGHEST_PROTOCOL))
+		self.assertEqual(loaded.by_element, {})
+		self.assertEqual(loaded.tags, self.index.tags)
+		self.assertEqual(loaded.element_values(2, 'FIXME'), ['check'])
+		self.assertTrue(isinstance(open_tag_index(self.path), TagIndex))
+
+if __name__ == '__main__':
+	unittest.main()